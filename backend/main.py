@@ -1,30 +1,86 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import StreamingResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import shutil
 import os
 import json
+import re
 import datetime
+import threading
 from typing import List
+from contextlib import asynccontextmanager
 
 from modules.projects_manager import ProjectsManager
 from modules.ftp_manager import FTPManager
-from modules.image_analyzer import ImageAnalyzer
+from modules.ftp_cache import FTPCache
+from modules.path_templates import compile_template
+from modules.remote_index import RemoteIndex, RemoteIndexer
+from modules.image_cache import ImageCache, THUMB_SIZE
+from modules.verdict_cache import VerdictCache
+from modules.classifiers import PROMPT_VERSION
+from modules.model_registry import ModelRegistry
+from modules.settings_store import AppSettings, SettingsStore
+from modules.pipeline import FolderPipeline
+from modules.job_manager import JobManager
+
+@asynccontextmanager
+async def lifespan(app):
+    # Startup side effects live here, not at module level: the quality gate's
+    # spawned workers re-import this module and must not run them again
+    cleanup_temp_root()
+    verdict_cache.purge_stale(PROMPT_VERSION)
+    # In the background, the server does not wait for the Gemini API
+    threading.Thread(target=warm_up_classifier, daemon=True, name="model-warm-up").start()
+    remote_indexer.start()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
-
-# --- STARTUP CLEANUP ---
-# Clean up all temporary files from previous sessions to prevent clutter
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 temp_root = os.path.join(base_dir, "temp_raw_download")
-if os.path.exists(temp_root):
+
+# --- STARTUP CLEANUP ---
+def cleanup_temp_root():
+    # Clean up all temporary files from previous sessions to prevent clutter
+    if os.path.exists(temp_root):
+        try:
+            shutil.rmtree(temp_root)
+            os.makedirs(temp_root)
+        except Exception as e:
+            print(f"Startup cleanup error: {e}")
+
+# Persistent FTP download cache (survives restarts, unlike temp_raw_download)
+ftp_cache = FTPCache(os.path.join(base_dir, "ftp_cache"))
+# Gate verdicts, AI proxies and thumbnails by image content hash
+image_cache = ImageCache(os.path.join(base_dir, "image_cache"))
+# AI decisions by content hash, verdicts of older prompts are dropped on start
+verdict_cache = VerdictCache(os.path.join(base_dir, "verdicts.db"))
+# secrets.json, loaded once and re-read only when the file changes
+settings_store = SettingsStore("secrets.json")
+# Gemini model choice (kept on disk for a day) and warm clients shared by all jobs
+model_registry = ModelRegistry(os.path.join(base_dir, "model_cache.json"))
+
+def warm_up_classifier():
     try:
-        shutil.rmtree(temp_root)
-        os.makedirs(temp_root)
+        settings = settings_store.get()
+        if settings.gemini_key and settings.classifier_mode != "local":
+            model_registry.warm_up(settings.gemini_key, {"rpm": settings.ai_rpm, "tpm": settings.ai_tpm})
     except Exception as e:
-        print(f"Startup cleanup error: {e}")
+        print(f"Model warm-up error: {e}")
+
+# Files of the projects' remote folders, crawled in the background (only changed folders are relisted)
+remote_index = RemoteIndex(os.path.join(base_dir, "remote_index.db"))
+
+def connect_indexer_ftp():
+    settings = settings_store.get()
+    if not settings.ftp_pass:
+        return None
+    ftp = FTPManager(settings.ftp_host, settings.ftp_user, settings.ftp_pass, cache=ftp_cache, index=remote_index)
+    return ftp if ftp.connect() else None
+
+remote_indexer = RemoteIndexer(remote_index, connect_indexer_ftp, ProjectsManager.load_projects)
 
 app.add_middleware(
     CORSMiddleware,
@@ -67,16 +123,6 @@ class ExecutionRequest(BaseModel):
     date_from: str # YYYY-MM-DD
     date_to: str   # YYYY-MM-DD
 
-class Settings(BaseModel):
-    ftp_host: str
-    ftp_user: str
-    ftp_pass: str
-    gemini_key: str
-    aws_access_key: str = ""
-    aws_secret_key: str = ""
-    aws_bucket_name: str = ""
-    aws_region: str = ""
-
 # --- ENDPOINTS ---
 
 @app.get("/projects")
@@ -106,6 +152,12 @@ def save_project(project: Project):
                  clean_paths.append(f"/{{yyyy}}/{c}/{{yyyy-MM}}/{s}")
                  clean_paths.append(f"/{{yyyy}}/{{quarter}}/{c}/{{yyyy-MM}}/{s}")
         
+        try:
+            # Compiled once here, runs reuse the compiled templates
+            for path in clean_paths: compile_template(path)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
         if clean_paths:
             cleaned_structure.append({"id": f.id, "name": f.name, "paths": clean_paths})
             raw_structure.append({"id": f.id, "name": f.name, "paths": raw_paths})
@@ -124,6 +176,7 @@ def save_project(project: Project):
         "email_template": project.email_template
     }
     ProjectsManager.save_project(proj_dict)
+    remote_indexer.wake()  # Index the new folders before the first run
     return {"status": "ok", "project": proj_dict}
 
 @app.delete("/projects/{id}")
@@ -131,97 +184,77 @@ def delete_project(id: str):
     ProjectsManager.delete_project(id)
     return {"status": "deleted"}
 
-@app.get("/settings")
-def get_settings():
-    if os.path.exists("secrets.json"):
-        try:
-            with open("secrets.json", "r") as f:
-                data = json.load(f)
-                return {
-                    "ftp_host": data.get("ftp_host", "webas67993.tld.pl"),
-                    "ftp_user": data.get("ftp_user", "jjaczewski"),
-                    "ftp_pass": data.get("ftp_pass", ""),
-                    "gemini_key": data.get("gemini_key", ""),
-                    "aws_access_key": data.get("aws_access_key", ""),
-                    "aws_secret_key": data.get("aws_secret_key", ""),
-                    "aws_bucket_name": data.get("aws_bucket_name", ""),
-                    "aws_region": data.get("aws_region", "")
-                }
-        except:
-            pass
+@app.get("/projects/{id}/file_counts")
+def project_file_counts(id: str, date_from: str, date_to: str):
+    """Files per folder in a date range, from the remote index (no FTP round-trip)"""
+    proj = ProjectsManager.get_project(id)
+    if not proj:
+        raise HTTPException(status_code=404, detail="Project not found")
+    try:
+        dt_from = datetime.datetime.combine(datetime.date.fromisoformat(date_from), datetime.time.min)
+        dt_to = datetime.datetime.combine(datetime.date.fromisoformat(date_to), datetime.time.max)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date")
     return {
-        "ftp_host": "webas67993.tld.pl", 
-        "ftp_user": "jjaczewski", 
-        "ftp_pass": "", 
-        "gemini_key": "",
-        "aws_access_key": "",
-        "aws_secret_key": "",
-        "aws_bucket_name": "",
-        "aws_region": ""
+        "folders": remote_index.folder_counts(proj.get('structure', []), dt_from, dt_to),
+        "last_crawl": remote_indexer.last_run
     }
 
-@app.post("/settings")
-def save_settings(settings: Settings):
-    data = {
-        "ftp_host": settings.ftp_host.strip() if settings.ftp_host else "",
-        "ftp_user": settings.ftp_user.strip() if settings.ftp_user else "",
-        "ftp_pass": settings.ftp_pass.strip() if settings.ftp_pass else "",
-        "gemini_key": settings.gemini_key.strip() if settings.gemini_key else "",
-        "aws_access_key": settings.aws_access_key.strip() if settings.aws_access_key else "",
-        "aws_secret_key": settings.aws_secret_key.strip() if settings.aws_secret_key else "",
-        "aws_bucket_name": settings.aws_bucket_name.strip() if settings.aws_bucket_name else "",
-        "aws_region": settings.aws_region.strip() if settings.aws_region else ""
-    }
+@app.post("/index/refresh")
+def refresh_index():
+    remote_indexer.wake()
+    return {"status": "refreshing"}
 
+@app.get("/settings")
+def get_settings():
+    return dict(settings_store.get())
 
-    with open("secrets.json", "w") as f:
-        json.dump(data, f)
+@app.post("/settings")
+def save_settings(settings: AppSettings):
+    # Fields missing from the request keep their stored values
+    settings_store.update(settings.model_dump(exclude_unset=True))
     return {"status": "saved"}
 
-# --- EXECUTION STREAMS ---
-async def execution_generator(project_id: str, date_from: str, date_to: str):
-    yield f"data: {json.dumps({'log': 'Rozpoczynanie zadania...'})}\n\n"
+# --- EXECUTION (BACKGROUND JOBS) ---
+def run_job(project_id: str, date_from: str, date_to: str, cancel_event):
+    """Whole job as a stream of event dicts. Runs in a JobManager worker thread."""
+    yield {'log': 'Rozpoczynanie zadania...'}
     
     try:
         # Load project
-        projects = ProjectsManager.load_projects()
-        proj = next((p for p in projects if p['id'] == project_id), None)
+        proj = ProjectsManager.get_project(project_id)
         if not proj:
-            yield f"data: {json.dumps({'error': 'Projekt nie istnieje'})}\n\n"
+            yield {'error': 'Projekt nie istnieje'}
             return
 
-        # Load secrets
-        secrets = {}
-        if os.path.exists("secrets.json"):
-             with open("secrets.json") as f: secrets = json.load(f)
-        
-        ftp_pass = secrets.get("ftp_pass")
-        gemini_key = secrets.get("gemini_key")
-        
-        # AWS Credentials
-        aws_access_key = secrets.get("aws_access_key")
-        aws_secret_key = secrets.get("aws_secret_key")
-        aws_bucket_name = secrets.get("aws_bucket_name")
-        aws_region = secrets.get("aws_region")
-
-
-        if not ftp_pass:
-            yield f"data: {json.dumps({'error': 'Brak hasła FTP'})}\n\n"
+        # Settings (served from memory, re-read only when secrets.json changes)
+        settings = settings_store.get()
+        gemini_key = settings.gemini_key
+
+        # Gemini quota of the key (paid tiers allow more)
+        rate_limits = {
+            "rpm": settings.ai_rpm,
+            "tpm": settings.ai_tpm,
+            "max_in_flight": settings.ai_max_in_flight
+        }
+        # Gemini, local ONNX model or local first with Gemini for unsure images
+        classifier = {
+            "mode": settings.classifier_mode,
+            "model_path": settings.local_model_path,
+            "threshold": settings.cascade_threshold
+        }
+
+        if not settings.ftp_pass:
+            yield {'error': 'Brak hasła FTP'}
             return
             
-        # Parse dates
-        d_from = datetime.datetime.strptime(date_from, "%Y-%m-%d").date()
-        d_to = datetime.datetime.strptime(date_to, "%Y-%m-%d").date()
-        
         # Connect FTP
-        yield f"data: {json.dumps({'log': 'Łączenie z FTP...'})}\n\n"
-        ftp = FTPManager("webas67993.tld.pl", "jjaczewski", ftp_pass)
+        yield {'log': 'Łączenie z FTP...'}
+        ftp = FTPManager(settings.ftp_host, settings.ftp_user, settings.ftp_pass, cache=ftp_cache, index=remote_index)
         if not ftp.connect():
-             yield f"data: {json.dumps({'error': 'Błąd połączenia FTP'})}\n\n"
+             yield {'error': 'Błąd połączenia FTP'}
              return
 
-        # Prepare output
-        final_report_lines = []
         # We need absolute path for output relative to Backend? Or Root? 
         # Cwd is backend/ when running main.py usually, or we fix path.
         # 1. Define Paths
@@ -233,12 +266,14 @@ async def execution_generator(project_id: str, date_from: str, date_to: str):
         if not os.path.exists(zip_dest_folder): os.makedirs(zip_dest_folder)
         
         # TRASH PREVIEW (External to ZIP)
-        trash_preview_root = os.path.join(zip_dest_folder, "Odrzucone")
+        # One subfolder per project, jobs of different projects may run at the same time
+        safe_proj_name = "".join([c for c in proj['name'] if c.isalpha() or c.isdigit() or c in (' ', '-', '_')]).strip() or project_id
+        trash_preview_root = os.path.join(zip_dest_folder, "Odrzucone", safe_proj_name)
         # Clear previous trash to ensure only current run is visible
         if os.path.exists(trash_preview_root):
             try: shutil.rmtree(trash_preview_root)
             except: pass
-        os.makedirs(trash_preview_root)
+        os.makedirs(trash_preview_root, exist_ok=True)
 
         # Working Directories (Hidden)
         # Temp Download: Raw files
@@ -252,160 +287,41 @@ async def execution_generator(project_id: str, date_from: str, date_to: str):
         if os.path.exists(temp_sorted): shutil.rmtree(temp_sorted)
         os.makedirs(temp_sorted)
 
-        yield f"data: {json.dumps({'log': f'Folder roboczy: {temp_download}'})}\n\n"
+        yield {'log': f'Folder roboczy: {temp_download}'}
         
-        # Loop structure
-        structure_list = proj['structure']
-        is_single_folder = (len(structure_list) == 1)
-
-        s3_links = []
-        final_report_lines = []
-
-        # --- HELPER: Sequential Processing Generator ---
-        def process_folder_sequence(f_def, is_single_mode, s3_list_acc):
-             # 1. RESOLVE NAME
-             f_name = f_def.get('name', '').strip()
-             f_id = f_def['id']
-             
-             # Fallback name logic matches UI
-             if not f_name: f_name = f"Folder_{f_id[:4]}"
-             
-             # Safe FS Name
-             safe_f_name = "".join([c for c in f_name if c.isalpha() or c.isdigit() or c in (' ', '-', '_')]).strip()
-             if not safe_f_name: safe_f_name = f"Folder_{f_id[:4]}"
-             
-             # 2. SETUP PATHS
-             if is_single_mode:
-                 # Single mode: Use roots directly to detect 'project' files at top level
-                 curr_dl_target = temp_download
-                 curr_sorted_target = temp_sorted
-                 curr_trash_target = trash_preview_root
-             else:
-                 # Multi mode: Subfolders
-                 curr_dl_target = os.path.join(temp_download, safe_f_name)
-                 curr_sorted_target = os.path.join(temp_sorted, safe_f_name)
-                 curr_trash_target = os.path.join(trash_preview_root, safe_f_name)
-
-             # 3. DOWNLOAD
-             yield f"data: {json.dumps({'log': f'Pobieranie plików: {f_name}...'})}\n\n"
-             
-             # Adapter for this specific folder paths
-             f_adapter = { "Name": f_name, "RemoteSpecs": f_def['paths'] }
-             
-             # Time range
-             dt_f = datetime.datetime.combine(d_from, datetime.time.min)
-             dt_t = datetime.datetime.combine(d_to, datetime.time.max)
-             
-             d_dir, count = ftp.download_files_for_job(f_adapter, dt_f, dt_t, temp_download, explicit_target_dir=curr_dl_target)
-             
-             fin_kept = 0
-             fin_total = count
-             
-             if d_dir and count > 0:
-                 # Notify Frontend: Set Total
-                 yield f"data: {json.dumps({'type': 'set_total', 'count': count, 'folder': f_name})}\n\n"
-                 
-                 # 4. ANALYZE
-                 if gemini_key:
-                     yield f"data: {json.dumps({'log': f'Analiza AI: {f_name}...'})}\n\n"
-                     try:
-                         analyzer = ImageAnalyzer(gemini_key)
-                         
-                         analyzed_count = 0
-                         
-                         for res in analyzer.analyze_and_sort_generator(d_dir, curr_sorted_target, rejected_dest_dir=curr_trash_target):
-                             if res['decision'] == 'keep':
-                                 fin_kept += 1
-                             analyzed_count += 1
-                             
-                             event_data = {
-                                 "type": "image_result",
-                                 "file": res['file'],
-                                 "decision": res['decision'],
-                                 "path": res['path'],
-                                 "current": res['current'],
-                                 "total": res['total']
-                             }
-                             yield f"data: {json.dumps(event_data)}\n\n"
-                         
-                         msg_res = f"Folder {f_name}: Pobrani {count}, Wybrano {fin_kept}."
-                         final_report_lines.append(msg_res)
-                         yield f"data: {json.dumps({'log': f'Zakończono analizę {f_name}.'})}\n\n"
-                         
-                     except Exception as ae:
-                         err_msg = f"Błąd AI ({f_name}): {str(ae)}"
-                         yield f"data: {json.dumps({'log': err_msg})}\n\n"
-                         final_report_lines.append(f"Folder {f_name}: {err_msg}")
-                 else:
-                     # No AI: Copy Loop
-                     yield f"data: {json.dumps({'log': f'Kopiowanie (bez AI): {f_name}...'})}\n\n"
-                     if not os.path.exists(curr_sorted_target): os.makedirs(curr_sorted_target)
-                     import distutils.dir_util
-                     distutils.dir_util.copy_tree(d_dir, curr_sorted_target)
-                     fin_kept = count
-                     final_report_lines.append(f"Folder {f_name}: {count} pobranych (Bez AI).")
-             else:
-                 yield f"data: {json.dumps({'log': f'Brak plików na FTP: {f_name}.'})}\n\n"
-                 final_report_lines.append(f"Folder {f_name}: Brak plików.")
-                 return
-
-             # 5. ZIP & UPLOAD
-             # Check if we have anything sorted
-             if not os.path.exists(curr_sorted_target) or not os.listdir(curr_sorted_target):
-                 return
-
-             yield f"data: {json.dumps({'type': 'upload_start', 'folder': f_name})}\n\n"
-             
-             # Calculate Zip Name
-             if is_single_mode:
-                 zip_basename = proj['name']
-             else:
-                 zip_basename = f"{proj['name']} {safe_f_name}"
-             
-             zip_filename = f"{zip_basename} {date_from}_{date_to}.zip"
-             zip_path = os.path.join(zip_dest_folder, zip_filename)
-             
-             yield f"data: {json.dumps({'log': f'Tworzenie ZIP: {zip_filename}...'})}\n\n"
-             
-             try:
-                 import zipfile
-                 allowed_ext = ('.jpg', '.jpeg', '.png', '.webp')
-                 
-                 with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                     for root, dirs, files in os.walk(curr_sorted_target):
-                         for file in files:
-                             if not file.lower().endswith(allowed_ext): continue
-                             file_path = os.path.join(root, file)
-                             arcname = os.path.relpath(file_path, curr_sorted_target)
-                             zipf.write(file_path, arcname)
-                 
-                 # S3 Upload
-                 if aws_access_key and aws_secret_key and aws_bucket_name:
-                     yield f"data: {json.dumps({'log': f'Wysyłanie na S3...'})}\n\n"
-                     from modules.s3_manager import S3Manager
-                     s3_mgr = S3Manager(aws_access_key, aws_secret_key, aws_region, aws_bucket_name)
-                     link = s3_mgr.upload_and_generate_link(zip_path, zip_filename)
-                     
-                     yield f"data: {json.dumps({'log': f'Gotowe! Link dla {f_name}.'})}\n\n"
-                     yield f"data: {json.dumps({'type': 'link_result', 'link': link, 'folder': f_name})}\n\n"
-                     
-                     # Append to accumulator
-                     s3_list_acc.append(link)
-                     return
-                 else:
-                     yield f"data: {json.dumps({'log': 'Pominięto S3 (brak konfiguracji).'})}\n\n"
-                     return
-                     
-             except Exception as ze:
-                 yield f"data: {json.dumps({'log': f'Błąd ZIP/Upload: {ze}'})}\n\n"
-                 return
-
-        # --- EXECUTE LOOP ---
-        for folder_def in structure_list:
-            for msg in process_folder_sequence(folder_def, is_single_folder, s3_links):
-                yield msg
-
-        ftp.disconnect()
+        # Folders go through a staged pipeline (download -> filter -> AI -> ZIP -> upload)
+        aws_config = {
+            "access_key": settings.aws_access_key,
+            "secret_key": settings.aws_secret_key,
+            "bucket_name": settings.aws_bucket_name,
+            "region": settings.aws_region,
+            "part_size_mb": settings.s3_part_size_mb,
+            "max_concurrency": settings.s3_max_concurrency,
+            "endpoint_url": settings.aws_endpoint_url or None,
+            "stream_upload": settings.s3_stream_upload,
+            "keep_local_zip": settings.keep_local_zip
+        }
+        work_dirs = {
+            "temp_download": temp_download,
+            "temp_sorted": temp_sorted,
+            "trash_root": trash_preview_root,
+            "zip_dest": zip_dest_folder
+        }
+        analyzer_options = {
+            "image_cache": image_cache,
+            "verdict_cache": verdict_cache,
+            "rate_limits": rate_limits,
+            "classifier": classifier,
+            "registry": model_registry
+        }
+        pipeline = FolderPipeline(proj, ftp, gemini_key, aws_config, work_dirs, date_from, date_to, cancel_event=cancel_event, analyzer_options=analyzer_options)
+
+        try:
+            for event in pipeline.run(proj['structure']):
+                yield event
+        finally:
+            ftp.disconnect()
+            image_cache.evict()
         
         # Cleanup
         try:
@@ -413,11 +329,35 @@ async def execution_generator(project_id: str, date_from: str, date_to: str):
              # shutil.rmtree(temp_sorted) # Keep for UI
         except: pass
 
-        yield f"data: {json.dumps({'log': 'Wszystkie zadania zakończone!', 'done': True, 'report': final_report_lines, 's3_links': s3_links, 's3_link': (s3_links[0] if s3_links else None)})}\n\n"
+        if cancel_event.is_set():
+            yield {'error': 'Zadanie anulowane', 'report': pipeline.report_lines}
+            return
+
+        s3_links = pipeline.s3_links
+        yield {'log': 'Wszystkie zadania zakończone!', 'done': True, 'report': pipeline.report_lines, 's3_links': s3_links, 's3_link': (s3_links[0] if s3_links else None)}
 
     except Exception as e:
-        yield f"data: {json.dumps({'error': str(e)})}\n\n"
-
+        yield {'error': str(e)}
+
+job_manager = JobManager(run_job)
+
+def sse_message(event_id, data):
+    return f"id: {event_id}\ndata: {json.dumps(data)}\n\n"
+
+async def job_event_stream(job, last_id):
+    # Replays everything after Last-Event-ID, then follows the live job.
+    # Waiting is an asyncio event set by the job thread, no threadpool thread per client.
+    while True:
+        for event_id, data in job.events_after(last_id):
+            last_id = event_id
+            yield sse_message(event_id, data)
+            if data.get('type') == 'job_end':
+                return
+        if job.is_finished and not job.events_after(last_id):
+            return
+        await job.wait_for_events_async(last_id, 15)
+        if job.last_event_id <= last_id:
+            yield ": keep-alive\n\n"
 
 @app.get("/image")
 async def get_image(path: str):
@@ -426,6 +366,26 @@ async def get_image(path: str):
         return FileResponse(path)
     return HTTPException(status_code=404, detail="Image not found")
 
+@app.get("/thumb")
+def get_thumb(request: Request, path: str = "", hash: str = ""):
+    # Small WEBP preview for the review grid; `hash` comes from image_result
+    if hash and not re.fullmatch(r"[0-9a-f]{40}", hash):
+        raise HTTPException(status_code=400, detail="Invalid hash")
+    try:
+        digest, thumb_path = image_cache.thumbnail(path or None, hash or None)
+    except Exception as e:
+        raise HTTPException(status_code=415, detail=f"Cannot make thumbnail: {e}")
+    if not thumb_path:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = f'"{digest}-{THUMB_SIZE}"'
+    # A hash URL always means the same content, a path can be reused by a later run
+    cache_control = "public, max-age=31536000, immutable" if hash else "no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(thumb_path, media_type="image/webp", headers=headers)
+
 @app.get("/download_zip")
 async def download_zip(filename: str):
     user_docs = os.path.expanduser("~/Documents")
@@ -437,8 +397,43 @@ async def download_zip(filename: str):
     return HTTPException(status_code=404, detail="File not found")
 
 @app.post("/execute")
-async def execute_project(req: ExecutionRequest):
-    return StreamingResponse(execution_generator(req.project_id, req.date_from, req.date_to), media_type="text/event-stream")
+def execute_project(req: ExecutionRequest):
+    job = job_manager.submit(req.project_id, req.date_from, req.date_to)
+    return {"job_id": job.id, "status": job.status}
+
+@app.get("/jobs")
+def list_jobs():
+    return job_manager.list_jobs()
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request, last_event_id: int = 0):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    # Browsers send Last-Event-ID on reconnect; query param is for manual clients
+    header_id = request.headers.get("last-event-id")
+    if header_id and header_id.isdigit():
+        last_event_id = int(header_id)
+
+    if job.is_finished and not job.events_after(last_event_id):
+        # 204 tells EventSource to stop reconnecting
+        return Response(status_code=204)
+
+    return StreamingResponse(job_event_stream(job, last_event_id), media_type="text/event-stream")
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    if not job_manager.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"status": "cancelling" if job_manager.cancel(job_id) else "finished"}
 
 if __name__ == "__main__":
     import uvicorn
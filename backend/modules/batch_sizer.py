@@ -0,0 +1,60 @@
+import threading
+
+BATCH_SIZE_MIN = 4
+BATCH_SIZE_MAX = 16
+BATCH_TARGET_SECONDS = 25.0  # Slower answers shrink the batch (request timeout is 60s)
+BATCH_MAX_PAYLOAD_BYTES = 4 * 1024 * 1024  # Image bytes per request
+
+class BatchSizer:
+    """
+    Picks the number of images per AI request from what earlier batches did.
+    Clean, fast answers grow the batch by one; a fallback parse, missing
+    decisions, an error or a slow answer shrink it by a quarter. The size is
+    also capped so a request stays under BATCH_MAX_PAYLOAD_BYTES.
+    Every finished batch is kept in `history` for the job metrics.
+    """
+    def __init__(self, start, min_size=BATCH_SIZE_MIN, max_size=BATCH_SIZE_MAX):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.size = max(min_size, min(max_size, start))
+        self.avg_image_bytes = None
+        self.history = []
+        self.lock = threading.Lock()
+
+    def next_size(self):
+        with self.lock:
+            size = self.size
+            if self.avg_image_bytes:
+                size = min(size, max(self.min_size, int(BATCH_MAX_PAYLOAD_BYTES // self.avg_image_bytes)))
+            return size
+
+    def record(self, size, seconds, payload_bytes, parse_fallback=False, missing=0, error=False):
+        with self.lock:
+            self.history.append({
+                "size": size,
+                "seconds": round(seconds, 2),
+                "payload_bytes": payload_bytes,
+                "parse_fallback": parse_fallback,
+                "missing": missing,
+                "error": error
+            })
+            if size and payload_bytes:
+                per_image = payload_bytes / size
+                self.avg_image_bytes = per_image if self.avg_image_bytes is None else 0.8 * self.avg_image_bytes + 0.2 * per_image
+
+            if error or parse_fallback or missing or seconds > BATCH_TARGET_SECONDS:
+                self.size = max(self.min_size, int(self.size * 0.75))
+            elif size >= self.size:
+                # Only a full batch proves the current size works
+                self.size = min(self.max_size, self.size + 1)
+
+    def metrics(self, since=0):
+        """Sizes and timings of the batches recorded from index `since` on"""
+        with self.lock:
+            history = self.history[since:]
+            return {
+                "batch_sizes": [h["size"] for h in history],
+                "batch_seconds": [h["seconds"] for h in history],
+                "parse_fallbacks": sum(1 for h in history if h["parse_fallback"]),
+                "next_batch_size": self.size
+            }
@@ -0,0 +1,310 @@
+import os
+import json
+import time
+import re
+import io
+import hashlib
+import concurrent.futures
+
+import PIL.Image
+import numpy as np
+
+from modules.config import CLASSIFIER_MODES, CASCADE_THRESHOLD
+
+RATE_LIMIT_RETRIES = 5  # 429 backoffs per batch before it counts as an error
+PROMPT_TOKENS_ESTIMATE = 400
+IMAGE_TOKENS_ESTIMATE = 300  # ~258 tokens per image + its line in the answer
+
+# Batch prompt, filled with `count` and `image_list`
+BATCH_PROMPT = """Role: Merchandising Auditor.
+Task: Analyze {count} images and filter GARBAGE vs CONTENT.
+
+RULES:
+1. KEEP (Pass):
+   - Retail Shelves (Full or Empty)
+   - Products (Bottles, Boxes, Jars)
+   - Pallets, Cardboard Displays, Coolers
+   - Receipts, Documents, Screens
+   - Store Interior (Floor + Shelves)
+   **IF UNCERTAIN/BLURRY BUT SHOWS SHELF -> KEEP**
+
+2. TRASH (Reject):
+   - Solid Black/White/Red Screen
+   - Floor TILES ONLY (No products)
+   - Ceiling ONLY
+   - Building Exterior / Street
+   - Accidental shots (Inside pocket, Shoes only)
+
+IMAGE LIST (in order):
+{image_list}
+
+Return JSON array with decisions for each image IN ORDER:
+[
+  {{"file": "filename1.jpg", "decision": "keep", "reason": "short explanation"}},
+  {{"file": "filename2.jpg", "decision": "trash", "reason": "short explanation"}}
+]"""
+
+# Cached AI verdicts are only valid for the exact prompt they were made with
+PROMPT_VERSION = hashlib.sha1(BATCH_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+LOCAL_INPUT_SIZE = 224
+LOCAL_MEAN = [0.485, 0.456, 0.406]  # ImageNet normalisation, override in the model's .json
+LOCAL_STD = [0.229, 0.224, 0.225]
+
+class GeminiBackend:
+    """Sends batches to a Gemini model with the BATCH_PROMPT, shares the key's RateLimiter"""
+    def __init__(self, model, model_name, rate_limiter):
+        self.model = model
+        self.model_name = model_name
+        self.rate_limiter = rate_limiter
+
+    @property
+    def name(self):
+        return self.model_name
+
+    def _wait_for_rate_limit(self, tokens=0):
+        """Blocks until the shared limiter allows another request of ~`tokens`"""
+        waited = self.rate_limiter.acquire(tokens)
+        if waited >= 0.5:
+            print(f"⏳ Rate limit: waited {waited:.1f}s")
+
+    def classify(self, batch_files, source_folder, load_proxy, metrics):
+        """
+        Process a batch of images with a single API call.
+        Returns dict mapping filename -> (decision, reason)
+        """
+        if not batch_files:
+            return {}
+        
+        results = {}
+        
+        # Prepare all images for the batch
+        image_parts = []
+        file_names = []
+        
+        for file_name in batch_files:
+            full_path = os.path.join(source_folder, file_name)
+            try:
+                proxy_bytes = load_proxy(full_path)
+                image_parts.append({'mime_type': 'image/webp', 'data': proxy_bytes})
+                file_names.append(file_name)
+            except Exception as e:
+                print(f"Error preparing {file_name}: {e}")
+                results[file_name] = ("keep", f"Prep Error: {str(e)}")
+        
+        if not file_names:
+            return results
+        metrics['payload_bytes'] = sum(len(part['data']) for part in image_parts)
+        
+        # Build batch prompt
+        batch_prompt = BATCH_PROMPT.format(
+            count=len(file_names),
+            image_list="\n".join(f"{i+1}. {name}" for i, name in enumerate(file_names))
+        )
+
+        retries = 3
+        attempt = 0
+        rate_limited = 0
+        est_tokens = PROMPT_TOKENS_ESTIMATE + len(file_names) * IMAGE_TOKENS_ESTIMATE
+        while attempt < retries:
+            try:
+                # Build content list: prompt first, then all images
+                content = [batch_prompt] + image_parts
+                
+                # Wait for rate limit (shared with the other in-flight batches)
+                self._wait_for_rate_limit(est_tokens)
+                print(f"🤖 Sending batch of {len(file_names)} images to Gemini...")
+                call_start = time.monotonic()
+                try:
+                    response = self.model.generate_content(
+                        content,
+                        request_options={'timeout': 60}  # Longer timeout for batch
+                    )
+                finally:
+                    metrics['seconds'] = time.monotonic() - call_start
+                self.rate_limiter.on_success()
+                usage = getattr(response, 'usage_metadata', None)
+                if usage and getattr(usage, 'total_token_count', None):
+                    self.rate_limiter.adjust_tokens(usage.total_token_count - est_tokens)
+                
+                text = response.text
+                clean = text.replace("```json", "").replace("```", "").strip()
+                
+                try:
+                    res_array = json.loads(clean)
+                except:
+                    metrics['parse_fallback'] = True
+                    # Try to extract JSON array
+                    match = re.search(r'\[.*\]', clean, re.DOTALL)
+                    if match:
+                        res_array = json.loads(match.group(0))
+                    else:
+                        # Fallback - try to parse individual objects
+                        res_array = []
+                        for m in re.finditer(r'\{[^}]+\}', clean):
+                            try:
+                                res_array.append(json.loads(m.group(0)))
+                            except:
+                                pass
+                
+                # Map results back to filenames
+                for item in res_array:
+                    file_key = item.get("file", "")
+                    decision = item.get("decision", "keep").lower()
+                    reason = item.get("reason", "AI Decision")
+                    
+                    if decision not in ["keep", "trash"]:
+                        decision = "keep"
+                    
+                    # Try exact match first
+                    if file_key in file_names:
+                        results[file_key] = (decision, f"AI: {reason}")
+                        print(f"✅ {file_key} -> {decision.upper()} | {reason}")
+                    else:
+                        # Try partial match
+                        for fn in file_names:
+                            if fn not in results and (file_key in fn or fn in file_key):
+                                results[fn] = (decision, f"AI: {reason}")
+                                print(f"✅ {fn} -> {decision.upper()} | {reason}")
+                                break
+                
+                # Handle any files not in results (default to keep)
+                for fn in file_names:
+                    if fn not in results:
+                        results[fn] = ("keep", "AI: No explicit decision (Safe Keep)")
+                        metrics['missing'] = metrics.get('missing', 0) + 1
+                        print(f"⚠️ {fn} -> KEEP (No AI response)")
+                
+                return results
+                
+            except Exception as e:
+                if self._is_rate_limit_error(e) and rate_limited < RATE_LIMIT_RETRIES:
+                    # Quota hit: every batch of this key backs off, not counted as a failed attempt
+                    rate_limited += 1
+                    delay = self.rate_limiter.on_rate_limited()
+                    print(f"⏳ 429 from Gemini, backing off {delay:.1f}s...")
+                    continue
+
+                attempt += 1
+                print(f"❌ Batch AI Attempt {attempt} Error: {e}")
+                if attempt == retries:
+                    metrics['error'] = True
+                    # Fail open - keep all images
+                    for fn in file_names:
+                        if fn not in results:
+                            results[fn] = ("keep", f"AI Error (Safe Keep): {str(e)}")
+                    return results
+                time.sleep(2)
+        
+        return results
+
+    @staticmethod
+    def _is_rate_limit_error(e):
+        # google.api_core ResourceExhausted (HTTP 429) without importing api_core here
+        return getattr(e, 'code', None) == 429 or type(e).__name__ == 'ResourceExhausted' or '429' in str(e)
+
+class OnnxBackend:
+    """
+    Local keep/trash classifier run with ONNX Runtime on the CPU.
+    `model_path` points to an .onnx image classifier; an optional .json next
+    to it sets "labels" (output order, default ["keep", "trash"]),
+    "input_size", "mean" and "std". Input is NCHW float32 RGB.
+    """
+    def __init__(self, model_path, threads=None):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("Local classifier needs the onnxruntime package (pip install onnxruntime)")
+        if not model_path or not os.path.exists(model_path):
+            raise RuntimeError(f"Local model not found: {model_path}")
+
+        meta = {}
+        meta_path = os.path.splitext(model_path)[0] + ".json"
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        self.labels = meta.get("labels", ["keep", "trash"])
+        self.input_size = int(meta.get("input_size", LOCAL_INPUT_SIZE))
+        self.mean = np.array(meta.get("mean", LOCAL_MEAN), dtype=np.float32).reshape(1, 3, 1, 1)
+        self.std = np.array(meta.get("std", LOCAL_STD), dtype=np.float32).reshape(1, 3, 1, 1)
+
+        # All cores for one batch at a time
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads or os.cpu_count() or 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+        with open(model_path, "rb") as f:
+            self.model_id = hashlib.sha1(f.read()).hexdigest()[:12]
+        self.decoder = concurrent.futures.ThreadPoolExecutor(max_workers=options.intra_op_num_threads, thread_name_prefix="onnx-decode")
+
+    @property
+    def name(self):
+        # Verdicts of a retrained model are not mixed with the old ones
+        return f"onnx:{self.model_id}"
+
+    def _load(self, full_path, load_proxy):
+        with PIL.Image.open(io.BytesIO(load_proxy(full_path))) as img:
+            img = img.convert("RGB").resize((self.input_size, self.input_size), PIL.Image.BILINEAR)
+            return np.asarray(img, dtype=np.float32)
+
+    def predict(self, batch_files, source_folder, load_proxy):
+        """{file: (label, confidence)} plus {file: error} for unreadable images"""
+        paths = [os.path.join(source_folder, f) for f in batch_files]
+        futures = [self.decoder.submit(self._load, p, load_proxy) for p in paths]
+        names, arrays, errors = [], [], {}
+        for file_name, future in zip(batch_files, futures):
+            try:
+                arrays.append(future.result())
+                names.append(file_name)
+            except Exception as e:
+                errors[file_name] = str(e)
+        if not names:
+            return {}, errors
+
+        x = np.stack(arrays).transpose(0, 3, 1, 2) / 255.0
+        x = ((x - self.mean) / self.std).astype(np.float32)
+        out = np.asarray(self.session.run(None, {self.input_name: x})[0], dtype=np.float64)
+        if not np.allclose(out.sum(axis=1), 1.0, atol=1e-3) or out.min() < 0:
+            # Logits -> probabilities
+            out = np.exp(out - out.max(axis=1, keepdims=True))
+            out /= out.sum(axis=1, keepdims=True)
+        best = out.argmax(axis=1)
+        return {n: (self.labels[i], float(out[k, i])) for k, (n, i) in enumerate(zip(names, best))}, errors
+
+    def classify(self, batch_files, source_folder, load_proxy, metrics):
+        start = time.monotonic()
+        predictions, errors = self.predict(batch_files, source_folder, load_proxy)
+        metrics['seconds'] = time.monotonic() - start
+        results = {f: ("keep", f"Prep Error: {e}") for f, e in errors.items()}
+        for file_name, (label, confidence) in predictions.items():
+            decision = label if label in ("keep", "trash") else "keep"
+            results[file_name] = (decision, f"Local: {label} ({confidence:.2f})")
+            print(f"🧠 {file_name} -> {decision.upper()} | local {confidence:.2f}")
+        return results
+
+class CascadeBackend:
+    """Local model first, only predictions below `threshold` confidence go to the remote backend"""
+    def __init__(self, local, remote, threshold=CASCADE_THRESHOLD):
+        self.local = local
+        self.remote = remote
+        self.threshold = threshold
+
+    @property
+    def name(self):
+        return f"cascade:{self.local.name}+{self.remote.name}@{self.threshold}"
+
+    def classify(self, batch_files, source_folder, load_proxy, metrics):
+        predictions, _ = self.local.predict(batch_files, source_folder, load_proxy)
+        results = {}
+        unsure = []
+        for file_name in batch_files:
+            label, confidence = predictions.get(file_name, (None, 0.0))
+            if label in ("keep", "trash") and confidence >= self.threshold:
+                results[file_name] = (label, f"Local: {label} ({confidence:.2f})")
+            else:
+                unsure.append(file_name)
+        if unsure:
+            print(f"🧠 Cascade: {len(results)} decided locally, {len(unsure)} to Gemini")
+            results.update(self.remote.classify(unsure, source_folder, load_proxy, metrics))
+        return results
@@ -0,0 +1,14 @@
+# Defaults shared by the modules and the settings model (settings_store.py),
+# kept here so reading the settings does not import the AI / S3 modules
+
+# Rate limiting, defaults match the Gemini Free Tier (15 requests/minute),
+# paid keys can raise them in the settings
+AI_REQUESTS_PER_MINUTE = 15
+AI_TOKENS_PER_MINUTE = 1000000
+AI_MAX_IN_FLIGHT = 2  # Batches sent concurrently, each still waits for the limiter
+
+CLASSIFIER_MODES = ("gemini", "local", "cascade")
+CASCADE_THRESHOLD = 0.85  # Local predictions less sure than this go to Gemini
+
+S3_PART_SIZE_MB = 16  # Multipart chunk, also the threshold for a multipart upload
+S3_MAX_CONCURRENCY = 8  # Parts uploaded at the same time
@@ -0,0 +1,94 @@
+import PIL.Image
+import numpy as np
+
+DHASH_SIZE = 8  # 8x8 gradient bits -> 64-bit hash
+DEDUP_MAX_DISTANCE = 6  # Hamming distance (of 64 bits) still counted as the same shot
+
+def dhash_pixels(img):
+    """Grayscale (8, 9) array a dHash is computed from"""
+    small = img.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), PIL.Image.BILINEAR)
+    return np.asarray(small, dtype=np.int16)
+
+def dhash_file(file_path):
+    with PIL.Image.open(file_path) as img:
+        img.draft('L', (64, 64))
+        return dhash_pixels(img)
+
+def dhash_batch(pixels):
+    """dHashes of stacked (N, 8, 9) arrays, as Python ints"""
+    pixels = np.asarray(pixels, dtype=np.int16).reshape(-1, DHASH_SIZE, DHASH_SIZE + 1)
+    bits = (pixels[:, :, 1:] > pixels[:, :, :-1]).reshape(len(pixels), -1)
+    packed = np.packbits(bits, axis=1)  # (N, 8) bytes, big endian
+    return [int(v) for v in packed.view('>u8').ravel()]
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes with Hamming distance"""
+    def __init__(self):
+        self.root = None  # [hash, item, {distance: child}]
+
+    def add(self, h, item):
+        node = [h, item, {}]
+        if self.root is None:
+            self.root = node
+            return
+        cur = self.root
+        while True:
+            d = hamming(h, cur[0])
+            child = cur[2].get(d)
+            if child is None:
+                cur[2][d] = node
+                return
+            cur = child
+
+    def search(self, h, max_distance):
+        """[(distance, item)] of every hash within `max_distance`"""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            cur = stack.pop()
+            d = hamming(h, cur[0])
+            if d <= max_distance:
+                found.append((d, cur[1]))
+            for child_d, child in cur[2].items():
+                if d - max_distance <= child_d <= d + max_distance:
+                    stack.append(child)
+        return found
+
+class DuplicateGrouper:
+    """
+    Incremental clustering for images that arrive one by one: `add` returns
+    the representative (first image) of the cluster a new image falls into,
+    or None when it starts a cluster of its own.
+    """
+    def __init__(self, max_distance=DEDUP_MAX_DISTANCE):
+        self.tree = BKTree()
+        self.max_distance = max_distance
+
+    def add(self, name, h):
+        if h is None:
+            return None  # No hash, stays alone
+        matches = self.tree.search(h, self.max_distance)
+        if matches:
+            return min(matches, key=lambda m: m[0])[1]
+        self.tree.add(h, name)
+        return None
+
+def group_duplicates(names, hashes, max_distance=DEDUP_MAX_DISTANCE):
+    """
+    Clusters near-identical images.
+    `hashes` maps name -> dHash (names without one stay alone).
+    Returns {representative: [duplicates]} in the order of `names`, the
+    representative being the first image of its cluster.
+    """
+    grouper = DuplicateGrouper(max_distance)
+    clusters = {}
+    for name in names:
+        rep = grouper.add(name, hashes.get(name))
+        if rep is None:
+            clusters[name] = []
+        else:
+            clusters[rep].append(name)
+    return clusters
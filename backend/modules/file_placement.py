@@ -0,0 +1,100 @@
+import os
+import errno
+import shutil
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FICLONE = 0x40049409  # Linux ioctl: copy-on-write clone of another file (Btrfs, XFS)
+PLACEMENT_METHODS = ("reflink", "hardlink", "rename", "copy")
+
+# Errors meaning "this method does not work here", not "this file is broken"
+_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY}
+
+def _reflink(src_path, dest_path):
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP, "reflink not available")
+    with open(src_path, "rb") as src, open(dest_path, "wb") as dest:
+        try:
+            fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dest.close()
+            os.remove(dest_path)
+            raise
+    shutil.copystat(src_path, dest_path)
+
+class FilePlacer:
+    """
+    Puts a file at a new path writing as little data as possible:
+    reflink (copy-on-write clone), hardlink, rename (only with `allow_move`,
+    the source is gone afterwards) and a real copy as the last resort.
+    Hardlinks are only made inside `link_dirs` (internal work folders): the
+    downloads are hardlinks of the FTP cache blobs, so editing a linked file
+    the user can open (ZIP folder, rejected preview) would change the cache.
+    Elsewhere a linked source is not renamed either.
+    A method that is not supported between two devices is not tried again
+    for them. `stats` counts the methods used and the bytes really copied.
+    """
+    def __init__(self, allow_move=False, link_dirs=()):
+        self.allow_move = allow_move
+        self.link_dirs = [os.path.abspath(d) for d in link_dirs]
+        self.lock = threading.Lock()
+        self.failed = set()  # (method, src device, dest dir device)
+        self.stats = {method: 0 for method in PLACEMENT_METHODS}
+        self.stats["bytes_written"] = 0
+        self.stats["bytes_placed"] = 0
+
+    def _may_link(self, dest_path):
+        dest = os.path.abspath(dest_path)
+        try:
+            return any(os.path.commonpath([dest, d]) == d for d in self.link_dirs)
+        except ValueError:  # Different drives
+            return False
+
+    def place(self, src_path, dest_path):
+        """Places `src_path` at `dest_path` (replacing it), returns the method used"""
+        may_link = self._may_link(dest_path)
+        if os.path.exists(dest_path):
+            if may_link and os.path.samefile(src_path, dest_path):
+                return "hardlink"  # Already there, e.g. a re-run
+            os.remove(dest_path)
+
+        src_stat = os.stat(src_path)
+        size = src_stat.st_size
+        devices = (src_stat.st_dev, os.stat(os.path.dirname(dest_path) or ".").st_dev)
+        for method in PLACEMENT_METHODS:
+            if method == "hardlink" and not may_link:
+                continue
+            if method == "rename" and (not self.allow_move or (not may_link and src_stat.st_nlink > 1)):
+                continue
+            if (method, *devices) in self.failed:
+                continue
+            try:
+                if method == "reflink":
+                    _reflink(src_path, dest_path)
+                elif method == "hardlink":
+                    os.link(src_path, dest_path)
+                elif method == "rename":
+                    os.rename(src_path, dest_path)
+                else:
+                    shutil.copy2(src_path, dest_path)
+            except OSError as e:
+                if method == "copy":
+                    raise
+                if e.errno in _UNSUPPORTED:
+                    with self.lock:
+                        self.failed.add((method, *devices))
+                continue
+            with self.lock:
+                self.stats[method] += 1
+                self.stats["bytes_placed"] += size
+                if method == "copy":
+                    self.stats["bytes_written"] += size
+            return method
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats)
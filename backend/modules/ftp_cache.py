@@ -0,0 +1,181 @@
+import os
+import json
+import hashlib
+import shutil
+import threading
+import uuid
+
+CACHE_MAX_BYTES = 20 * 1024 ** 3  # LRU limit for cached FTP files (20 GB)
+
+class FTPCache:
+    """
+    Persistent local copy of files pulled from FTP.
+    Each file is stored once as a blob keyed by (remote path, size, MDTM).
+    A manifest per remote directory maps file names to their blobs, so a
+    later run only transfers new or changed files and hardlinks the rest.
+    Listings of closed (past) folders are kept too, None for folders that
+    do not exist on the server, see FTPManager.list_dir.
+    """
+    def __init__(self, cache_root, max_bytes=CACHE_MAX_BYTES):
+        self.root = cache_root
+        self.blobs_dir = os.path.join(cache_root, "blobs")
+        self.manifests_dir = os.path.join(cache_root, "manifests")
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.manifests = {}  # remote_dir -> {"remote_dir": ..., "files": {...}}
+        self.dirty = set()
+        self.listings_path = os.path.join(cache_root, "listings.json")
+        self.listings = None  # remote_dir -> entries of closed (past) folders, None if missing
+        self.listings_dirty = False
+
+        for d in (self.blobs_dir, self.manifests_dir):
+            if not os.path.exists(d): os.makedirs(d)
+
+        # Leftovers of interrupted downloads from a previous session
+        for name in os.listdir(self.blobs_dir):
+            if name.endswith(".part"):
+                try:
+                    os.remove(os.path.join(self.blobs_dir, name))
+                except OSError:
+                    pass
+
+    # --- Manifests ---
+    def _manifest_path(self, remote_dir):
+        digest = hashlib.sha1(remote_dir.encode("utf-8")).hexdigest()
+        return os.path.join(self.manifests_dir, f"{digest}.json")
+
+    def _get_manifest(self, remote_dir):
+        manifest = self.manifests.get(remote_dir)
+        if manifest is None:
+            manifest = {"remote_dir": remote_dir, "files": {}}
+            path = self._manifest_path(remote_dir)
+            if os.path.exists(path):
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        manifest = json.load(f)
+                except Exception as e:
+                    print(f"FTP Cache: broken manifest for {remote_dir}: {e}")
+            self.manifests[remote_dir] = manifest
+        return manifest
+
+    # --- Listings of closed folders ---
+    def _load_listings(self):
+        if self.listings is None:
+            self.listings = {}
+            if os.path.exists(self.listings_path):
+                try:
+                    with open(self.listings_path, "r", encoding="utf-8") as f:
+                        self.listings = json.load(f)
+                except Exception as e:
+                    print(f"FTP Cache: broken listings file: {e}")
+        return self.listings
+
+    def get_listing(self, remote_dir, default=None):
+        with self.lock:
+            return self._load_listings().get(remote_dir, default)
+
+    def put_listing(self, remote_dir, entries):
+        with self.lock:
+            self._load_listings()[remote_dir] = entries
+            self.listings_dirty = True
+
+    @staticmethod
+    def _write_json(path, data):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        """Writes changed manifests and listings to disk (temp file + rename)"""
+        with self.lock:
+            if self.listings_dirty:
+                try:
+                    self._write_json(self.listings_path, self.listings)
+                except Exception as e:
+                    print(f"FTP Cache: listings write error: {e}")
+                self.listings_dirty = False
+            for remote_dir in list(self.dirty):
+                try:
+                    self._write_json(self._manifest_path(remote_dir), self.manifests[remote_dir])
+                except Exception as e:
+                    print(f"FTP Cache: manifest write error for {remote_dir}: {e}")
+            self.dirty.clear()
+
+    # --- Blobs ---
+    def _blob_name(self, remote_dir, fname, size, mdtm):
+        key = f"{remote_dir.rstrip('/')}/{fname}|{size}|{mdtm}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def lookup(self, remote_dir, fname, size, mdtm):
+        """Returns the cached blob path if the file is unchanged on FTP, else None"""
+        with self.lock:
+            entry = self._get_manifest(remote_dir)["files"].get(fname)
+        if not entry or entry.get("size") != size or entry.get("mdtm") != mdtm:
+            return None
+        blob_path = os.path.join(self.blobs_dir, entry["blob"])
+        if not os.path.exists(blob_path):
+            return None  # Evicted
+        try:
+            os.utime(blob_path)  # LRU touch
+        except:
+            pass
+        return blob_path
+
+    def temp_path(self):
+        """Where a download should be written before `commit`"""
+        return os.path.join(self.blobs_dir, f"{uuid.uuid4().hex}.part")
+
+    def commit(self, remote_dir, fname, size, mdtm, tmp_path):
+        """Moves a finished download into the cache and records it in the manifest"""
+        blob = self._blob_name(remote_dir, fname, size, mdtm)
+        blob_path = os.path.join(self.blobs_dir, blob)
+        os.replace(tmp_path, blob_path)
+        with self.lock:
+            self._get_manifest(remote_dir)["files"][fname] = {"size": size, "mdtm": mdtm, "blob": blob}
+            self.dirty.add(remote_dir)
+        return blob_path
+
+    @staticmethod
+    def link_into(blob_path, dest_path):
+        """Hardlinks a cached blob into a job directory (copy if linking is not possible)"""
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        try:
+            os.link(blob_path, dest_path)
+        except OSError:
+            shutil.copy2(blob_path, dest_path)
+        return dest_path
+
+    def evict(self):
+        """Drops least recently used blobs until the cache fits in `max_bytes`"""
+        with self.lock:
+            blobs = []
+            total = 0
+            for name in os.listdir(self.blobs_dir):
+                path = os.path.join(self.blobs_dir, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if name.endswith(".part"):
+                    continue
+                blobs.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+            if total <= self.max_bytes:
+                return 0
+
+            removed = 0
+            for _, size, path in sorted(blobs):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    removed += 1
+                except OSError:
+                    pass
+            # Manifest entries pointing at removed blobs are ignored by `lookup`
+            print(f"🧹 FTP Cache: evicted {removed} files")
+            return removed
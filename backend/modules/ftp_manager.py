@@ -2,25 +2,82 @@ import ftplib
 import os
 import datetime
 import calendar
+import posixpath
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dateutil import parser
 
+from modules.path_templates import expand_paths
+from modules.remote_index import RemoteIndex, REMOTE_INDEX_INTERVAL_SECONDS
+
+DOWNLOAD_WORKERS = 4  # Parallel FTP connections used for RETR
+DOWNLOAD_RETRIES = 3  # Attempts per file, each retry on a fresh connection
+LISTING_CLOSED_GRACE_DAYS = 7  # Dated folders are treated as final this long after their period ends
+INDEX_FRESH_SECONDS = REMOTE_INDEX_INTERVAL_SECONDS  # A run trusts open folders listed this recently
+
+# LIST fallback formats (unix `ls -l` and IIS/DOS style)
+UNIX_LIST_RE = re.compile(
+    r'^(?P<type>[-dlcbps])[rwxsStT-]{9}\S*\s+\d+\s+\S+\s+(?:\S+\s+)?(?P<size>\d+)\s+'
+    r'(?P<mon>[A-Za-z]{3})\s+(?P<day>\d{1,2})\s+(?P<time>\d{1,2}:\d{2}|\d{4})\s+(?P<name>.+)$'
+)
+DOS_LIST_RE = re.compile(
+    r'^(?P<date>\d{2}-\d{2}-\d{2,4})\s+(?P<time>\d{1,2}:\d{2}[AaPp][Mm])\s+(?P<size><DIR>|\d+)\s+(?P<name>.+)$'
+)
+
+MLST_MODIFY_RE = re.compile(r'modify=(\d{14})', re.IGNORECASE)
+
+_UNKNOWN = object()  # Not in the listings cache
+
+def date_from_filename(fname):
+    """Date in a file name: 2024-01-01, 2024.01.01, 20240101 etc., or None"""
+    match = re.search(r'(?P<y>\d{4})[-_.]?(?P<m>\d{2})[-_.]?(?P<d>\d{2})', fname)
+    if match:
+        try:
+            return datetime.datetime(int(match.group('y')), int(match.group('m')), int(match.group('d')))
+        except ValueError:
+            pass
+    return None
+
+def file_date(fname, modify):
+    """Date a file is filtered by: from its name, else its modify time, else None"""
+    f_date = date_from_filename(fname)
+    if f_date is None and modify:
+        try:
+            f_date = datetime.datetime.strptime(modify, "%Y%m%d%H%M%S")
+        except ValueError:
+            pass
+    return f_date
+
 class FTPManager:
-    def __init__(self, host, user, password):
+    def __init__(self, host, user, password, workers=DOWNLOAD_WORKERS, cache=None, index=None):
         self.host = host
         self.user = user
         self.password = password
+        self.workers = max(1, int(workers or 1))
+        self.cache = cache  # Optional FTPCache for incremental sync
+        self.index = index  # Optional RemoteIndex, replaces listing folders on every run
+        self.last_stats = {"downloaded": 0, "cached": 0, "dead_paths": 0, "indexed": 0}
+        self.listings = {}  # remote_dir -> entries, valid for this run
+        self.dead_paths = 0  # Known missing folders skipped without a cwd
+        self.indexed = 0  # Folders answered by the index without a listing
+        self.mlsd_supported = None
         self.ftp = None
 
+    def _open_connection(self):
+        ftp = ftplib.FTP()
+        ftp.connect(self.host, 21)
+        ftp.login(self.user, self.password)
+        # UTF-8 support if available
+        try:
+            ftp.encoding = "utf-8"
+        except:
+            pass
+        return ftp
+
     def connect(self):
         try:
-            self.ftp = ftplib.FTP()
-            self.ftp.connect(self.host, 21)
-            self.ftp.login(self.user, self.password)
-            # UTF-8 support if available
-            try:
-                self.ftp.encoding = "utf-8"
-            except:
-                pass
+            self.ftp = self._open_connection()
             return True
         except Exception as e:
             print(f"FTP Connection Error: {e}")
@@ -59,102 +116,404 @@ class FTPManager:
             cur = cur.replace(year=year, month=month, day=1)
         return months
 
-    def expand_remote_paths(self, months, specs):
-        paths = set()
-        for m in months:
-            # m is "YYYY-MM"
-            parts = m.split('-')
-            year = parts[0]
-            month_int = int(parts[1])
-            
-            # Calculate quarter (q1, q2...)
-            q_num = (month_int - 1) // 3 + 1
-            quarter = f"q{q_num}"
-            
-            for s in specs:
-                p = s.replace("{yyyy}", year).replace("{yyyy-MM}", m).replace("{quarter}", quarter)
-                paths.add(p)
-        return list(paths)
-
-    def download_files_for_job(self, job, date_from, date_to, local_root, explicit_target_dir=None):
+    def expand_remote_paths(self, specs, date_from, date_to):
+        return list(expand_paths(specs, date_from, date_to).keys())
+
+    # --- Listing ---
+    def _is_closed(self, period_end):
+        """True once a folder's period ended more than LISTING_CLOSED_GRACE_DAYS ago"""
+        if period_end is None:
+            return False  # Path without date tokens, always open
+        period_close = datetime.datetime.combine(period_end, datetime.time.max)
+        return datetime.datetime.now() - period_close > datetime.timedelta(days=LISTING_CLOSED_GRACE_DAYS)
+
+    def _list_mlsd(self, remote_dir):
+        entries = {}
+        for name, facts in self.ftp.mlsd(remote_dir, facts=["type", "size", "modify"]):
+            if facts.get("type", "file").lower() != "file":
+                continue
+            size = facts.get("size")
+            modify = facts.get("modify")
+            entries[name] = {
+                "size": int(size) if size and size.isdigit() else None,
+                "modify": modify[:14] if modify else None
+            }
+        return entries
+
+    def _parse_list_line(self, line, now):
+        """Parses one LIST line -> (name, entry), ("", None) for dirs, None if unknown format"""
+        m = UNIX_LIST_RE.match(line)
+        if m:
+            if m.group("type") != "-":
+                return ("", None)
+            stamp = m.group("time")
+            if ":" in stamp:
+                # Recent files show time instead of year
+                dt = datetime.datetime.strptime(f"{now.year} {m.group('mon')} {m.group('day')} {stamp}", "%Y %b %d %H:%M")
+                if dt > now + datetime.timedelta(days=1):
+                    dt = dt.replace(year=now.year - 1)
+            else:
+                dt = datetime.datetime.strptime(f"{stamp} {m.group('mon')} {m.group('day')}", "%Y %b %d")
+            return (m.group("name"), {"size": int(m.group("size")), "modify": dt.strftime("%Y%m%d%H%M%S")})
+
+        m = DOS_LIST_RE.match(line)
+        if m:
+            if m.group("size") == "<DIR>":
+                return ("", None)
+            date_fmt = "%m-%d-%Y" if len(m.group("date")) == 10 else "%m-%d-%y"
+            dt = datetime.datetime.strptime(f"{m.group('date')} {m.group('time').upper()}", f"{date_fmt} %I:%M%p")
+            return (m.group("name"), {"size": int(m.group("size")), "modify": dt.strftime("%Y%m%d%H%M%S")})
+
+        return None
+
+    def _list_parsed(self, remote_dir):
+        lines = []
+        self.ftp.cwd(remote_dir)
+        self.ftp.retrlines("LIST", lines.append)
+        now = datetime.datetime.now()
+        entries = {}
+        for line in lines:
+            if not line.strip() or line.lower().startswith("total"):
+                continue
+            parsed = self._parse_list_line(line, now)
+            if parsed is None:
+                raise ValueError(f"Unknown LIST format: {line}")
+            name, entry = parsed
+            if entry and name not in ('.', '..'):
+                entries[name] = entry
+        return entries
+
+    def _list_nlst(self, remote_dir):
+        self.ftp.cwd(remote_dir)
+        try:
+            filenames = self.ftp.nlst()
+        except ftplib.error_perm:
+            # Empty directory or permissions
+            filenames = []
+        return {posixpath.basename(f): {"size": None, "modify": None} for f in filenames if f not in ('.', '..')}
+
+    def _detect_mlsd(self):
+        if self.mlsd_supported is None:
+            try:
+                self.mlsd_supported = "MLST" in self.ftp.voidcmd("FEAT").upper()
+            except Exception:
+                self.mlsd_supported = False
+        return self.mlsd_supported
+
+    def list_dir(self, remote_dir, closed=False):
+        """
+        Lists files in `remote_dir` with one command: {name: {"size", "modify"}}.
+        Uses MLSD when the server supports it, otherwise parses LIST, and as
+        a last resort falls back to NLST (size/modify left as None).
+        Returns None when the directory does not exist.
+        Results are kept for the whole run; `closed` listings also go to the
+        persistent cache so later runs skip the round-trip entirely. So do
+        closed folders that do not exist (e.g. the unused one of two path
+        variants), later runs skip them without a cwd.
+        """
+        if remote_dir in self.listings:
+            return self.listings[remote_dir]
+
+        if closed and self.cache:
+            entries = self.cache.get_listing(remote_dir, default=_UNKNOWN)
+            if entries is not _UNKNOWN:
+                if entries is None:
+                    self.dead_paths += 1
+                self.listings[remote_dir] = entries
+                return entries
+
+        try:
+            self.ftp.cwd(remote_dir)
+        except ftplib.error_perm:
+            self.listings[remote_dir] = None
+            if closed and self.cache:
+                self.cache.put_listing(remote_dir, None)
+            return None  # Directory likely doesn't exist
+
+        self._detect_mlsd()
+
+        entries = None
+        complete = True
+        if self.mlsd_supported:
+            try:
+                entries = self._list_mlsd(remote_dir)
+            except ftplib.error_perm as e:
+                print(f"MLSD not usable ({e}), switching to LIST")
+                self.mlsd_supported = False
+        if entries is None:
+            try:
+                entries = self._list_parsed(remote_dir)
+            except Exception as e:
+                print(f"LIST parse failed for {remote_dir} ({e}), falling back to NLST")
+                entries = self._list_nlst(remote_dir)
+                complete = False
+
+        self.listings[remote_dir] = entries
+        if closed and complete and self.cache:
+            self.cache.put_listing(remote_dir, entries)
+        return entries
+
+    # --- Remote index ---
+    def dir_modify(self, remote_dir):
+        """
+        Directory mtime "YYYYMMDDHHMMSS" via MLST (one command, no data
+        connection), "" if the directory does not exist, None if unknown.
+        """
+        if not self._detect_mlsd():
+            return None
+        try:
+            resp = self.ftp.sendcmd(f"MLST {remote_dir}")
+        except ftplib.error_perm as e:
+            return "" if str(e).startswith("550") else None
+        m = MLST_MODIFY_RE.search(resp)
+        return m.group(1) if m else None
+
+    def sync_index(self, remote_dir, closed=False, max_age=None):
+        """
+        Brings the index entry of `remote_dir` up to date. Closed folders are
+        not checked again. Open ones are relisted when their mtime changed
+        (or the server cannot tell). With `max_age` (a run downloading by the
+        listed size/modify) the mtime is not asked: a file overwritten in place
+        keeps the folder mtime, so an open folder is trusted only if it was
+        listed less than `max_age` seconds ago and relisted otherwise.
+        A folder that just closed is relisted once more before it is frozen.
+        True if it already was current.
+        """
+        row = self.index.get_dir(remote_dir)
+        if row is not None and row["closed"]:
+            return True
+        if max_age is not None:
+            listed_age = RemoteIndex.age(row["listed"]) if row is not None else None
+            if not closed and listed_age is not None and listed_age < max_age:
+                return True
+            modify = None  # Unknown, the crawler compares it again next time
+        else:
+            modify = self.dir_modify(remote_dir)
+            if row is not None and not closed and modify is not None and modify == row["modify"]:
+                self.index.mark_checked(remote_dir, closed)
+                return True
+        entries = self.list_dir(remote_dir, closed=closed)
+        self.index.put_dir(remote_dir, entries, modify, closed, file_date)
+        return False
+
+    def _download_pool(self, tasks, progress_callback=None):
+        """
+        Downloads (remote_dir, fname, local_path, meta) tasks over a pool of
+        `self.workers` connections, separate from the listing connection.
+        A failed transfer is retried on a fresh connection.
+        When `meta` is a (size, mdtm) pair the file goes through the cache.
+        Yields the local path of each file as soon as it is downloaded.
+        """
+        if not tasks:
+            return
+
+        state = threading.local()
+        open_conns = []
+        lock = threading.Lock()
+        done = [0]
+        total = len(tasks)
+
+        def get_conn(fresh=False):
+            conn = getattr(state, "ftp", None)
+            if conn is not None and not fresh:
+                return conn
+            if conn is not None:
+                try:
+                    conn.close()
+                except:
+                    pass
+            conn = self._open_connection()
+            state.ftp = conn
+            state.cwd = None
+            with lock:
+                open_conns.append(conn)
+            return conn
+
+        def fetch(task):
+            remote_dir, fname, local_path, meta = task
+            write_path = self.cache.temp_path() if (self.cache and meta) else local_path
+            for attempt in range(DOWNLOAD_RETRIES):
+                try:
+                    conn = get_conn(fresh=attempt > 0)
+                    if state.cwd != remote_dir:
+                        conn.cwd(remote_dir)
+                        state.cwd = remote_dir
+                    with open(write_path, 'wb') as f:
+                        conn.retrbinary(f"RETR {fname}", f.write)
+                    if write_path != local_path:
+                        blob_path = self.cache.commit(remote_dir, fname, meta[0], meta[1], write_path)
+                        self.cache.link_into(blob_path, local_path)
+                    return local_path
+                except Exception as e:
+                    print(f"FTP Download Error ({fname}, attempt {attempt+1}): {e}")
+            # All attempts failed - drop partial file
+            try:
+                os.remove(write_path)
+            except:
+                pass
+            return None
+
+        pool = ThreadPoolExecutor(max_workers=min(self.workers, total))
+        try:
+            futures = [pool.submit(fetch, t) for t in tasks]
+            for fut in as_completed(futures):
+                local_path = fut.result()
+                done[0] += 1
+                if progress_callback:
+                    progress_callback(done[0], total, local_path)
+                if local_path:
+                    yield local_path
+        finally:
+            # Closed early (job cancelled): finish the transfers in progress, drop the rest
+            pool.shutdown(wait=True, cancel_futures=True)
+            for conn in open_conns:
+                try:
+                    conn.quit()
+                except:
+                    conn.close()
+
+    def _get_remote_meta(self, remote_path, mdtm=None):
+        """Returns (size, mdtm) of a remote file via SIZE/MDTM, or None"""
+        try:
+            if mdtm is None:
+                mdtm = self.ftp.voidcmd(f"MDTM {remote_path}")[4:].strip()[:14]
+            # SIZE needs binary mode on most servers (NLST leaves ASCII on)
+            self.ftp.voidcmd("TYPE I")
+            size = self.ftp.size(remote_path)
+            if size is None:
+                return None
+            return (int(size), mdtm)
+        except Exception:
+            return None
+
+    def download_files_for_job(self, job, date_from, date_to, local_root, explicit_target_dir=None, progress_callback=None):
+        """Downloads the job's files, returns (target_dir, file count) or (None, 0)"""
+        plan = self.plan_job_files(job, date_from, date_to, local_root, explicit_target_dir)
+        count = sum(1 for _ in self.iter_job_files(*plan, progress_callback=progress_callback))
+        if not count:
+            return None, 0
+        return plan[0], count
+
+    def plan_job_files(self, job, date_from, date_to, local_root, explicit_target_dir=None):
+        """
+        Lists the job's remote folders (or asks the index) and picks the files
+        in the date range: (target_dir, download tasks,
+        {local_path: (cached blob, download task if the blob is gone)}).
+        Nothing is transferred yet, see iter_job_files.
+        """
         if explicit_target_dir:
             target_dir = explicit_target_dir
         else:
             folder_name = f"{job['Name']} {date_from.strftime('%d-%m')} - {date_to.strftime('%d-%m-%Y')}"
             target_dir = os.path.join(local_root, folder_name)
         
-        months = self.get_months_between(date_from, date_to)
-        remote_paths = self.expand_remote_paths(months, job["RemoteSpecs"])
+        remote_paths = expand_paths(job["RemoteSpecs"], date_from, date_to)
+        self.dead_paths = 0
+        self.indexed = 0
         
-        files_downloaded = []
-        
-        if not os.path.exists(target_dir):
-            os.makedirs(target_dir)
-
-        # Helper to parse filename date
-        def get_date_from_filename(fname):
-            import re
-            # Match 2024-01-01, 2024.01.01, 20240101, etc.
-            match = re.search(r'(?P<y>\d{4})[-_.]?(?P<m>\d{2})[-_.]?(?P<d>\d{2})', fname)
-            if match:
-                try:
-                    d = datetime.datetime(
-                        int(match.group('y')), 
-                        int(match.group('m')), 
-                        int(match.group('d'))
-                    )
-                    return d
-                except:
-                    pass
-            return None
+        download_tasks = {}
+        cached_files = {}
 
-        for rp in remote_paths:
+        for rp, period_end in remote_paths.items():
             try:
-                try:
-                    self.ftp.cwd(rp)
-                except ftplib.error_perm:
-                    continue # Directory likely doesn't exist
+                closed = self._is_closed(period_end)
+                if self.index:
+                    # Only the files dated in the range, open folders relisted unless listed recently
+                    if self.sync_index(rp, closed=closed, max_age=INDEX_FRESH_SECONDS):
+                        self.indexed += 1
+                    entries = self.index.files(rp, date_from, date_to)
+                    if entries is None and closed:
+                        self.dead_paths += 1
+                else:
+                    entries = self.list_dir(rp, closed=closed)
+                if entries is None:
+                    continue
 
-                # Get file list
-                try:
-                    filenames = self.ftp.nlst()
-                except ftplib.error_perm:
-                     # Empty directory or permissions
-                    filenames = []
-
-                for fname in filenames:
-                    # Skip . and ..
-                    if fname in ['.', '..']:
-                        continue
-                        
-                    f_date = get_date_from_filename(fname)
+                for fname, info in entries.items():
+                    f_date = date_from_filename(fname)
+                    time_str = info.get("modify")
+                    remote_file = posixpath.join(rp, fname)
                     
-                    if not f_date:
-                        # Try MDTM
+                    if not time_str and not f_date:
+                        # Listing had no modify time (NLST fallback) - try MDTM
                         try:
-                            mdtm_resp = self.ftp.voidcmd(f"MDTM {fname}")
+                            mdtm_resp = self.ftp.voidcmd(f"MDTM {remote_file}")
                             # Response format: 213 YYYYMMDDHHMMSS
-                            time_str = mdtm_resp[4:].strip()
-                            f_date = datetime.datetime.strptime(time_str, "%Y%m%d%H%M%S")
+                            time_str = mdtm_resp[4:].strip()[:14]
                         except:
                             # If MDTM fails, skip filtering or assume today? 
                             # Safe to skip if we can't verify date.
                             continue
 
+                    if not f_date:
+                        try:
+                            f_date = datetime.datetime.strptime(time_str, "%Y%m%d%H%M%S")
+                        except:
+                            continue
+
                     if date_from <= f_date <= date_to:
                         local_path = os.path.join(target_dir, fname)
-                        with open(local_path, 'wb') as f:
-                            self.ftp.retrbinary(f"RETR {fname}", f.write)
-                        files_downloaded.append(local_path)
+                        meta = None
+                        if self.cache:
+                            if info.get("size") is not None and time_str:
+                                meta = (info["size"], time_str)
+                            else:
+                                meta = self._get_remote_meta(remote_file, time_str)
+
+                        # Unchanged since an earlier run -> hardlink from cache, no transfer
+                        blob_path = self.cache.lookup(rp, fname, *meta) if meta else None
+                        if blob_path:
+                            download_tasks.pop(local_path, None)
+                            cached_files[local_path] = (blob_path, (rp, fname, local_path, meta))
+                            continue
+
+                        # Same name in two path variants -> one local file, last one wins
+                        cached_files.pop(local_path, None)
+                        download_tasks[local_path] = (rp, fname, local_path, meta)
             except Exception as e:
                 print(f"Error processing {rp}: {e}")
 
-        # Cleanup if empty
-        if not files_downloaded:
-            try:
-                os.rmdir(target_dir)
-            except:
-                pass
-            return None, 0
-        
-        return target_dir, len(files_downloaded)
+        self.last_stats = {"downloaded": 0, "cached": len(cached_files),
+                           "dead_paths": self.dead_paths, "indexed": self.indexed}
+        return target_dir, list(download_tasks.values()), cached_files
+
+    def iter_job_files(self, target_dir, download_tasks, cached_files, progress_callback=None):
+        """
+        Yields the local path of every planned file as soon as it is there:
+        cached ones first (hardlinks, no transfer), then downloads in the
+        order they finish. A cached blob evicted since the plan (jobs run in
+        parallel, each evicts when it ends) is downloaded like a cache miss.
+        Removes `target_dir` again if nothing arrived.
+        """
+        os.makedirs(target_dir, exist_ok=True)
+        arrived = 0
+        evicted = []
+        try:
+            for local_path, (blob_path, task) in cached_files.items():
+                try:
+                    self.cache.link_into(blob_path, local_path)
+                except FileNotFoundError:
+                    evicted.append(task)
+                    continue
+                arrived += 1
+                yield local_path
+            if evicted:
+                print(f"FTP Cache: {len(evicted)} files evicted since the plan, downloading them")
+                self.last_stats["cached"] -= len(evicted)
+
+            # Fetch new/changed files in parallel over the worker connections
+            for local_path in self._download_pool(download_tasks + evicted, progress_callback):
+                arrived += 1
+                self.last_stats["downloaded"] += 1
+                yield local_path
+        finally:
+            if self.cache:
+                self.cache.flush()
+                self.cache.evict()
+
+            # Cleanup if empty
+            if not arrived:
+                try:
+                    os.rmdir(target_dir)
+                except:
+                    pass
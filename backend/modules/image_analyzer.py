@@ -1,265 +1,113 @@
-import google.generativeai as genai
 import PIL.Image
 import os
-import shutil
-import json
-import time
-import cv2
-import numpy as np
 import io
-import re
+import math
+import functools
+import collections
+import concurrent.futures
 
-# Rate limiting for Gemini Free Tier: 15 requests/minute = 1 request every 4 seconds
-BATCH_SIZE = 9  # Number of images to analyze per API call
-REQUEST_DELAY_SECONDS = 4  # Delay between API requests to stay within free tier limits
+from modules import quality_gate
+from modules.image_cache import prepare_image, file_digest, PROXY_SIZE, PROXY_QUALITY
+from modules.dedup import dhash_file, dhash_batch, DuplicateGrouper
+from modules.classifiers import PROMPT_VERSION
+from modules.model_registry import get_registry
+from modules.batch_sizer import BatchSizer
+from modules.file_placement import FilePlacer
+from modules.config import AI_REQUESTS_PER_MINUTE, AI_TOKENS_PER_MINUTE, AI_MAX_IN_FLIGHT
+
+BATCH_SIZE = 9  # Images per API call to start with, BatchSizer adapts it
 
 class ImageAnalyzer:
-    def __init__(self, api_key):
-        genai.configure(api_key=api_key)
-        self.model_name = self._get_best_model()
-        self.model = genai.GenerativeModel(self.model_name)
-        self.last_request_time = 0
-    
-    def _get_best_model(self):
-        try:
-            print("\n🔍 Checking available Gemini models...")
-            available_models = []
-            for m in genai.list_models():
-                if 'generateContent' in m.supported_generation_methods:
-                    available_models.append(m.name)
-            
-            # Priority list - prefer flash models for speed and cost
-            priorities = [
-                'models/gemini-1.5-flash-001',
-                'models/gemini-1.5-flash',
-                'models/gemini-1.5-flash-latest',
-                'models/gemini-1.5-pro',
-                'models/gemini-pro-vision'
-            ]
-            
-            for p in priorities:
-                if p in available_models:
-                    print(f"✅ Selected Model: {p}")
-                    return p
-            
-            for m in available_models:
-                if 'flash' in m: return m
-            
-            if available_models: return available_models[0]
-            
-        except Exception as e:
-            print(f"⚠️ Error listing models: {e}. Defaulting to 'gemini-1.5-flash-001'")
-            return 'gemini-1.5-flash-001'
-        
-        return 'gemini-1.5-flash-001'
+    def __init__(self, api_key, image_cache=None, verdict_cache=None, rate_limits=None, classifier=None, registry=None, placer=None):
+        limits = rate_limits or {}
+        # Model choice and clients are shared by all analyzers of the process
+        self.registry = registry or get_registry()
+        self.classifier = self.registry.classifier(api_key, classifier or {}, {
+            "rpm": limits.get("rpm") or AI_REQUESTS_PER_MINUTE,
+            "tpm": limits.get("tpm") or AI_TOKENS_PER_MINUTE
+        })
+        self.model_name = self.classifier.name  # Key of the verdict cache
+        self.max_in_flight = max(1, int(limits.get("max_in_flight") or AI_MAX_IN_FLIGHT))
+        self.batch_sizer = BatchSizer(BATCH_SIZE)
+        self.image_cache = image_cache  # ImageCache, reuses decodes by content hash
+        self.verdict_cache = verdict_cache  # VerdictCache, AI decisions by content hash
+        self.digests = {}  # full path -> content hash, filled by the local filter
+        self.dhashes = {}  # full path -> perceptual hash, filled by the local filter
+        self.last_stats = {}  # Dedup / cache / API numbers of the last AI phase
+        self.placer = placer or FilePlacer()  # Reflink into the output dirs instead of copying
 
-    def _prepare_image_for_api(self, file_path, size=400, fmt="WEBP"):
+    def _prepare_image_for_api(self, file_path, size=PROXY_SIZE, fmt="WEBP"):
         """Optimizes image for API - smaller size for batch processing"""
+        digest = self.digests.get(file_path)
+        if digest and self.image_cache and size == PROXY_SIZE and fmt == "WEBP":
+            # Made by the local filter in the same decode
+            proxy = self.image_cache.read_proxy(digest)
+            if proxy: return proxy
         try:
             with PIL.Image.open(file_path) as img:
                 if img.mode != 'RGB': img = img.convert('RGB')
                 if max(img.size) > size: img.thumbnail((size, size))
                 buf = io.BytesIO()
-                img.save(buf, format=fmt, quality=40)  # Lower quality for batch
+                img.save(buf, format=fmt, quality=PROXY_QUALITY)  # Lower quality for batch
                 return buf.getvalue()
         except:
             with open(file_path, "rb") as f: return f.read()
 
-    def _wait_for_rate_limit(self):
-        """Ensures we wait at least REQUEST_DELAY_SECONDS between API calls"""
-        elapsed = time.time() - self.last_request_time
-        if elapsed < REQUEST_DELAY_SECONDS:
-            wait_time = REQUEST_DELAY_SECONDS - elapsed
-            print(f"⏳ Rate limit: waiting {wait_time:.1f}s...")
-            time.sleep(wait_time)
-        self.last_request_time = time.time()
-
     def _local_math_check(self, file_path, file_name):
         """
         Local gatekeeper using math - filters obvious garbage without API calls.
         Returns (should_skip, decision, reason) - if should_skip is True, skip API.
         """
-        try:
-            pil_img = PIL.Image.open(file_path)
-            if pil_img.mode != 'RGB': pil_img = pil_img.convert('RGB')
-            img_np = np.array(pil_img)
-            
-            # Solid Color Check
-            if img_np.std() < 15.0:
-                print(f"📐 {file_name} -> Trash (Math: Solid Color)")
-                return (True, "trash", "Solid Color (Math)")
-            
-            # Blur Check (Laplacian)
-            gray = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
-            blur_score = cv2.Laplacian(gray, cv2.CV_64F).var()
-            if blur_score < 30.0:
-                print(f"📐 {file_name} -> Trash (Math: Blurry {blur_score:.1f})")
-                return (True, "trash", f"Blurry ({blur_score:.1f})")
-            
-            return (False, None, None)
-            
-        except Exception as e:
-            print(f"Math Check Error for {file_name}: {e}")
-            return (False, None, None)
+        result = quality_gate.check_image(file_path)
+        self._log_math_result(file_name, result)
+        return result
+
+    def _remember_prepared(self, full_path, entry):
+        """Keeps the content hash of a prepared image, returns its gate verdict"""
+        if entry['digest']:
+            self.digests[full_path] = entry['digest']
+        if entry.get('dhash') is not None:
+            self.dhashes[full_path] = entry['dhash']
+        return entry['gate']
 
-    def _process_batch_with_ai(self, batch_files, source_folder):
+    def _log_math_result(self, file_name, result):
+        should_skip, decision, reason = result
+        if should_skip:
+            print(f"📐 {file_name} -> Trash | {reason}")
+
+    def _process_batch_with_ai(self, batch_files, source_folder, metrics=None):
         """
-        Process a batch of images with a single API call.
+        Classifies a batch with the configured backend (Gemini, local model or cascade).
         Returns dict mapping filename -> (decision, reason)
+        `metrics` (dict) gets payload size, call time and parse problems for BatchSizer.
         """
-        if not batch_files:
-            return {}
-        
-        results = {}
-        
-        # Prepare all images for the batch
-        image_parts = []
-        file_names = []
-        
-        for file_name in batch_files:
-            full_path = os.path.join(source_folder, file_name)
-            try:
-                proxy_bytes = self._prepare_image_for_api(full_path)
-                image_parts.append({'mime_type': 'image/webp', 'data': proxy_bytes})
-                file_names.append(file_name)
-            except Exception as e:
-                print(f"Error preparing {file_name}: {e}")
-                results[file_name] = ("keep", f"Prep Error: {str(e)}")
-        
-        if not file_names:
-            return results
-        
-        # Build batch prompt
-        batch_prompt = f"""Role: Merchandising Auditor.
-Task: Analyze {len(file_names)} images and filter GARBAGE vs CONTENT.
-
-RULES:
-1. KEEP (Pass):
-   - Retail Shelves (Full or Empty)
-   - Products (Bottles, Boxes, Jars)
-   - Pallets, Cardboard Displays, Coolers
-   - Receipts, Documents, Screens
-   - Store Interior (Floor + Shelves)
-   **IF UNCERTAIN/BLURRY BUT SHOWS SHELF -> KEEP**
-
-2. TRASH (Reject):
-   - Solid Black/White/Red Screen
-   - Floor TILES ONLY (No products)
-   - Ceiling ONLY
-   - Building Exterior / Street
-   - Accidental shots (Inside pocket, Shoes only)
-
-IMAGE LIST (in order):
-{chr(10).join([f'{i+1}. {name}' for i, name in enumerate(file_names)])}
-
-Return JSON array with decisions for each image IN ORDER:
-[
-  {{"file": "filename1.jpg", "decision": "keep", "reason": "short explanation"}},
-  {{"file": "filename2.jpg", "decision": "trash", "reason": "short explanation"}}
-]"""
-
-        # Wait for rate limit
-        self._wait_for_rate_limit()
-        
-        retries = 3
-        for attempt in range(retries):
-            try:
-                # Build content list: prompt first, then all images
-                content = [batch_prompt] + image_parts
-                
-                print(f"🤖 Sending batch of {len(file_names)} images to Gemini...")
-                response = self.model.generate_content(
-                    content,
-                    request_options={'timeout': 60}  # Longer timeout for batch
-                )
-                
-                text = response.text
-                clean = text.replace("```json", "").replace("```", "").strip()
-                
-                try:
-                    res_array = json.loads(clean)
-                except:
-                    # Try to extract JSON array
-                    match = re.search(r'\[.*\]', clean, re.DOTALL)
-                    if match:
-                        res_array = json.loads(match.group(0))
-                    else:
-                        # Fallback - try to parse individual objects
-                        res_array = []
-                        for m in re.finditer(r'\{[^}]+\}', clean):
-                            try:
-                                res_array.append(json.loads(m.group(0)))
-                            except:
-                                pass
-                
-                # Map results back to filenames
-                for item in res_array:
-                    file_key = item.get("file", "")
-                    decision = item.get("decision", "keep").lower()
-                    reason = item.get("reason", "AI Decision")
-                    
-                    if decision not in ["keep", "trash"]:
-                        decision = "keep"
-                    
-                    # Try exact match first
-                    if file_key in file_names:
-                        results[file_key] = (decision, f"AI: {reason}")
-                        print(f"✅ {file_key} -> {decision.upper()} | {reason}")
-                    else:
-                        # Try partial match
-                        for fn in file_names:
-                            if fn not in results and (file_key in fn or fn in file_key):
-                                results[fn] = (decision, f"AI: {reason}")
-                                print(f"✅ {fn} -> {decision.upper()} | {reason}")
-                                break
-                
-                # Handle any files not in results (default to keep)
-                for fn in file_names:
-                    if fn not in results:
-                        results[fn] = ("keep", "AI: No explicit decision (Safe Keep)")
-                        print(f"⚠️ {fn} -> KEEP (No AI response)")
-                
-                return results
-                
-            except Exception as e:
-                print(f"❌ Batch AI Attempt {attempt+1} Error: {e}")
-                if attempt == retries - 1:
-                    # Fail open - keep all images
-                    for fn in file_names:
-                        if fn not in results:
-                            results[fn] = ("keep", f"AI Error (Safe Keep): {str(e)}")
-                    return results
-                time.sleep(2)
-        
-        return results
+        return self.classifier.classify(batch_files, source_folder, self._prepare_image_for_api, metrics if metrics is not None else {})
 
     def _finalize(self, file, decision, reason, src_path, dest_dir):
         """Moves file and returns dict"""
         try:
             dest_path = os.path.join(dest_dir, file)
             if os.path.abspath(src_path) != os.path.abspath(dest_path):
-                shutil.copy2(src_path, dest_path)
+                self.placer.place(src_path, dest_path)
             
             return {
                 "file": file,
                 "decision": decision,
                 "reason": reason,
-                "path": dest_path
+                "path": dest_path,
+                "digest": self.digests.get(src_path)
             }
         except Exception as e:
             return {
                 "file": file,
                 "decision": "keep",
                 "reason": f"Move Error: {e}",
-                "path": src_path
+                "path": src_path,
+                "digest": self.digests.get(src_path)
             }
 
-    def analyze_and_sort_generator(self, source_folder, final_dest_dir, rejected_dest_dir=None):
-        """
-        Yields analysis results for each image using BATCH processing.
-        Optimized for Gemini Free Tier: 15 requests/minute.
-        Processes 9-10 images per API call with 4s delay between calls.
-        """
+    def prepare_dirs(self, source_folder, final_dest_dir, rejected_dest_dir=None):
+        """Creates output dirs, returns the rejected dir"""
         if rejected_dest_dir:
             rejected_dir = rejected_dest_dir
         else:
@@ -267,80 +115,277 @@ Return JSON array with decisions for each image IN ORDER:
 
         if not os.path.exists(rejected_dir): os.makedirs(rejected_dir)
         if not os.path.exists(final_dest_dir): os.makedirs(final_dest_dir)
+        return rejected_dir
 
-        files = [f for f in os.listdir(source_folder) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))]
-        total = len(files)
-        
-        if total == 0:
-            return
-        
-        print(f"\n📊 Processing {total} images in batches of {BATCH_SIZE}")
-        print(f"⏱️ Rate limit: {REQUEST_DELAY_SECONDS}s between API calls (Free Tier)")
-        
-        finished_count = 0
-        
-        # First pass: Local math checks (no API calls)
-        files_for_ai = []
-        math_results = {}
-        
+    def list_images(self, source_folder):
+        return [f for f in os.listdir(source_folder) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))]
+
+    def local_filter_generator(self, source_folder, files, final_dest_dir, rejected_dir, files_for_ai):
+        """
+        Phase 1: local math checks (no API calls).
+        Yields results for images rejected locally, appends the rest to `files_for_ai`.
+        """
         print("\n📐 Phase 1: Local math filtering...")
-        for file in files:
-            full_path = os.path.join(source_folder, file)
-            should_skip, decision, reason = self._local_math_check(full_path, file)
+        rejected = yield from self._filter_chunk(source_folder, files, final_dest_dir, rejected_dir, files_for_ai)
+        print(f"📐 Math filtered: {rejected} images rejected locally")
+
+    def local_filter_stream(self, source_folder, chunks, final_dest_dir, rejected_dir, files_for_ai):
+        """
+        Phase 1 for files still arriving: `chunks` yields lists of file names
+        (e.g. as downloads finish), each is checked as soon as it comes.
+        """
+        rejected = 0
+        for files in chunks:
+            if files:
+                rejected += yield from self._filter_chunk(source_folder, files, final_dest_dir, rejected_dir, files_for_ai)
+        print(f"📐 Math filtered: {rejected} images rejected locally")
+
+    def _filter_chunk(self, source_folder, files, final_dest_dir, rejected_dir, files_for_ai):
+        """Checks `files`, yields the rejected ones, returns how many"""
+        math_results = {}
+
+        # Reduced-scale decode spread over worker processes, see quality_gate
+        paths = [os.path.join(source_folder, file) for file in files]
+        if self.image_cache:
+            # Same decode also makes the AI proxy and the thumbnail
+            prepare = functools.partial(prepare_image, cache_root=self.image_cache.root)
+            results = ((path, self._remember_prepared(path, entry)) for path, entry in quality_gate.check_batch(paths, prepare))
+        else:
+            results = quality_gate.check_batch(paths)
+
+        for file, (full_path, result) in zip(files, results):
+            self._log_math_result(file, result)
+            should_skip, decision, reason = result
             
             if should_skip:
                 math_results[file] = (decision, reason, full_path)
             else:
                 files_for_ai.append(file)
         
-        print(f"📐 Math filtered: {len(math_results)} images rejected locally")
-        print(f"🤖 Sending {len(files_for_ai)} images to AI in batches...")
-        
         # Yield math-filtered results first
         for file, (decision, reason, full_path) in math_results.items():
-            finished_count += 1
             dest_dir = rejected_dir if decision == "trash" else final_dest_dir
-            result = self._finalize(file, decision, reason, full_path, dest_dir)
-            yield {
-                "current": finished_count,
-                "total": total,
-                "file": result['file'],
-                "decision": result['decision'],
-                "reason": result['reason'],
-                "path": result['path']
-            }
+            yield self._finalize(file, decision, reason, full_path, dest_dir)
+        return len(math_results)
+
+    def _dhashes(self, source_folder, files):
+        """{file: perceptual hash}, reusing the ones made by the local filter"""
+        hashes = {}
+        missing, pixels = [], []
+        for file in files:
+            full_path = os.path.join(source_folder, file)
+            if full_path in self.dhashes:
+                hashes[file] = self.dhashes[full_path]
+                continue
+            try:
+                pixels.append(dhash_file(full_path))
+                missing.append(file)
+            except Exception as e:
+                print(f"dHash Error for {file}: {e}")
+        if missing:
+            hashes.update(zip(missing, dhash_batch(pixels)))
+        return hashes
+
+    def ai_sort_generator(self, source_folder, files_for_ai, final_dest_dir, rejected_dir):
+        """
+        Phase 2: AI batch processing, yields a result per image.
+        Near-duplicates (bursts of the same shelf) are sent once, the
+        representative's decision is applied to the whole group.
+        """
+        yield from self.ai_stream_generator(source_folder, [files_for_ai], final_dest_dir, rejected_dir)
+
+    def ai_stream_generator(self, source_folder, chunks, final_dest_dir, rejected_dir):
+        """
+        Phase 2 for files still arriving: `chunks` yields lists of file names
+        (an empty list when nothing new came, so finished batches are still
+        reported). A batch is sent as soon as enough images wait for one, the
+        last partial batch when `chunks` ends. Up to `max_in_flight` batches
+        run at once (the rate limiter still spaces the requests), results come
+        back in batch order. Near-duplicates of an image already sent get its
+        decision when it is known.
+        """
+        grouper = DuplicateGrouper()
+        clusters = {}  # representative -> near-duplicates waiting for its decision
+        verdicts = {}  # representative -> (decision, reason)
+        to_send = collections.deque()
+        pending = collections.deque()  # (batch, future) in send order
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="ai-batch")
+        stats = {"images": 0, "duplicates": 0, "cache_hits": 0}
+        counts = {"sent": 0, "api_calls": 0, "api_images": 0, "local_decided": 0}
+        history_start = len(self.batch_sizer.history)
+        self.last_stats = stats
+
+        def submit(final):
+            # Each batch is cut when it is sent, with the size BatchSizer picked from the batches finished so far
+            while to_send and len(pending) < self.max_in_flight:
+                size = self.batch_sizer.next_size()
+                if len(to_send) < size and not final:
+                    return
+                batch = [to_send.popleft() for _ in range(min(size, len(to_send)))]
+                counts["sent"] += 1
+                pending.append((batch, executor.submit(self._process_batch, counts["sent"], batch, source_folder, len(to_send))))
+
+        def collect(final):
+            while pending and (final or pending[0][1].done()):
+                batch, future = pending.popleft()
+                ai_results = future.result()
+                submit(final)
+                local = sum(1 for decision, reason in ai_results.values() if reason.startswith("Local: "))
+                counts["local_decided"] += local
+                if local < len(batch):
+                    counts["api_calls"] += 1
+                    counts["api_images"] += len(batch)
+                # Yield results for this batch
+                for file in batch:
+                    verdicts[file] = ai_results.get(file, ("keep", "No AI response (Safe Keep)"))
+                    yield from self._finalize_group(source_folder, file, clusters.pop(file), *verdicts[file], final_dest_dir, rejected_dir)
+
+        try:
+            for files in chunks:
+                stats["images"] += len(files)
+                hashes = self._dhashes(source_folder, files) if files else {}
+                new = []
+                for file in files:
+                    rep = grouper.add(file, hashes.get(file))
+                    if rep is None:
+                        clusters[file] = []
+                        new.append(file)
+                        continue
+                    stats["duplicates"] += 1
+                    if rep in verdicts:
+                        decision, reason = verdicts[rep]
+                        dest_dir = rejected_dir if decision == "trash" else final_dest_dir
+                        yield self._finalize(file, decision, f"{reason} (Duplicate of {rep})", os.path.join(source_folder, file), dest_dir)
+                    else:
+                        clusters[rep].append(file)
+
+                # Images judged before with the same model and prompt
+                cached = self._cached_verdicts(source_folder, new)
+                stats["cache_hits"] += len(cached)
+                for file in new:
+                    if file in cached:
+                        decision, reason = cached[file]
+                        verdicts[file] = (decision, f"{reason} (Cache)")
+                        yield from self._finalize_group(source_folder, file, clusters.pop(file), *verdicts[file], final_dest_dir, rejected_dir)
+                    else:
+                        to_send.append(file)
+
+                submit(final=False)
+                yield from collect(final=False)
+
+            submit(final=True)
+            yield from collect(final=True)
+        finally:
+            # Generator closed early (job cancelled): drop batches not started yet
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if stats["duplicates"]:
+            print(f"🪞 Dedup: {stats['duplicates']} near-duplicates skipped AI")
+        if stats["cache_hits"]:
+            print(f"💾 Verdict cache: {stats['cache_hits']} images already judged")
+        print(f"🤖 AI: {counts['sent']} batches sent")
+
+        # Compared to every image sent at the batch size the calls really had (no dedup / cache)
+        per_call = counts["api_images"] / counts["api_calls"] if counts["api_calls"] else self.batch_sizer.next_size()
+        stats.update({
+            "api_calls": counts["api_calls"],
+            "local_decided": counts["local_decided"],
+            "api_calls_saved": max(0, math.ceil(stats["images"] / per_call) - counts["api_calls"]),
+            **self.batch_sizer.metrics(since=history_start)
+        })
+
+    def _process_batch(self, num, batch, source_folder, waiting):
+        print(f"\n🔄 Processing batch {num} ({len(batch)} images, {waiting} waiting)...")
+        metrics = {}
+        ai_results = self._process_batch_with_ai(batch, source_folder, metrics)
+        self.batch_sizer.record(
+            len(batch), metrics.get('seconds', 0.0), metrics.get('payload_bytes', 0),
+            parse_fallback=metrics.get('parse_fallback', False),
+            missing=metrics.get('missing', 0), error=metrics.get('error', False)
+        )
+        self._store_verdicts(source_folder, ai_results)
+        return ai_results
+
+    def _finalize_group(self, source_folder, file, duplicates, decision, reason, final_dest_dir, rejected_dir):
+        """Places an image and its near-duplicates by the same decision"""
+        dest_dir = rejected_dir if decision == "trash" else final_dest_dir
+        yield self._finalize(file, decision, reason, os.path.join(source_folder, file), dest_dir)
+        for dup in duplicates:
+            yield self._finalize(dup, decision, f"{reason} (Duplicate of {file})", os.path.join(source_folder, dup), dest_dir)
+
+    def _digest(self, full_path):
+        digest = self.digests.get(full_path)
+        if not digest:
+            digest = self.digests[full_path] = file_digest(full_path)
+        return digest
+
+    def _cached_verdicts(self, source_folder, files):
+        """{file: (decision, reason)} found in the verdict cache"""
+        if not self.verdict_cache or not files:
+            return {}
+        try:
+            by_digest = {self._digest(os.path.join(source_folder, f)): f for f in files}
+            found = self.verdict_cache.get_many(by_digest, self.model_name, PROMPT_VERSION)
+        except Exception as e:
+            print(f"Verdict cache read error: {e}")
+            return {}
+        return {by_digest[d]: verdict for d, verdict in found.items()}
+
+    def _store_verdicts(self, source_folder, ai_results):
+        if not self.verdict_cache:
+            return
+        verdicts = {}
+        for file, (decision, reason) in ai_results.items():
+            # Fail-open fallbacks are not real decisions, ask again next time
+            if not reason.startswith(("AI: ", "Local: ")) or reason.endswith("(Safe Keep)"):
+                continue
+            try:
+                verdicts[self._digest(os.path.join(source_folder, file))] = (decision, reason)
+            except OSError:
+                pass
+        try:
+            if verdicts:
+                self.verdict_cache.put_many(verdicts, self.model_name, PROMPT_VERSION)
+        except Exception as e:
+            print(f"Verdict cache write error: {e}")
+
+    def analyze_and_sort_generator(self, source_folder, final_dest_dir, rejected_dest_dir=None):
+        """
+        Yields analysis results for each image using BATCH processing.
+        Batch size starts at BATCH_SIZE and is adapted by BatchSizer; up to
+        `max_in_flight` batches run at once, spaced by the key's RateLimiter
+        (defaults: Gemini Free Tier, 15 requests/minute).
+        """
+        rejected_dir = self.prepare_dirs(source_folder, final_dest_dir, rejected_dest_dir)
+
+        files = self.list_images(source_folder)
+        total = len(files)
         
-        # Second pass: AI batch processing
-        for i in range(0, len(files_for_ai), BATCH_SIZE):
-            batch = files_for_ai[i:i + BATCH_SIZE]
-            batch_num = (i // BATCH_SIZE) + 1
-            total_batches = (len(files_for_ai) + BATCH_SIZE - 1) // BATCH_SIZE
-            
-            print(f"\n🔄 Processing batch {batch_num}/{total_batches} ({len(batch)} images)...")
-            
-            # Process batch with AI
-            ai_results = self._process_batch_with_ai(batch, source_folder)
-            
-            # Yield results for this batch
-            for file in batch:
+        if total == 0:
+            return
+        
+        print(f"\n📊 Processing {total} images, batches of {self.batch_sizer.next_size()} to start with")
+        print(f"🧠 Classifier: {self.model_name}, up to {self.max_in_flight} batches in flight")
+        
+        finished_count = 0
+        files_for_ai = []
+
+        # Generators are lazy: phase 2 only starts once phase 1 filled files_for_ai
+        phases = (
+            self.local_filter_generator(source_folder, files, final_dest_dir, rejected_dir, files_for_ai),
+            self.ai_sort_generator(source_folder, files_for_ai, final_dest_dir, rejected_dir)
+        )
+        for phase in phases:
+            for result in phase:
                 finished_count += 1
-                full_path = os.path.join(source_folder, file)
-                
-                if file in ai_results:
-                    decision, reason = ai_results[file]
-                else:
-                    decision, reason = "keep", "No AI response (Safe Keep)"
-                
-                dest_dir = rejected_dir if decision == "trash" else final_dest_dir
-                result = self._finalize(file, decision, reason, full_path, dest_dir)
-                
                 yield {
                     "current": finished_count,
                     "total": total,
                     "file": result['file'],
                     "decision": result['decision'],
                     "reason": result['reason'],
-                    "path": result['path']
+                    "path": result['path'],
+                    "digest": result['digest']
                 }
         
         print(f"\n✅ Completed processing {total} images")
@@ -0,0 +1,196 @@
+import os
+import io
+import json
+import hashlib
+import uuid
+import threading
+
+import PIL.Image
+
+from modules import quality_gate
+from modules.dedup import dhash_pixels, dhash_batch
+
+PROXY_SIZE = 400  # Longest side of the image sent to the AI
+PROXY_QUALITY = 40
+THUMB_SIZE = 320  # Longest side of the review grid preview
+THUMB_QUALITY = 70
+DIGEST_CHUNK = 1024 * 1024
+IMAGE_CACHE_MAX_BYTES = 2 * 1024 ** 3  # LRU limit for the whole cache (2 GB)
+IMAGE_CACHE_EVICT_STEP = 64 * 1024 ** 2  # Thumbnails made on request between two evictions
+
+def file_digest(file_path):
+    """SHA-1 of the file content"""
+    h = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _encode(img, size, quality):
+    small = img.copy()
+    if max(small.size) > size: small.thumbnail((size, size))
+    buf = io.BytesIO()
+    small.save(buf, format="WEBP", quality=quality)
+    return buf.getvalue()
+
+class ImageCache:
+    """
+    Everything derived from one decode of a photo, keyed by its content hash:
+    the local quality gate verdict, the AI proxy (WEBP) and a preview thumbnail.
+    Entries live in `<root>/<2 hex>/<digest>.*`, the .json file is written last
+    and marks an entry as complete.
+    """
+    def __init__(self, cache_root, max_bytes=IMAGE_CACHE_MAX_BYTES, evict_step=IMAGE_CACHE_EVICT_STEP):
+        self.root = cache_root
+        self.max_bytes = max_bytes
+        self.evict_step = evict_step
+        self.evict_lock = threading.Lock()
+        self.written_lock = threading.Lock()
+        self.written = 0  # Bytes of thumbnails made on request since the last eviction
+        if not os.path.exists(self.root): os.makedirs(self.root)
+
+    def _path(self, digest, suffix):
+        return os.path.join(self.root, digest[:2], f"{digest}.{suffix}")
+
+    def proxy_path(self, digest):
+        return self._path(digest, "proxy.webp")
+
+    def thumb_path(self, digest):
+        return self._path(digest, "thumb.webp")
+
+    def get(self, digest):
+        """Cached entry dict or None"""
+        try:
+            with open(self._path(digest, "json"), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # A verdict made with other gate settings or logic is recomputed
+        if entry.get("gate_params") != quality_gate.gate_params() or "dhash" not in entry:
+            return None
+        if not (os.path.exists(self.proxy_path(digest)) and os.path.exists(self.thumb_path(digest))):
+            return None
+        self._touch(digest)
+        return entry
+
+    def _touch(self, digest):
+        # LRU: eviction goes by the json / thumbnail mtime
+        for suffix in ("json", "thumb.webp"):
+            try:
+                os.utime(self._path(digest, suffix))
+            except OSError:
+                pass
+
+    def thumbnail(self, file_path=None, digest=None):
+        """
+        Path of the thumbnail for a content hash or a file, made on first request
+        if the analysis did not produce it. Returns (digest, path) or (None, None).
+        """
+        if digest and os.path.exists(self.thumb_path(digest)):
+            self._touch(digest)
+            return digest, self.thumb_path(digest)
+        if not file_path or not os.path.isfile(file_path):
+            return None, None
+
+        digest = file_digest(file_path)
+        thumb_path = self.thumb_path(digest)
+        if not os.path.exists(thumb_path):
+            with PIL.Image.open(file_path) as img:
+                img.draft('RGB', (THUMB_SIZE, THUMB_SIZE))
+                data = _encode(img.convert('RGB'), THUMB_SIZE, THUMB_QUALITY)
+            os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+            self._write(thumb_path, data)
+            self._count_written(len(data))
+        self._touch(digest)
+        return digest, thumb_path
+
+    def _count_written(self, size):
+        # Browsing without a job adds thumbnails too, the limit is checked every `evict_step` bytes
+        with self.written_lock:
+            self.written += size
+            if self.written < self.evict_step:
+                return
+            self.written = 0
+        self.evict()
+
+    def read_proxy(self, digest):
+        try:
+            with open(self.proxy_path(digest), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put(self, digest, gate, dhash, proxy_bytes, thumb_bytes):
+        os.makedirs(os.path.dirname(self._path(digest, "json")), exist_ok=True)
+        self._write(self.proxy_path(digest), proxy_bytes)
+        self._write(self.thumb_path(digest), thumb_bytes)
+        entry = {"digest": digest, "gate": list(gate), "gate_params": quality_gate.gate_params(), "dhash": dhash}
+        self._write(self._path(digest, "json"), json.dumps(entry).encode("utf-8"))
+        return entry
+
+    def evict(self):
+        """Drops least recently used entries until the cache fits in `max_bytes`"""
+        with self.evict_lock:
+            entries = {}  # digest -> [last use, size, paths]
+            total = 0
+            for sub in os.listdir(self.root):
+                sub_dir = os.path.join(self.root, sub)
+                if not os.path.isdir(sub_dir): continue
+                for name in os.listdir(sub_dir):
+                    path = os.path.join(sub_dir, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entry = entries.setdefault(name.split(".", 1)[0], [0, 0, []])
+                    entry[0] = max(entry[0], st.st_mtime)
+                    entry[1] += st.st_size
+                    entry[2].append(path)
+                    total += st.st_size
+
+            if total <= self.max_bytes:
+                return 0
+
+            removed = 0
+            for _, size, paths in sorted(entries.values(), key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                # json first, a half removed entry is then never used
+                for path in sorted(paths, key=lambda p: not p.endswith(".json")):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+                removed += 1
+            print(f"🧹 Image Cache: evicted {removed} images")
+            return removed
+
+def prepare_image(file_path, cache_root):
+    """
+    Single decode of a photo: quality gate verdict, perceptual hash, AI proxy
+    and thumbnail. Reuses the cached entry when the same content was seen before.
+    Module level so it can run in the quality gate process pool.
+    Returns {"digest", "gate", "dhash"}, digest is None if the file could not be read.
+    """
+    try:
+        cache = ImageCache(cache_root)
+        digest = file_digest(file_path)
+        entry = cache.get(digest)
+        if entry:
+            return {"digest": digest, "gate": tuple(entry["gate"]), "dhash": entry["dhash"]}
+
+        img, reduced = quality_gate.open_reduced(file_path, quality_gate.GATE_SCALE)
+        gate = quality_gate.gate_image(file_path, img, reduced)
+        dhash = dhash_batch([dhash_pixels(img)])[0]
+        cache.put(digest, gate, dhash, _encode(img, PROXY_SIZE, PROXY_QUALITY), _encode(img, THUMB_SIZE, THUMB_QUALITY))
+        return {"digest": digest, "gate": gate, "dhash": dhash}
+    except Exception as e:
+        print(f"Image Prep Error for {os.path.basename(file_path)}: {e}")
+        return {"digest": None, "gate": (False, None, None), "dhash": None}
@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import datetime
+import uuid
+from collections import deque
+
+MAX_CONCURRENT_JOBS = 2  # Jobs running at the same time (different projects)
+JOB_EVENTS_BUFFER = 5000  # Events kept per job for replay (ring buffer)
+MAX_FINISHED_JOBS = 50  # Finished jobs kept in memory for /jobs
+
+class Job:
+    def __init__(self, project_id, date_from, date_to):
+        self.id = uuid.uuid4().hex
+        self.project_id = project_id
+        self.date_from = date_from
+        self.date_to = date_to
+        self.status = "queued"  # queued -> running -> done / error / cancelled
+        self.created = datetime.datetime.now()
+        self.started = None
+        self.finished = None
+        self.error = None
+
+        self.events = deque(maxlen=JOB_EVENTS_BUFFER)  # (event_id, data)
+        self.last_event_id = 0
+        # Totals of the events the ring buffer already dropped, sent as a snapshot to clients behind it
+        self.dropped = {"last_id": 0, "total": 0, "processed": 0, "kept": 0, "trashed": 0, "links": []}
+        self.cond = threading.Condition()
+        self.listeners = set()  # (loop, asyncio.Event) of SSE streams waiting for news
+        self.cancel_event = threading.Event()
+
+    @property
+    def is_finished(self):
+        return self.status in ("done", "error", "cancelled")
+
+    def _drop(self, event_id, data):
+        dropped = self.dropped
+        dropped["last_id"] = event_id
+        event_type = data.get('type')
+        if event_type == 'set_total':
+            dropped["total"] += data.get('count', 0)
+        elif event_type == 'image_result':
+            dropped["processed"] += 1
+            dropped["kept" if data.get('decision') == 'keep' else "trashed"] += 1
+        elif event_type == 'link_result':
+            dropped["links"].append({"folder": data.get('folder'), "link": data.get('link')})
+
+    def publish(self, data):
+        with self.cond:
+            if len(self.events) == self.events.maxlen:
+                self._drop(*self.events[0])
+            self.last_event_id += 1
+            self.events.append((self.last_event_id, data))
+            self.cond.notify_all()
+            listeners = list(self.listeners)
+        for loop, event in listeners:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # Loop already closed (server shutting down)
+
+    def events_after(self, last_id):
+        """
+        Events newer than `last_id` still held by the ring buffer. If some of
+        them were dropped already, a `snapshot` event with the totals up to
+        the buffer start comes first (under the id of the last dropped one).
+        """
+        with self.cond:
+            events = [(eid, data) for eid, data in self.events if eid > last_id]
+            if last_id < self.dropped["last_id"]:
+                snapshot = {k: v for k, v in self.dropped.items() if k != "last_id"}
+                snapshot["links"] = list(snapshot["links"])
+                events.insert(0, (self.dropped["last_id"], {"type": "snapshot", **snapshot}))
+            return events
+
+    def wait_for_events(self, last_id, timeout):
+        """Blocks until there is something newer than `last_id` or the job ended"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.last_event_id > last_id or self.is_finished, timeout)
+
+    async def wait_for_events_async(self, last_id, timeout):
+        """wait_for_events for the event loop: awaits without holding a threadpool thread"""
+        listener = (asyncio.get_running_loop(), asyncio.Event())
+        with self.cond:
+            if self.last_event_id > last_id or self.is_finished:
+                return
+            self.listeners.add(listener)
+        try:
+            await asyncio.wait_for(listener[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.cond:
+                self.listeners.discard(listener)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "project_id": self.project_id,
+            "date_from": self.date_from,
+            "date_to": self.date_to,
+            "status": self.status,
+            "created": self.created.isoformat(timespec="seconds"),
+            "started": self.started.isoformat(timespec="seconds") if self.started else None,
+            "finished": self.finished.isoformat(timespec="seconds") if self.finished else None,
+            "error": self.error,
+            "last_event_id": self.last_event_id
+        }
+
+class JobManager:
+    """
+    Runs jobs in worker threads, independent of any HTTP connection.
+    `runner(project_id, date_from, date_to, cancel_event)` must yield event
+    dicts; they are stored in the job's ring buffer for (re)connecting clients.
+    Jobs of one project run one after another, different projects run in
+    parallel up to `max_concurrent`.
+    """
+    def __init__(self, runner, max_concurrent=MAX_CONCURRENT_JOBS):
+        self.runner = runner
+        self.slots = threading.Semaphore(max(1, int(max_concurrent)))
+        self.jobs = {}
+        self.project_locks = {}
+        self.lock = threading.Lock()
+
+    def submit(self, project_id, date_from, date_to):
+        job = Job(project_id, date_from, date_to)
+        with self.lock:
+            self.jobs[job.id] = job
+            project_lock = self.project_locks.setdefault(project_id, threading.Lock())
+            self._prune()
+        threading.Thread(target=self._run, args=(job, project_lock), daemon=True, name=f"job-{job.id[:8]}").start()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return [j.to_dict() for j in sorted(jobs, key=lambda j: j.created, reverse=True)]
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if not job or job.is_finished:
+            return False
+        job.cancel_event.set()
+        job.publish({'log': 'Anulowanie zadania...'})
+        return True
+
+    def _prune(self):
+        finished = sorted((j for j in self.jobs.values() if j.is_finished), key=lambda j: j.created)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job.id]
+
+    def _run(self, job, project_lock):
+        with project_lock, self.slots:
+            if job.cancel_event.is_set():
+                status = "cancelled"
+            else:
+                job.status = "running"
+                job.started = datetime.datetime.now()
+                try:
+                    for event in self.runner(job.project_id, job.date_from, job.date_to, job.cancel_event):
+                        if event.get('error'):
+                            job.error = event['error']
+                        job.publish(event)
+                except Exception as e:
+                    job.error = str(e)
+                    job.publish({'error': str(e)})
+
+                if job.cancel_event.is_set():
+                    status = "cancelled"
+                elif job.error:
+                    status = "error"
+                else:
+                    status = "done"
+
+            job.finished = datetime.datetime.now()
+            # Last event of every job, clients stop listening after it
+            job.publish({'type': 'job_end', 'status': status})
+            with job.cond:
+                job.status = status
+                job.cond.notify_all()
@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+
+import google.generativeai as genai
+
+from modules.rate_limiter import get_limiter
+from modules.classifiers import GeminiBackend, OnnxBackend, CascadeBackend, CLASSIFIER_MODES, CASCADE_THRESHOLD
+
+MODEL_CACHE_TTL_SECONDS = 24 * 3600  # Model list is checked again once a day
+DEFAULT_MODEL = 'gemini-1.5-flash-001'
+
+# Priority list - prefer flash models for speed and cost
+MODEL_PRIORITIES = [
+    'models/gemini-1.5-flash-001',
+    'models/gemini-1.5-flash',
+    'models/gemini-1.5-flash-latest',
+    'models/gemini-1.5-pro',
+    'models/gemini-pro-vision'
+]
+
+def key_id(api_key):
+    """Hash an API key is stored and compared by"""
+    return hashlib.sha1(api_key.encode("utf-8")).hexdigest()
+
+class ModelRegistry:
+    """
+    Process wide classifier backends, shared by every folder and job.
+    The Gemini model is picked once per API key and the choice is kept on
+    disk for MODEL_CACHE_TTL_SECONDS, so a restart does not list the models
+    again. Backends (Gemini client, ONNX session) are built once and reused.
+    """
+    def __init__(self, cache_path=None, ttl=MODEL_CACHE_TTL_SECONDS):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.models = self._load()  # key id -> {"model", "resolved_at", "lookup_seconds"}
+        self.configured_key = None
+        self.gemini_backends = {}  # key id -> GeminiBackend
+        self.local_backends = {}  # (model path, mtime) -> OnnxBackend
+
+    def _load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        if not self.cache_path:
+            return
+        tmp_path = f"{self.cache_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.models, f, indent=4)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"⚠️ Model Registry: cache not saved: {e}")
+
+    def _configure(self, api_key):
+        # genai keeps one global key; clients of another key would use the new one
+        if self.configured_key != api_key:
+            genai.configure(api_key=api_key)
+            self.configured_key = api_key
+            self.gemini_backends.clear()
+
+    def _list_best_model(self):
+        try:
+            print("\n🔍 Checking available Gemini models...")
+            available_models = []
+            for m in genai.list_models():
+                if 'generateContent' in m.supported_generation_methods:
+                    available_models.append(m.name)
+
+            for p in MODEL_PRIORITIES:
+                if p in available_models:
+                    print(f"✅ Selected Model: {p}")
+                    return p
+
+            for m in available_models:
+                if 'flash' in m: return m
+
+            if available_models: return available_models[0]
+
+        except Exception as e:
+            print(f"⚠️ Error listing models: {e}. Defaulting to '{DEFAULT_MODEL}'")
+            return None
+
+        return None
+
+    def resolve_model(self, api_key):
+        """Model name for the key, listed at most once per TTL"""
+        with self.lock:
+            return self._resolve_model(api_key)
+
+    def _resolve_model(self, api_key):
+        kid = key_id(api_key)
+        entry = self.models.get(kid)
+        if entry and time.time() - entry.get("resolved_at", 0) < self.ttl:
+            return entry["model"]
+
+        self._configure(api_key)
+        start = time.monotonic()
+        model_name = self._list_best_model()
+        if model_name is None:
+            # Not cached, the next job tries the listing again
+            return DEFAULT_MODEL
+        self.models[kid] = {
+            "model": model_name,
+            "resolved_at": time.time(),
+            "lookup_seconds": round(time.monotonic() - start, 2)
+        }
+        self._save()
+        return model_name
+
+    def gemini(self, api_key, rate_limits):
+        """Warm GeminiBackend of the key, its limiter updated to `rate_limits` ({"rpm", "tpm"})"""
+        kid = key_id(api_key)
+        # One limiter per key for the whole app, so parallel jobs share the quota
+        rate_limiter = get_limiter(kid, rate_limits["rpm"], rate_limits["tpm"])
+        with self.lock:
+            self._configure(api_key)
+            model_name = self._resolve_model(api_key)
+            backend = self.gemini_backends.get(kid)
+            if backend is None or backend.model_name != model_name:
+                backend = GeminiBackend(genai.GenerativeModel(model_name), model_name, rate_limiter)
+                self.gemini_backends[kid] = backend
+            return backend
+
+    def local(self, model_path):
+        """OnnxBackend of the model file, loaded again only when the file changes"""
+        try:
+            key = (os.path.abspath(model_path), os.path.getmtime(model_path))
+        except (TypeError, OSError):
+            raise RuntimeError(f"Local model not found: {model_path}")
+        with self.lock:
+            backend = self.local_backends.get(key)
+            if backend is None:
+                backend = OnnxBackend(model_path)
+                self.local_backends = {key: backend}  # Older versions of the file are dropped
+            return backend
+
+    def classifier(self, api_key, options, rate_limits):
+        """Backend for the classifier settings (mode, model_path, threshold)"""
+        options = options or {}
+        mode = options.get("mode") or "gemini"
+        if mode not in CLASSIFIER_MODES:
+            raise ValueError(f"Unknown classifier mode: {mode}")
+        if mode == "gemini":
+            return self.gemini(api_key, rate_limits)
+        local = self.local(options.get("model_path"))
+        if mode == "local":
+            return local
+        return CascadeBackend(local, self.gemini(api_key, rate_limits), float(options.get("threshold") or CASCADE_THRESHOLD))
+
+    def warm_up(self, api_key, rate_limits):
+        """Builds the Gemini client ahead of the first job, logs the time saved by the cache"""
+        kid = key_id(api_key)
+        entry = self.models.get(kid)
+        cached = bool(entry) and time.time() - entry.get("resolved_at", 0) < self.ttl
+        start = time.monotonic()
+        backend = self.gemini(api_key, rate_limits)
+        elapsed = time.monotonic() - start
+        if cached:
+            print(f"⚡ Model Registry: {backend.model_name} from cache in {elapsed:.2f}s "
+                  f"(listing took {entry.get('lookup_seconds', 0):.2f}s, skipped)")
+        else:
+            print(f"🔍 Model Registry: {backend.model_name} resolved in {elapsed:.2f}s")
+        return backend
+
+_default_registry = None
+_default_lock = threading.Lock()
+
+def get_registry():
+    """Memory only registry for analyzers created without one"""
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = ModelRegistry()
+        return _default_registry
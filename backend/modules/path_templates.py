@@ -0,0 +1,107 @@
+import calendar
+import datetime
+import functools
+import re
+
+TEMPLATE_CACHE_SIZE = 1024  # Compiled templates kept per process
+TOKEN_RE = re.compile(r"\{([^{}]+)\}")
+
+# --- Periods: (first day, last day) of the folder a date falls into ---
+def _year(d):
+    return datetime.date(d.year, 1, 1), datetime.date(d.year, 12, 31)
+
+def _quarter(d):
+    first_month = (d.month - 1) // 3 * 3 + 1
+    last_month = first_month + 2
+    return datetime.date(d.year, first_month, 1), datetime.date(d.year, last_month, calendar.monthrange(d.year, last_month)[1])
+
+def _month(d):
+    return d.replace(day=1), d.replace(day=calendar.monthrange(d.year, d.month)[1])
+
+def _week_of_month(d):
+    # w1 = days 1-7, w2 = 8-14 ... w5 = 29 to month end
+    start = d.replace(day=(d.day - 1) // 7 * 7 + 1)
+    return start, min(start + datetime.timedelta(days=6), _month(d)[1])
+
+def _iso_week(d):
+    start = d - datetime.timedelta(days=d.weekday())
+    return start, start + datetime.timedelta(days=6)
+
+def _day(d):
+    return d, d
+
+# {token}: (value for a date, period the value stays the same for)
+TOKENS = {
+    "yyyy": (lambda d: f"{d.year:04d}", _year),
+    "yy": (lambda d: f"{d.year % 100:02d}", _year),
+    "quarter": (lambda d: f"q{(d.month - 1) // 3 + 1}", _quarter),
+    "MM": (lambda d: f"{d.month:02d}", _month),
+    "yyyy-MM": (lambda d: f"{d.year:04d}-{d.month:02d}", _month),
+    "week": (lambda d: f"w{(d.day - 1) // 7 + 1}", _week_of_month),
+    "ww": (lambda d: f"{d.isocalendar()[1]:02d}", _iso_week),
+    "iso-week": (lambda d: "{0:04d}-W{1:02d}".format(*d.isocalendar()[:2]), _iso_week),  # ISO year, e.g. 2025-W01 for 2024-12-30
+    "dd": (lambda d: f"{d.day:02d}", _day),
+    "yyyy-MM-dd": (lambda d: d.isoformat(), _day),
+}
+
+class PathTemplate:
+    """
+    Remote path template parsed once into literal parts and token functions,
+    e.g. "/{yyyy}/{quarter}/ABC/{yyyy-MM}/foto". Unknown tokens raise ValueError.
+    """
+    def __init__(self, template):
+        self.template = template
+        self.parts = []  # str or (value function, period function)
+        pos = 0
+        for m in TOKEN_RE.finditer(template):
+            if m.group(1) not in TOKENS:
+                raise ValueError(f"Nieznany znacznik ścieżki: {m.group(0)}")
+            if m.start() > pos:
+                self.parts.append(template[pos:m.start()])
+            self.parts.append(TOKENS[m.group(1)])
+            pos = m.end()
+        if pos < len(template):
+            self.parts.append(template[pos:])
+        self.periods = list({id(p[1]): p[1] for p in self.parts if not isinstance(p, str)}.values())
+
+    def render(self, d):
+        return "".join(p if isinstance(p, str) else p[0](d) for p in self.parts)
+
+    def period(self, d):
+        """First and last day rendering to the same path as `d`, (None, None) without tokens"""
+        if not self.periods:
+            return None, None
+        bounds = [f(d) for f in self.periods]
+        return max(b[0] for b in bounds), min(b[1] for b in bounds)
+
+    def expand(self, date_from, date_to):
+        """
+        Yields (path, last day of its period) for every folder overlapping
+        the range. One step per folder, not per day or month: a yearly
+        folder is rendered once, a daily one once for each day.
+        """
+        d = date_from
+        while d <= date_to:
+            _, end = self.period(d)
+            yield self.render(d), end
+            if end is None:
+                return
+            d = end + datetime.timedelta(days=1)
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(template):
+    return PathTemplate(template)
+
+def expand_paths(templates, date_from, date_to):
+    """
+    Expands templates over a date range (dates or datetimes).
+    Returns {remote_path: last day of its period}, None for paths without tokens.
+    """
+    if isinstance(date_from, datetime.datetime): date_from = date_from.date()
+    if isinstance(date_to, datetime.datetime): date_to = date_to.date()
+    paths = {}
+    for template in templates:
+        for path, end in compile_template(template).expand(date_from, date_to):
+            if path not in paths or (end is not None and paths[path] is not None and end > paths[path]):
+                paths[path] = end
+    return paths
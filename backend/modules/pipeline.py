@@ -0,0 +1,485 @@
+import os
+import queue
+import threading
+import datetime
+import itertools
+
+from modules.image_analyzer import ImageAnalyzer
+from modules.s3_manager import S3Manager
+from modules.zip_stream import StreamingZip
+from modules.file_placement import FilePlacer, PLACEMENT_METHODS
+
+PIPELINE_QUEUE_SIZE = 2  # Folders allowed to wait between two stages
+STREAM_CHUNK_SIZE = 32  # Files handed on at once at most (one quality gate round)
+STREAM_IDLE_SECONDS = 0.5  # A waiting stage wakes up this often to report finished AI batches
+STAGE_ERROR_LABELS = {"download": "pobierania", "zip": "ZIP", "upload": "wysyłania na S3"}  # "Błąd ..." in logs
+
+_END = object()  # Stage queue terminator
+
+class _FileStream:
+    """Files of one folder handed from a stage to the next one while they arrive"""
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def append(self, name):
+        self.queue.put(name)
+
+    def close(self):
+        self.queue.put(_END)
+
+    def chunks(self, max_size=STREAM_CHUNK_SIZE, idle=STREAM_IDLE_SECONDS):
+        """
+        Yields lists of the files that came in (up to `max_size`, waits for
+        at least one) until the stream is closed, [] after `idle` seconds
+        without any so the reader can do other work.
+        """
+        while True:
+            try:
+                name = self.queue.get(timeout=idle)
+            except queue.Empty:
+                yield []
+                continue
+            chunk = []
+            while name is not _END:
+                chunk.append(name)
+                if len(chunk) >= max_size:
+                    break
+                try:
+                    name = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if chunk:
+                yield chunk
+            if name is _END:
+                return
+
+class FolderPipeline:
+    """
+    Runs the per-folder steps of a job as stages connected by bounded queues:
+    download -> local filter -> AI -> ZIP -> upload.
+    Every stage has its own thread and handles one folder at a time, so the
+    stages of different folders overlap (folder B downloads while folder A
+    is in AI). Download, filter and AI also overlap on the same folder:
+    those stages pass the folder on at once and then stream its files to
+    the next one, so the first images are judged while the rest download.
+    Progress is collected as event dicts tagged with the folder.
+    """
+    def __init__(self, proj, ftp, gemini_key, aws_config, work_dirs, date_from, date_to, cancel_event=None, analyzer_options=None):
+        self.proj = proj
+        self.ftp = ftp
+        self.gemini_key = gemini_key
+        self.aws = aws_config or {}
+        aws = self.aws
+        self.s3_enabled = bool(aws.get('access_key') and aws.get('secret_key') and aws.get('bucket_name'))
+        # ZIP bytes go straight into an S3 multipart upload, local copy only on request
+        self.stream_upload = self.s3_enabled and bool(aws.get('stream_upload'))
+        self.dirs = work_dirs  # temp_download, temp_sorted, trash_root, zip_dest
+        self.date_from = date_from
+        self.date_to = date_to
+        self.cancel_event = cancel_event or threading.Event()
+        # ImageAnalyzer kwargs: image_cache, verdict_cache, rate_limits, classifier, registry
+        self.analyzer_options = analyzer_options or {}
+        classifier = self.analyzer_options.get('classifier') or {}
+        # A local model classifies without a Gemini key
+        self.ai_enabled = bool(gemini_key) or classifier.get('mode') == 'local'
+
+        d_from = datetime.datetime.strptime(date_from, "%Y-%m-%d").date()
+        d_to = datetime.datetime.strptime(date_to, "%Y-%m-%d").date()
+        self.dt_from = datetime.datetime.combine(d_from, datetime.time.min)
+        self.dt_to = datetime.datetime.combine(d_to, datetime.time.max)
+
+        self.events = queue.Queue()
+        self.report_lines = []
+        self.s3_links = []
+
+        self.analyzer = None
+        self.analyzer_error = None  # Classifier could not be built (e.g. local model missing)
+        self.analyzer_lock = threading.Lock()
+        self.results_lock = threading.Lock()
+        # Sorted copies as reflinks, hardlinks only in the internal sorted folder; shared by all folders
+        self.placer = FilePlacer(link_dirs=[work_dirs['temp_sorted']])
+
+    # --- Helpers ---
+    def _emit(self, item, event):
+        event.setdefault('folder', item['name'])
+        self.events.put(event)
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def _get_analyzer(self):
+        # One analyzer per job, created by whichever stage needs it first.
+        # If that fails, every later call raises the same error without retrying
+        with self.analyzer_lock:
+            if self.analyzer is None and self.analyzer_error is None:
+                try:
+                    self.analyzer = ImageAnalyzer(self.gemini_key, placer=self.placer, **self.analyzer_options)
+                except Exception as e:
+                    self.analyzer_error = e
+            if self.analyzer_error is not None:
+                raise self.analyzer_error
+            return self.analyzer
+
+    def _make_item(self, index, f_def, is_single_mode):
+        # 1. RESOLVE NAME
+        f_name = f_def.get('name', '').strip()
+        f_id = f_def['id']
+
+        # Fallback name logic matches UI
+        if not f_name: f_name = f"Folder_{f_id[:4]}"
+
+        # Safe FS Name
+        safe_f_name = "".join([c for c in f_name if c.isalpha() or c.isdigit() or c in (' ', '-', '_')]).strip()
+        if not safe_f_name: safe_f_name = f"Folder_{f_id[:4]}"
+
+        # 2. SETUP PATHS
+        if is_single_mode:
+            # Single mode: Use roots directly to detect 'project' files at top level
+            dl_target = self.dirs['temp_download']
+            sorted_target = self.dirs['temp_sorted']
+            trash_target = self.dirs['trash_root']
+            zip_basename = self.proj['name']
+        else:
+            # Multi mode: Subfolders
+            dl_target = os.path.join(self.dirs['temp_download'], safe_f_name)
+            sorted_target = os.path.join(self.dirs['temp_sorted'], safe_f_name)
+            trash_target = os.path.join(self.dirs['trash_root'], safe_f_name)
+            zip_basename = f"{self.proj['name']} {safe_f_name}"
+
+        return {
+            "index": index,
+            "def": f_def,
+            "name": f_name,
+            "dl_target": dl_target,
+            "sorted_target": sorted_target,
+            "trash_target": trash_target,
+            "zip_filename": f"{zip_basename} {self.date_from}_{self.date_to}.zip",
+            "d_dir": None,
+            "count": 0,
+            "kept": 0,
+            "processed": 0,
+            "downloads": _FileStream(),  # Downloaded files, names relative to dl_target
+            "for_ai": _FileStream(),  # Files the local filter passed on
+            "report": None,
+            "ai_failed": False,
+            "done": False,   # Nothing left to do for later stages
+            "archive": None,  # StreamingZip, filled as images are kept
+            "streamed": False,  # Archive uploaded to S3 while it was written
+            "content_digest": None,  # Of the archived images, to skip identical uploads
+            "zip_path": None
+        }
+
+    def _archive(self, item, file_path, digest=None):
+        """Appends a kept image to the folder's ZIP, the archive is opened on the first one"""
+        rel_path = os.path.relpath(file_path, item['sorted_target'])
+        if rel_path.startswith(os.pardir):
+            return  # Not placed in the sorted folder (move error)
+        if item['archive'] is None:
+            item['archive'] = self._open_archive(item)
+        item['archive'].add(file_path, rel_path, digest)
+
+    def _open_archive(self, item):
+        zip_path = os.path.join(self.dirs['zip_dest'], item['zip_filename'])
+        if not self.stream_upload:
+            # Digest of the photos lets the upload skip an archive S3 already has
+            return StreamingZip(zip_path, track_digests=self.s3_enabled)
+        stream = self._s3_manager().open_stream(item['zip_filename'], progress_callback=self._upload_progress(item))
+        item['streamed'] = True
+        return StreamingZip(zip_path if self.aws.get('keep_local_zip') else None, stream=stream)
+
+    def _s3_manager(self):
+        aws = self.aws
+        return S3Manager(
+            aws['access_key'], aws['secret_key'], aws.get('region'), aws['bucket_name'],
+            part_size_mb=aws.get('part_size_mb'), max_concurrency=aws.get('max_concurrency'),
+            endpoint_url=aws.get('endpoint_url')
+        )
+
+    def _upload_progress(self, item):
+        def on_progress(sent, total):
+            # total is None while a streamed ZIP is still growing
+            self._emit(item, {'type': 'upload_progress', 'sent': sent, 'total': total,
+                              'percent': round(sent * 100 / total) if total else None})
+        return on_progress
+
+    def _image_event(self, item, res):
+        with self.results_lock:  # Filter and AI stages report results of the same folder
+            item['processed'] += 1
+            if res['decision'] == 'keep':
+                item['kept'] += 1
+                self._archive(item, res['path'], res.get('digest'))
+            current = item['processed']
+        return {
+            "type": "image_result",
+            "file": res['file'],
+            "decision": res['decision'],
+            "path": res['path'],
+            "hash": res.get('digest'),
+            "current": current,
+            "total": item['count']
+        }
+
+    # --- Stages ---
+    def _download_stage(self, item):
+        f_name = item['name']
+        self._emit(item, {'log': f'Pobieranie plików: {f_name}...'})
+
+        # Adapter for this specific folder paths
+        f_adapter = { "Name": f_name, "RemoteSpecs": item['def']['paths'] }
+
+        def on_progress(done, total, local_path):
+            self._emit(item, {'type': 'download_progress', 'current': done, 'total': total})
+
+        plan = self.ftp.plan_job_files(
+            f_adapter, self.dt_from, self.dt_to, self.dirs['temp_download'], explicit_target_dir=item['dl_target']
+        )
+        d_dir, download_tasks, cached_files = plan
+        cached_count = len(cached_files)
+        if cached_count:
+            self._emit(item, {'log': f'Cache FTP: {cached_count} plików bez pobierania.'})
+        indexed = self.ftp.last_stats.get('indexed', 0)
+        if indexed:
+            self._emit(item, {'log': f'Indeks FTP: {indexed} katalogów bez listowania.'})
+        dead_paths = self.ftp.last_stats.get('dead_paths', 0)
+        if dead_paths:
+            self._emit(item, {'log': f'Ścieżki FTP: {dead_paths} nieistniejących wariantów pominiętych bez sprawdzania.'})
+
+        # Notify Frontend: Set Total (added to the job total, corrected below if downloads fail)
+        planned = len(download_tasks) + cached_count
+        if planned:
+            item['count'] = planned
+            self._emit(item, {'type': 'set_total', 'count': planned})
+
+        # Each file goes to the filter stage as soon as it is on disk
+        arrived = 0
+        for local_path in self.ftp.iter_job_files(*plan, progress_callback=on_progress):
+            item['downloads'].append(os.path.relpath(local_path, d_dir))
+            arrived += 1
+            if self.cancelled(): return
+
+        if arrived < planned:
+            item['count'] = arrived
+            self._emit(item, {'type': 'set_total', 'count': arrived - planned})
+
+        if arrived == 0:
+            self._emit(item, {'log': f'Brak plików na FTP: {f_name}.'})
+            item['report'] = f"Folder {f_name}: Brak plików."
+            item['done'] = True
+            return
+
+        item['d_dir'] = d_dir
+
+    def _filter_stage(self, item):
+        f_name = item['name']
+        chunks = item['downloads'].chunks()
+        first = next((files for files in chunks if files), None)
+        if first is None:
+            return  # Nothing downloaded
+
+        if not self.ai_enabled:
+            self._emit(item, {'log': f'Kopiowanie (bez AI): {f_name}...'})
+            placed = self._copy_all(item, itertools.chain([first], chunks))
+            if placed is None: return
+            item['report'] = f"Folder {f_name}: {placed} pobranych (Bez AI)."
+            return
+
+        self._emit(item, {'log': f'Analiza AI: {f_name}...'})
+        try:
+            analyzer = self._get_analyzer()
+        except Exception as e:
+            # Fail open like the AI errors: the whole folder is kept, unsorted
+            err_msg = f"Błąd AI ({f_name}): {str(e)}"
+            self._emit(item, {'log': f'{err_msg}. Kopiowanie bez analizy...'})
+            placed = self._copy_all(item, itertools.chain([first], chunks))
+            if placed is None: return
+            item['report'] = f"Folder {f_name}: {err_msg}. Zachowano {placed} zdjęć bez analizy."
+            return
+        analyzer.prepare_dirs(item['dl_target'], item['sorted_target'], item['trash_target'])
+        for res in analyzer.local_filter_stream(item['dl_target'], itertools.chain([first], chunks), item['sorted_target'], item['trash_target'], item['for_ai']):
+            self._emit(item, self._image_event(item, res))
+            if self.cancelled(): return
+
+    def _copy_all(self, item, chunks):
+        """No AI: every downloaded file goes to the sorted folder and the ZIP, returns the count (None if cancelled)"""
+        placed = 0
+        for files in chunks:
+            if self.cancelled(): return None
+            for file in files:
+                dest_path = os.path.join(item['sorted_target'], file)
+                os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+                self.placer.place(os.path.join(item['dl_target'], file), dest_path)
+                self._archive(item, dest_path)
+                placed += 1
+        item['kept'] = placed
+        return placed
+
+    def _ai_stage(self, item):
+        if not self.ai_enabled:
+            return
+        f_name = item['name']
+        try:
+            analyzer = self._get_analyzer()
+        except Exception:
+            # The filter stage reports it and copies the folder; ZIP waits until it is done
+            for _ in item['for_ai'].chunks(): pass
+            return
+        # Batches fill while the filter still passes files on
+        for res in analyzer.ai_stream_generator(item['dl_target'], item['for_ai'].chunks(), item['sorted_target'], item['trash_target']):
+            self._emit(item, self._image_event(item, res))
+            if self.cancelled(): return
+        if item['done'] or item['ai_failed']:
+            return  # Nothing downloaded, or the filter failed and reported it
+
+        stats = analyzer.last_stats
+        if stats.get('cache_hits'):
+            self._emit(item, {'log': f"Cache decyzji AI: {stats['cache_hits']} zdjęć bez ponownej analizy."})
+        if stats.get('duplicates'):
+            self._emit(item, {'log': f"Duplikaty: {stats['duplicates']} zdjęć bez AI, zaoszczędzono {stats['api_calls_saved']} zapytań."})
+        if stats.get('local_decided'):
+            self._emit(item, {'log': f"Model lokalny: {stats['local_decided']} zdjęć rozstrzygniętych offline."})
+        if stats.get('batch_sizes'):
+            avg_seconds = sum(stats['batch_seconds']) / len(stats['batch_seconds'])
+            self._emit(item, {'log': f"Partie AI: {stats['batch_sizes']} zdjęć, średnio {avg_seconds:.1f}s."})
+        self._emit(item, {'type': 'analysis_stats', **stats})
+
+        item['report'] = f"Folder {f_name}: Pobrani {item['count']}, Wybrano {item['kept']}."
+        self._emit(item, {'log': f'Zakończono analizę {f_name}.'})
+
+    def _zip_stage(self, item):
+        # Kept images were appended during the analysis, only the writer's tail is left
+        archive = item['archive']
+        if archive is None or not archive.names:
+            if archive: archive.abort()
+            item['done'] = True
+            return
+
+        self._emit(item, {'type': 'upload_start'})
+        self._emit(item, {'log': f"Zamykanie ZIP: {item['zip_filename']}..."})
+        item['zip_path'] = archive.close()
+        item['content_digest'] = archive.content_digest
+        where = "wysłany na S3" if item['streamed'] else "gotowy"
+        self._emit(item, {'log': f"ZIP {where}: {archive.count} plików, {archive.bytes_written / 1024 ** 2:.1f} MB."})
+
+    def _upload_stage(self, item):
+        f_name = item['name']
+        if not self.s3_enabled:
+            self._emit(item, {'log': 'Pominięto S3 (brak konfiguracji).'})
+            return
+
+        s3_mgr = self._s3_manager()
+        if item['streamed']:
+            # Already uploaded by the ZIP writer
+            link = s3_mgr.generate_link(item['zip_filename'])
+        elif s3_mgr.has_identical(item['zip_filename'], item['content_digest']):
+            # Same photos as the archive already in the bucket (re-run of a report)
+            self._emit(item, {'log': 'S3: identyczny ZIP już wysłany, nowy link bez uploadu.'})
+            link = s3_mgr.generate_link(item['zip_filename'])
+        else:
+            self._emit(item, {'log': 'Wysyłanie na S3...'})
+            link = s3_mgr.upload_and_generate_link(
+                item['zip_path'], item['zip_filename'],
+                progress_callback=self._upload_progress(item), content_digest=item['content_digest']
+            )
+
+        self._emit(item, {'log': f'Gotowe! Link dla {f_name}.'})
+        self._emit(item, {'type': 'link_result', 'link': link})
+        self.s3_links.append(link)
+
+    # --- Runner ---
+    def _run_stage(self, name, func, inbox, outbox, stream=None):
+        """`stream`: key of the item's _FileStream this stage fills, the next stage gets the item right away"""
+        while True:
+            item = inbox.get()
+            if item is _END:
+                outbox.put(_END)
+                return
+
+            if stream:
+                outbox.put(item)
+
+            if self.cancelled():
+                # Drain remaining folders without doing any more work
+                item['done'] = True
+
+            if not item['done']:
+                try:
+                    func(item)
+                except Exception as e:
+                    f_name = item['name']
+                    if name in ('filter', 'ai'):
+                        err_msg = f"Błąd AI ({f_name}): {str(e)}"
+                        self._emit(item, {'log': err_msg})
+                        item['report'] = f"Folder {f_name}: {err_msg}"
+                        item['ai_failed'] = True
+                        # Whatever got sorted so far still goes to ZIP
+                    else:
+                        err_msg = f"Błąd {STAGE_ERROR_LABELS.get(name, name)} ({f_name}): {str(e)}"
+                        self._emit(item, {'log': err_msg})
+                        item['report'] = f"Folder {f_name}: {err_msg}"
+                        item['done'] = True
+            if stream:
+                item[stream].close()  # After the flags above, the reader checks them once the stream ends
+
+            if name == 'upload' and item['report']:
+                # Last stage sees folders in order -> report keeps structure order
+                self.report_lines.append(item['report'])
+            if not stream:
+                outbox.put(item)
+
+    def run(self, structure_list):
+        """Starts the stages and yields event dicts until every folder went through"""
+        is_single_folder = (len(structure_list) == 1)
+
+        stages = [
+            ("download", self._download_stage, "downloads"),
+            # Without AI the filter stage is the copy loop, ZIP waits for all of it
+            ("filter", self._filter_stage, "for_ai" if self.ai_enabled else None),
+            ("ai", self._ai_stage, None),
+            ("zip", self._zip_stage, None),
+            ("upload", self._upload_stage, None),
+        ]
+
+        inbox = queue.Queue()
+        items = [self._make_item(idx, f_def, is_single_folder) for idx, f_def in enumerate(structure_list)]
+        for item in items:
+            inbox.put(item)
+        inbox.put(_END)
+
+        finished = _FinishedSink(self.events)
+        threads = []
+        for i, (name, func, stream) in enumerate(stages):
+            outbox = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE) if i < len(stages) - 1 else finished
+            t = threading.Thread(target=self._run_stage, args=(name, func, inbox, outbox, stream), daemon=True, name=f"pipeline-{name}")
+            t.start()
+            threads.append(t)
+            inbox = outbox
+
+        while True:
+            event = self.events.get()
+            if event is _END:
+                break
+            yield event
+
+        for t in threads:
+            t.join()
+
+        stats = self.placer.snapshot()
+        if stats['bytes_placed']:
+            methods = ", ".join(f"{m}: {stats[m]}" for m in PLACEMENT_METHODS if stats[m])
+            yield {'log': f"Sortowanie plików: zapisano {stats['bytes_written'] / 1024 ** 2:.1f} MB "
+                          f"z {stats['bytes_placed'] / 1024 ** 2:.1f} MB ({methods})."}
+            yield {'type': 'placement_stats', **stats}
+
+        # Cancelled or failed folders: drop their unfinished archives
+        for item in items:
+            if item['archive']:
+                item['archive'].abort()
+
+class _FinishedSink:
+    """Outbox of the last stage: only forwards the terminator to the event queue"""
+    def __init__(self, events):
+        self.events = events
+
+    def put(self, item):
+        if item is _END:
+            self.events.put(_END)
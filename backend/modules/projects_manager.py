@@ -1,36 +1,108 @@
+import copy
 import json
 import os
+import threading
+import uuid
 
 PROJECTS_FILE = "projects.json"
 
+class ProjectStore:
+    """
+    projects.json held in memory: the list in file order plus an index by id.
+    The file is parsed again only when its mtime or size changes (e.g. edited
+    by hand). Writes happen under a lock and go to a temp file that replaces
+    projects.json, so a reader never sees half a file and parallel saves
+    do not lose each other's changes.
+    Callers get deep copies, changing them does not touch the store.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.projects = []
+        self.index = {}  # id -> project dict
+        self.stamp = None  # (mtime_ns, size) of the file the index was built from
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _refresh(self):
+        stamp = self._file_stamp()
+        if stamp == self.stamp:
+            return
+        projects = []
+        if stamp is not None:
+            try:
+                with open(self.path, "r", encoding='utf-8') as f:
+                    projects = json.load(f)
+            except (OSError, ValueError) as e:
+                # Being edited right now: keep what we have, try again next time
+                print(f"⚠️ Projects: cannot read {self.path}: {e}")
+                return
+        self.projects = projects
+        self.index = {p['id']: p for p in projects if 'id' in p}
+        self.stamp = stamp
+
+    def _write(self):
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "w", encoding='utf-8') as f:
+                json.dump(self.projects, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            self.stamp = None  # Memory is ahead of the file: reload it on the next access
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+        self.stamp = self._file_stamp()
+
+    def all(self):
+        with self.lock:
+            self._refresh()
+            return copy.deepcopy(self.projects)
+
+    def get(self, project_id):
+        with self.lock:
+            self._refresh()
+            return copy.deepcopy(self.index.get(project_id))
+
+    def save(self, project_data):
+        project_data = copy.deepcopy(project_data)
+        with self.lock:
+            self._refresh()
+            existing_idx = next((i for i, p in enumerate(self.projects) if p.get('id') == project_data['id']), -1)
+            if existing_idx >= 0:
+                self.projects[existing_idx] = project_data
+            else:
+                self.projects.append(project_data)
+            self.index[project_data['id']] = project_data
+            self._write()
+
+    def delete(self, project_id):
+        with self.lock:
+            self._refresh()
+            if self.index.pop(project_id, None) is None:
+                return
+            self.projects = [p for p in self.projects if p.get('id') != project_id]
+            self._write()
+
+_store = ProjectStore(PROJECTS_FILE)
+
 class ProjectsManager:
     @staticmethod
     def load_projects():
-        if os.path.exists(PROJECTS_FILE):
-            try:
-                with open(PROJECTS_FILE, "r", encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return []
-        return []
+        return _store.all()
+
+    @staticmethod
+    def get_project(project_id):
+        return _store.get(project_id)
 
     @staticmethod
     def save_project(project_data):
-        projects = ProjectsManager.load_projects()
-        # Check if update or new
-        existing_idx = next((i for i, p in enumerate(projects) if p['id'] == project_data['id']), -1)
-        
-        if existing_idx >= 0:
-            projects[existing_idx] = project_data
-        else:
-            projects.append(project_data)
-            
-        with open(PROJECTS_FILE, "w", encoding='utf-8') as f:
-            json.dump(projects, f, indent=4, ensure_ascii=False)
+        _store.save(project_data)
 
     @staticmethod
     def delete_project(project_id):
-        projects = ProjectsManager.load_projects()
-        projects = [p for p in projects if p['id'] != project_id]
-        with open(PROJECTS_FILE, "w", encoding='utf-8') as f:
-            json.dump(projects, f, indent=4, ensure_ascii=False)
+        _store.delete(project_id)
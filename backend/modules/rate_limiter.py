@@ -0,0 +1,92 @@
+import time
+import random
+import threading
+
+BACKOFF_BASE_SECONDS = 2.0  # First pause after a 429
+BACKOFF_MAX_SECONDS = 60.0
+
+class RateLimiter:
+    """
+    Token buckets for requests/minute and tokens/minute, shared by every
+    thread that calls the same API key. `acquire` blocks until both buckets
+    allow the request. After a 429 the whole limiter pauses with exponential
+    backoff plus jitter; a successful call resets the backoff.
+    """
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.cond = threading.Condition()
+        self.rpm = max(1, int(requests_per_minute))
+        self.tpm = max(1, int(tokens_per_minute))
+        # Request bucket holds a single request: calls are spaced evenly
+        # (60 / rpm apart) and only overlap while they are in flight
+        self.request_level = 1.0
+        self.token_level = float(self.tpm)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.backoff_level = 0
+
+    def configure(self, requests_per_minute, tokens_per_minute):
+        with self.cond:
+            self._refill()
+            self.rpm = max(1, int(requests_per_minute))
+            self.tpm = max(1, int(tokens_per_minute))
+            self.token_level = min(self.token_level, self.tpm)
+            self.cond.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        self.request_level = min(1.0, self.request_level + elapsed * self.rpm / 60.0)
+        self.token_level = min(self.tpm, self.token_level + elapsed * self.tpm / 60.0)
+
+    def acquire(self, tokens=0):
+        """Blocks until a request of `tokens` estimated tokens may be sent, returns the wait"""
+        start = time.monotonic()
+        with self.cond:
+            while True:
+                self._refill()
+                tokens_needed = min(tokens, self.tpm)  # Bigger than a minute's worth: wait for a full bucket
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.request_level >= 1 and self.token_level >= tokens_needed:
+                    self.request_level -= 1
+                    self.token_level -= tokens_needed
+                    return now - start
+                else:
+                    wait = max((1 - self.request_level) * 60.0 / self.rpm,
+                               (tokens_needed - self.token_level) * 60.0 / self.tpm, 0.05)
+                self.cond.wait(wait)
+
+    def adjust_tokens(self, delta):
+        """Corrects the token bucket once the real usage of a request is known"""
+        with self.cond:
+            self._refill()
+            self.token_level = min(self.tpm, self.token_level - delta)
+
+    def on_rate_limited(self):
+        """Pauses all callers after a 429, returns the pause in seconds"""
+        with self.cond:
+            delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** self.backoff_level)
+            delay = delay / 2 + random.uniform(0, delay / 2)  # Jitter: callers don't retry in lockstep
+            self.backoff_level += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.request_level = 0.0
+            return delay
+
+    def on_success(self):
+        with self.cond:
+            self.backoff_level = 0
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(key, requests_per_minute, tokens_per_minute):
+    """Process wide limiter for `key` (e.g. the API key), updated to the given limits"""
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(requests_per_minute, tokens_per_minute)
+        elif (limiter.rpm, limiter.tpm) != (max(1, int(requests_per_minute)), max(1, int(tokens_per_minute))):
+            limiter.configure(requests_per_minute, tokens_per_minute)
+        return limiter
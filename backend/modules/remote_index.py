@@ -0,0 +1,201 @@
+import sqlite3
+import threading
+import datetime
+
+from modules.path_templates import expand_paths
+
+REMOTE_INDEX_INTERVAL_SECONDS = 15 * 60  # Background crawl period
+REMOTE_INDEX_MONTHS = 13  # Months back (with the current one) kept current by the crawler
+
+class RemoteIndex:
+    """
+    Local copy of the remote folders of all projects: one row per directory
+    (its mtime when listed, missing or not) and one per file with the date
+    the run filters on, so a date range is an indexed query instead of a
+    cwd + listing per folder. FTPManager.sync_index keeps it current.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS dirs (
+                    path TEXT PRIMARY KEY,
+                    present INTEGER NOT NULL,
+                    modify TEXT,
+                    closed INTEGER NOT NULL,
+                    checked TEXT,
+                    listed TEXT
+                )
+            """)
+            if "listed" not in {col[1] for col in self.conn.execute("PRAGMA table_info(dirs)")}:
+                self.conn.execute("ALTER TABLE dirs ADD COLUMN listed TEXT")  # Index from an older version
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS files (
+                    dir TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    size INTEGER,
+                    modify TEXT,
+                    file_date TEXT,
+                    PRIMARY KEY (dir, name)
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS files_by_date ON files (dir, file_date)")
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.now().isoformat(timespec="seconds")
+
+    @staticmethod
+    def age(stamp):
+        """Seconds since a `checked` / `listed` time, None if there is none"""
+        if not stamp:
+            return None
+        return (datetime.datetime.now() - datetime.datetime.fromisoformat(stamp)).total_seconds()
+
+    def get_dir(self, path):
+        """
+        {"present", "modify", "closed", "checked", "listed"} or None if never
+        indexed. `checked` is the last time it was seen current (mtime or
+        listing), `listed` the last real listing.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT present, modify, closed, checked, listed FROM dirs WHERE path = ?", (path,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"present": bool(row[0]), "modify": row[1], "closed": bool(row[2]), "checked": row[3], "listed": row[4]}
+
+    def put_dir(self, path, entries, modify, closed, date_of):
+        """
+        Replaces the files of `path` with a listing ({name: {"size", "modify"}},
+        None if the directory does not exist). `date_of(name, modify)` gives the
+        date a file is filtered by.
+        """
+        rows = []
+        for name, info in (entries or {}).items():
+            f_date = date_of(name, info.get("modify"))
+            rows.append((path, name, info.get("size"), info.get("modify"), f_date.isoformat() if f_date else None))
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM files WHERE dir = ?", (path,))
+            self.conn.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?)", rows)
+            now = self._now()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO dirs (path, present, modify, closed, checked, listed) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, int(entries is not None), modify, int(closed), now, now)
+            )
+
+    def mark_checked(self, path, closed):
+        """Directory seen unchanged"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE dirs SET closed = ?, checked = ? WHERE path = ?", (int(closed), self._now(), path)
+            )
+
+    def files(self, path, date_from, date_to):
+        """
+        Listing of `path` limited to files dated in the range (datetimes), plus undated
+        ones (the caller asks MDTM for those). None if the directory is missing.
+        """
+        with self.lock:
+            present = self.conn.execute("SELECT present FROM dirs WHERE path = ?", (path,)).fetchone()
+            if not present or not present[0]:
+                return None
+            rows = self.conn.execute(
+                "SELECT name, size, modify FROM files WHERE dir = ? "
+                "AND (file_date IS NULL OR file_date BETWEEN ? AND ?)",
+                (path, date_from.isoformat(), date_to.isoformat())
+            ).fetchall()
+        return {name: {"size": size, "modify": modify} for name, size, modify in rows}
+
+    def count(self, paths, date_from, date_to):
+        """
+        (files dated in the range across `paths` counted once per name as the
+        download does, number of paths not indexed yet)
+        """
+        paths = list(paths)
+        if not paths:
+            return 0, 0
+        marks = ','.join('?' * len(paths))
+        with self.lock:
+            indexed = self.conn.execute(f"SELECT COUNT(*) FROM dirs WHERE path IN ({marks})", paths).fetchone()[0]
+            count = self.conn.execute(
+                f"SELECT COUNT(DISTINCT name) FROM files WHERE dir IN ({marks}) AND file_date BETWEEN ? AND ?",
+                [*paths, date_from.isoformat(), date_to.isoformat()]
+            ).fetchone()[0]
+        return count, len(set(paths)) - indexed
+
+    def folder_counts(self, structure, date_from, date_to):
+        """Per folder of a project structure: {"id", "name", "count", "pending"} for the date range"""
+        result = []
+        for f_def in structure:
+            paths = expand_paths(f_def.get("paths", []), date_from, date_to)
+            count, pending = self.count(paths.keys(), date_from, date_to)
+            result.append({"id": f_def.get("id"), "name": f_def.get("name", ""), "count": count, "pending": pending})
+        return result
+
+class RemoteIndexer:
+    """
+    Background thread keeping the RemoteIndex current for the folders of all
+    projects over the last REMOTE_INDEX_MONTHS months, every `interval`
+    seconds or when woken (e.g. a project was saved).
+    `connect()` returns a connected FTPManager using the index, or None.
+    `projects()` returns the project list.
+    """
+    def __init__(self, index, connect, projects, interval=REMOTE_INDEX_INTERVAL_SECONDS, months=REMOTE_INDEX_MONTHS):
+        self.index = index
+        self.connect = connect
+        self.projects = projects
+        self.interval = interval
+        self.months = months
+        self.wake_event = threading.Event()
+        self.thread = None
+        self.last_run = None  # {"finished", "dirs", "relisted"} of the last crawl
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._loop, daemon=True, name="remote-indexer")
+            self.thread.start()
+
+    def wake(self):
+        self.wake_event.set()
+
+    def _loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Remote Index Error: {e}")
+            self.wake_event.wait(self.interval)
+            self.wake_event.clear()
+
+    def refresh(self):
+        """One crawl, relists only the directories whose mtime changed"""
+        today = datetime.date.today()
+        year, month = today.year, today.month - (self.months - 1)
+        while month < 1:
+            year, month = year - 1, month + 12
+        templates = {path for proj in self.projects() for f_def in proj.get("structure", []) for path in f_def.get("paths", [])}
+        if not templates:
+            return
+        paths = expand_paths(templates, datetime.date(year, month, 1), today)
+
+        ftp = self.connect()
+        if ftp is None:
+            return
+        relisted = 0
+        try:
+            for remote_dir, period_end in paths.items():
+                try:
+                    if not ftp.sync_index(remote_dir, closed=ftp._is_closed(period_end)):
+                        relisted += 1
+                except Exception as e:
+                    print(f"Remote Index: {remote_dir}: {e}")
+        finally:
+            ftp.disconnect()
+        self.last_run = {"finished": self.index._now(), "dirs": len(paths), "relisted": relisted}
+        if relisted:
+            print(f"🗂️ Remote Index: relisted {relisted}/{len(paths)} directories")
@@ -1,34 +1,208 @@
 import boto3
 import os
+import io
+import threading
+import concurrent.futures
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 from botocore.client import Config
 
+from modules.config import S3_PART_SIZE_MB, S3_MAX_CONCURRENCY
+
+S3_PROGRESS_STEP = 0.02  # Progress reported every 2% of the file
+S3_LINK_EXPIRES = 604800  # 7 days
+S3_DIGEST_METADATA = 'content-digest'  # x-amz-meta-content-digest, see StreamingZip.content_digest
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(access_key, secret_key, region, endpoint_url=None, max_concurrency=S3_MAX_CONCURRENCY):
+    """
+    Shared boto3 client per credentials, endpoint and upload concurrency.
+    Clients are thread safe and keep their HTTPS connections, so folders and
+    jobs reuse one pool, sized for two uploads at `max_concurrency` parts each.
+    """
+    key = (access_key, secret_key, region, endpoint_url, max_concurrency)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = boto3.client(
+                's3',
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                region_name=region,
+                endpoint_url=endpoint_url or f"https://s3.{region}.amazonaws.com",
+                config=Config(signature_version='s3v4', max_pool_connections=max_concurrency * 2)
+            )
+        return client
+
+class _Progress:
+    """boto3 transfer callback (called from the upload threads) -> progress_callback(sent, total)"""
+    def __init__(self, total, progress_callback):
+        self.total = total
+        self.sent = 0
+        self.reported = 0
+        self.step = max(1, int(total * S3_PROGRESS_STEP))
+        self.callback = progress_callback
+        self.lock = threading.Lock()
+
+    def __call__(self, bytes_amount):
+        with self.lock:
+            self.sent += bytes_amount
+            if self.sent - self.reported < self.step and self.sent < self.total:
+                return
+            self.reported = self.sent
+            sent = self.sent
+        self.callback(sent, self.total)
+
+class S3MultipartWriter:
+    """
+    Write-only file object that streams into an S3 multipart upload.
+    Bytes are buffered into parts of `part_size`, full parts are sent by up
+    to `max_concurrency` threads while writing goes on (a writer blocks when
+    all of them are busy, so memory stays at about max_concurrency parts).
+    `close` sends the last part and completes the upload, `abort` drops it.
+    """
+    def __init__(self, client, bucket, key, part_size, max_concurrency, progress_callback=None):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.progress_callback = progress_callback
+        self.buffer = io.BytesIO()
+        self.position = 0
+        self.sent = 0
+        self.upload_id = None
+        self.parts = []  # (part number, future)
+        self.slots = threading.Semaphore(max_concurrency)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="s3-part")
+        self.lock = threading.Lock()
+        self.error = None
+        self.closed = False
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        # No seek(): zipfile then writes data descriptors instead of rewinding
+        return self.position
+
+    def write(self, data):
+        if self.error:
+            raise self.error
+        if self.closed:
+            raise ValueError("write to closed S3 stream")
+        self.buffer.write(data)
+        self.position += len(data)
+        if self.buffer.tell() >= self.part_size:
+            self._flush_part()
+        return len(data)
+
+    def flush(self):
+        pass  # Parts are only sent when full, S3 needs >= 5 MB per part
+
+    def _flush_part(self):
+        data = self.buffer.getvalue()
+        self.buffer = io.BytesIO()
+        if self.upload_id is None:
+            self.upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self.key)['UploadId']
+        self.slots.acquire()
+        number = len(self.parts) + 1
+        self.parts.append((number, self.executor.submit(self._upload_part, number, data)))
+
+    def _upload_part(self, number, data):
+        try:
+            etag = self.client.upload_part(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=data
+            )['ETag']
+            with self.lock:
+                self.sent += len(data)
+                sent = self.sent
+            if self.progress_callback:
+                self.progress_callback(sent, None)
+            return etag
+        except Exception as e:
+            self.error = self.error or e
+            raise
+        finally:
+            self.slots.release()
+
+    def close(self):
+        """Sends the rest and completes the upload, returns the object size"""
+        if self.closed:
+            return self.position
+        self.closed = True
+        try:
+            if self.error:
+                raise self.error
+            if self.upload_id is None:
+                # Smaller than one part: a single PUT
+                self.client.put_object(Bucket=self.bucket, Key=self.key, Body=self.buffer.getvalue())
+            else:
+                if self.buffer.tell():
+                    self._flush_part()
+                parts = [{'PartNumber': n, 'ETag': f.result()} for n, f in self.parts]
+                self.client.complete_multipart_upload(
+                    Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={'Parts': parts}
+                )
+        except Exception:
+            self._abort_upload()
+            raise
+        finally:
+            self.executor.shutdown(wait=True)
+        if self.progress_callback:
+            self.progress_callback(self.position, self.position)
+        return self.position
+
+    def abort(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self._abort_upload()
+
+    def _abort_upload(self):
+        if self.upload_id is None:
+            return
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        except Exception as e:
+            print(f"S3 Abort Error: {e}")
+
 class S3Manager:
-    def __init__(self, access_key, secret_key, region='eu-north-1', bucket='zdjecia-reporting-manager'):
+    def __init__(self, access_key, secret_key, region='eu-north-1', bucket='zdjecia-reporting-manager',
+                 part_size_mb=None, max_concurrency=None, endpoint_url=None):
         self.access_key = access_key.strip() if access_key else ""
         self.secret_key = secret_key.strip() if secret_key else ""
         self.region = region.strip() if region else "eu-north-1"
         self.bucket = bucket.strip() if bucket else ""
+        self.endpoint_url = endpoint_url  # Other S3 compatible endpoint (local stand-in)
         self.client = None
-        
+
+        self.part_size = max(5, int(part_size_mb or S3_PART_SIZE_MB)) * 1024 * 1024  # S3 minimum part is 5 MB
+        self.max_concurrency = max(1, int(max_concurrency or S3_MAX_CONCURRENCY))
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.part_size,
+            multipart_chunksize=self.part_size,
+            max_concurrency=self.max_concurrency,
+            use_threads=True
+        )
+
         if self.access_key and self.secret_key:
             self._init_client()
 
     def _init_client(self):
         try:
-            endpoint_url = f"https://s3.{self.region}.amazonaws.com"
-            self.client = boto3.client(
-                's3',
-                aws_access_key_id=self.access_key,
-                aws_secret_access_key=self.secret_key,
-                region_name=self.region,
-                endpoint_url=endpoint_url,
-                config=Config(signature_version='s3v4')
-            )
+            self.client = get_client(self.access_key, self.secret_key, self.region, self.endpoint_url, self.max_concurrency)
         except Exception as e:
             print(f"S3 Init Error: {e}")
 
-    def upload_and_generate_link(self, file_path, object_name=None):
+    def upload_and_generate_link(self, file_path, object_name=None, progress_callback=None, content_digest=None):
+        """
+        Uploads in parallel parts, `progress_callback(sent_bytes, total_bytes)`
+        is called as parts go out. `content_digest` is stored in the object
+        metadata for `has_identical`. Returns a presigned link.
+        """
         if not self.client:
             raise Exception("Brak konfiguracji AWS S3")
 
@@ -36,20 +210,46 @@ class S3Manager:
             raise Exception("Plik nie istnieje")
 
         # 1. Prepare Object Name
-        if not object_name:
-            raw_filename = os.path.basename(file_path)
-            object_name = raw_filename.replace(" ", "_")
-        else:
-             object_name = object_name.replace(" ", "_")
+        object_name = self.object_key(object_name or os.path.basename(file_path))
 
         # 2. Upload
         print(f"S3 Uploading: {object_name}")
-        self.client.upload_file(file_path, self.bucket, object_name)
+        callback = None
+        if progress_callback:
+            callback = _Progress(os.path.getsize(file_path), progress_callback)
+        extra_args = {'Metadata': {S3_DIGEST_METADATA: content_digest}} if content_digest else None
+        self.client.upload_file(file_path, self.bucket, object_name, ExtraArgs=extra_args,
+                                Config=self.transfer_config, Callback=callback)
 
         # 3. Generate Link
-        url = self.client.generate_presigned_url(
+        return self.generate_link(object_name)
+
+    def has_identical(self, object_name, content_digest):
+        """True if the bucket already holds `object_name` uploaded with the same content digest"""
+        if not self.client or not content_digest:
+            return False
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.object_key(object_name))
+        except ClientError:
+            return False  # Missing (404) or not allowed to look: upload
+        return head.get('Metadata', {}).get(S3_DIGEST_METADATA) == content_digest
+
+    @staticmethod
+    def object_key(name):
+        return name.replace(" ", "_")
+
+    def open_stream(self, object_name, progress_callback=None):
+        """S3MultipartWriter for `object_name`; write the file into it, then close() and generate_link()"""
+        if not self.client:
+            raise Exception("Brak konfiguracji AWS S3")
+        object_name = self.object_key(object_name)
+        print(f"S3 Streaming: {object_name}")
+        return S3MultipartWriter(self.client, self.bucket, object_name, self.part_size, self.max_concurrency, progress_callback)
+
+    def generate_link(self, object_name):
+        """Presigned download link, valid for S3_LINK_EXPIRES"""
+        return self.client.generate_presigned_url(
             'get_object',
-            Params={'Bucket': self.bucket, 'Key': object_name},
-            ExpiresIn=604800 # 7 days
+            Params={'Bucket': self.bucket, 'Key': self.object_key(object_name)},
+            ExpiresIn=S3_LINK_EXPIRES
         )
-        return url
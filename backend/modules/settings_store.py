@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+import uuid
+
+from pydantic import BaseModel, ValidationError
+
+from modules.config import (
+    AI_REQUESTS_PER_MINUTE, AI_TOKENS_PER_MINUTE, AI_MAX_IN_FLIGHT,
+    CLASSIFIER_MODES, CASCADE_THRESHOLD, S3_PART_SIZE_MB, S3_MAX_CONCURRENCY
+)
+
+SETTINGS_FILE = "secrets.json"
+DEFAULT_FTP_HOST = "webas67993.tld.pl"
+DEFAULT_FTP_USER = "jjaczewski"
+
+class AppSettings(BaseModel):
+    ftp_host: str = DEFAULT_FTP_HOST
+    ftp_user: str = DEFAULT_FTP_USER
+    ftp_pass: str = ""
+    gemini_key: str = ""
+    aws_access_key: str = ""
+    aws_secret_key: str = ""
+    aws_bucket_name: str = ""
+    aws_region: str = ""
+    ai_rpm: int = AI_REQUESTS_PER_MINUTE
+    ai_tpm: int = AI_TOKENS_PER_MINUTE
+    ai_max_in_flight: int = AI_MAX_IN_FLIGHT
+    classifier_mode: str = "gemini"
+    local_model_path: str = ""
+    cascade_threshold: float = CASCADE_THRESHOLD
+    s3_part_size_mb: int = S3_PART_SIZE_MB
+    s3_max_concurrency: int = S3_MAX_CONCURRENCY
+    aws_endpoint_url: str = ""
+    s3_stream_upload: bool = False
+    keep_local_zip: bool = False
+
+    def cleaned(self):
+        """Copy with trimmed strings and values clamped to what the app accepts"""
+        data = {k: v.strip() if isinstance(v, str) else v for k, v in dict(self).items()}
+        data.update({
+            "ai_rpm": max(1, self.ai_rpm),
+            "ai_tpm": max(1, self.ai_tpm),
+            "ai_max_in_flight": max(1, self.ai_max_in_flight),
+            "classifier_mode": self.classifier_mode if self.classifier_mode in CLASSIFIER_MODES else "gemini",
+            "cascade_threshold": min(1.0, max(0.0, self.cascade_threshold)),
+            "s3_part_size_mb": max(5, self.s3_part_size_mb),
+            "s3_max_concurrency": max(1, self.s3_max_concurrency)
+        })
+        return AppSettings(**data)
+
+class SettingsStore:
+    """
+    secrets.json as one AppSettings object kept in memory. The file is parsed
+    again only when its mtime or size changes, writes go to a temp file that
+    replaces it, so a reader never sees half of it.
+    Returned objects are shared, callers must not modify them.
+    """
+    def __init__(self, path=SETTINGS_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.settings = AppSettings()
+        self.stamp = None
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def get(self):
+        with self.lock:
+            stamp = self._file_stamp()
+            if stamp != self.stamp:
+                try:
+                    if stamp is None:
+                        self.settings = AppSettings()
+                    else:
+                        with open(self.path, "r", encoding="utf-8") as f:
+                            self.settings = AppSettings(**json.load(f)).cleaned()
+                    self.stamp = stamp
+                except (OSError, ValueError, ValidationError) as e:
+                    # Keep the last good settings, try again on the next call
+                    print(f"⚠️ Settings: cannot read {self.path}: {e}")
+            return self.settings
+
+    def save(self, settings):
+        settings = settings.cleaned()
+        with self.lock:
+            tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(dict(settings), f)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                if os.path.exists(tmp_path): os.remove(tmp_path)
+                raise
+            self.settings = settings
+            self.stamp = self._file_stamp()
+        return settings
+
+    def update(self, changes):
+        """Saves the current settings with `changes` ({field: value}) applied, the rest stays as stored"""
+        with self.lock:
+            return self.save(AppSettings(**{**dict(self.get()), **changes}))
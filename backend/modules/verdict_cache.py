@@ -0,0 +1,59 @@
+import sqlite3
+import threading
+import datetime
+
+class VerdictCache:
+    """
+    AI decisions stored by (image content hash, model, prompt version).
+    A changed prompt gets a new version, so old verdicts are simply not found;
+    `purge_stale` removes them from the file.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS verdicts (
+                    digest TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    decision TEXT NOT NULL,
+                    reason TEXT,
+                    created TEXT,
+                    PRIMARY KEY (digest, model, prompt_version)
+                )
+            """)
+
+    def get_many(self, digests, model, prompt_version):
+        """{digest: (decision, reason)} for the digests already judged"""
+        digests = list(digests)
+        found = {}
+        with self.lock:
+            for i in range(0, len(digests), 500):  # SQLite parameter limit
+                chunk = digests[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT digest, decision, reason FROM verdicts WHERE model = ? AND prompt_version = ? "
+                    f"AND digest IN ({','.join('?' * len(chunk))})",
+                    [model, prompt_version, *chunk]
+                ).fetchall()
+                found.update({d: (decision, reason) for d, decision, reason in rows})
+        return found
+
+    def put_many(self, verdicts, model, prompt_version):
+        """`verdicts`: {digest: (decision, reason)}"""
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?)",
+                [(d, model, prompt_version, decision, reason, now) for d, (decision, reason) in verdicts.items()]
+            )
+
+    def purge_stale(self, prompt_version):
+        """Deletes verdicts made with any other prompt version, returns how many"""
+        with self.lock, self.conn:
+            removed = self.conn.execute("DELETE FROM verdicts WHERE prompt_version != ?", (prompt_version,)).rowcount
+        if removed:
+            print(f"🧹 Verdict Cache: removed {removed} verdicts of old prompts")
+        return removed
@@ -0,0 +1,152 @@
+import os
+import queue
+import hashlib
+import threading
+import zipfile
+
+from modules.image_cache import file_digest
+
+ZIP_ALLOWED_EXT = ('.jpg', '.jpeg', '.png', '.webp')  # All already compressed: stored, deflate only costs CPU
+
+_CLOSE = object()
+
+class _Tee:
+    """Unseekable file object writing to several files (local copy + upload stream)"""
+    def __init__(self, targets):
+        self.targets = targets
+        self.position = 0
+
+    def write(self, data):
+        for target in self.targets:
+            target.write(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        for target in self.targets:
+            target.flush()
+
+class StreamingZip:
+    """
+    ZIP archive filled while the analysis runs. `add` only queues the file,
+    a writer thread appends it, so the analysis never waits for the disk.
+    The archive goes to `zip_path` (written as `<path>.part`, renamed on
+    `close`), to `stream` (e.g. an S3MultipartWriter, closed on `close`),
+    or to both. With `track_digests` the entries' content hashes are kept
+    for `content_digest`.
+    """
+    def __init__(self, zip_path=None, stream=None, track_digests=False):
+        self.zip_path = zip_path
+        self.part_path = f"{zip_path}.part" if zip_path else None
+        self.stream = stream
+        self.local_file = None
+        self.queue = queue.Queue()
+        self.names = set()
+        self.track_digests = track_digests
+        self.entries = {}  # arcname -> content hash, for content_digest
+        self.count = 0
+        self.bytes_written = 0
+        self.error = None
+        self.closed = False
+        if zip_path:
+            os.makedirs(os.path.dirname(zip_path) or ".", exist_ok=True)
+        if stream is None:
+            target = self.part_path
+        else:
+            if zip_path:
+                self.local_file = open(self.part_path, 'wb')
+            target = _Tee([f for f in (self.local_file, stream) if f])
+        self.zipf = zipfile.ZipFile(target, 'w', zipfile.ZIP_STORED, allowZip64=True)
+        self.thread = threading.Thread(target=self._writer, daemon=True, name="zip-writer")
+        self.thread.start()
+
+    def add(self, file_path, arcname, digest=None):
+        """
+        Queues a file for the archive, skips other formats and names already added.
+        `digest` is the file's SHA-1 if already known, otherwise the writer hashes it.
+        """
+        if self.closed or not arcname.lower().endswith(ZIP_ALLOWED_EXT) or arcname in self.names:
+            return False
+        self.names.add(arcname)
+        self.queue.put((file_path, arcname, digest))
+        return True
+
+    @property
+    def content_digest(self):
+        """
+        SHA-256 over the names and content hashes of the entries. Unlike a hash
+        of the ZIP bytes it does not depend on the order files were added in.
+        """
+        if not self.track_digests:
+            return None
+        h = hashlib.sha256()
+        for arcname in sorted(self.entries):
+            h.update(f"{arcname}\0{self.entries[arcname]}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    def _writer(self):
+        while True:
+            job = self.queue.get()
+            if job is _CLOSE:
+                return
+            if self.error:
+                continue  # Archive is broken, drain the queue
+            file_path, arcname, digest = job
+            try:
+                self.zipf.write(file_path, arcname)
+                if self.track_digests:
+                    self.entries[arcname] = digest or file_digest(file_path)
+                self.count += 1
+                self.bytes_written += os.path.getsize(file_path)
+            except Exception as e:
+                self.error = e
+
+    def close(self):
+        """Writes the queued files and the central directory, finishes the stream, returns the ZIP path"""
+        if self.closed:
+            return self.zip_path
+        self.closed = True
+        self.queue.put(_CLOSE)
+        self.thread.join()
+        try:
+            if self.error:
+                raise self.error
+            self.zipf.close()
+            if self.local_file:
+                self.local_file.close()
+            if self.stream:
+                self.stream.close()
+        except Exception:
+            self._discard()
+            raise
+        if self.zip_path:
+            os.replace(self.part_path, self.zip_path)
+        return self.zip_path
+
+    def abort(self):
+        """Stops the writer and deletes the unfinished archive"""
+        if self.closed:
+            return
+        self.closed = True
+        self.error = self.error or RuntimeError("aborted")
+        self.queue.put(_CLOSE)
+        self.thread.join()
+        self._discard()
+
+    def _discard(self):
+        if self.stream:
+            self.stream.abort()  # First, so the end record below is not uploaded
+        try:
+            self.zipf.close()
+        except Exception:
+            pass
+        if self.local_file:
+            self.local_file.close()
+        if self.part_path:
+            try:
+                os.remove(self.part_path)
+            except OSError:
+                pass
@@ -9,6 +9,7 @@ window.onerror = function (msg, url, line, col, error) {
 let projects = [];
 let editId = null;
 let currentProcessingProject = null;
+let currentJobId = null; // Background job followed by the process view
 let folders = []; // [{id, paths: [{code, suffix}]}]
 let powerBiLinks = []; // [ { id: '...', value: 'https://...' } ]
 let excelPaths = []; // [ { id: '...', value: 'C:/...' } ]
@@ -101,13 +102,14 @@ function renderProjects() {
             <div class="card-info">
                 <h3>${cleanName}</h3>
                 <div class="manager-text">${cleanManager}</div>
+                <div class="file-counts" id="counts-${p.id}"></div>
             </div>
             
             <div class="card-controls">
                 <div class="local-date-group">
-                    <input type="date" id="dFrom-${p.id}" value="${defStart}">
+                    <input type="date" id="dFrom-${p.id}" value="${defStart}" onchange="loadFileCounts('${p.id}')">
                     <span>-</span>
-                    <input type="date" id="dTo-${p.id}" value="${defEnd}">
+                    <input type="date" id="dTo-${p.id}" value="${defEnd}" onchange="loadFileCounts('${p.id}')">
                 </div>
                 
                 <div class="btn-group">
@@ -124,10 +126,32 @@ function renderProjects() {
             </div>
         `;
         container.appendChild(card);
+        loadFileCounts(p.id);
     });
     lucide.createIcons();
 }
 
+// Files per folder in the chosen range, answered by the server's remote index
+async function loadFileCounts(id) {
+    const el = document.getElementById(`counts-${id}`);
+    const dFrom = document.getElementById(`dFrom-${id}`).value;
+    const dTo = document.getElementById(`dTo-${id}`).value;
+    if (!el || !dFrom || !dTo) return;
+    try {
+        const res = await fetch(`${API_URL}/projects/${id}/file_counts?date_from=${dFrom}&date_to=${dTo}`);
+        if (!res.ok) { el.innerText = ''; return; }
+        const data = await res.json();
+        const p = projects.find(x => x.id === id);
+        el.innerText = data.folders.map((f, idx) => {
+            const label = p ? resolveFolderName(f, idx, p.name) : f.name;
+            return `${label}: ${f.count}${f.pending ? '+' : ''}`;
+        }).join(' · ');
+        el.title = data.folders.some(f => f.pending) ? 'Indeks FTP jeszcze się buduje (+ = nie wszystkie foldery zindeksowane)' : 'Pliki na FTP w wybranym zakresie (indeks)';
+    } catch (e) {
+        el.innerText = '';
+    }
+}
+
 async function fetchSettings() {
     try {
         const res = await fetch(`${API_URL}/settings`);
@@ -140,6 +164,17 @@ async function fetchSettings() {
         document.getElementById('awsSecretKey').value = data.aws_secret_key || '';
         document.getElementById('awsBucketName').value = data.aws_bucket_name || '';
         document.getElementById('awsRegion').value = data.aws_region || '';
+        document.getElementById('awsEndpointUrl').value = data.aws_endpoint_url || '';
+        document.getElementById('s3PartSizeMb').value = data.s3_part_size_mb || '';
+        document.getElementById('s3MaxConcurrency').value = data.s3_max_concurrency || '';
+        document.getElementById('s3StreamUpload').checked = !!data.s3_stream_upload;
+        document.getElementById('keepLocalZip').checked = !!data.keep_local_zip;
+        document.getElementById('aiRpm').value = data.ai_rpm || '';
+        document.getElementById('aiTpm').value = data.ai_tpm || '';
+        document.getElementById('aiMaxInFlight').value = data.ai_max_in_flight || '';
+        document.getElementById('classifierMode').value = data.classifier_mode || 'gemini';
+        document.getElementById('localModelPath').value = data.local_model_path || '';
+        document.getElementById('cascadeThreshold').value = data.cascade_threshold ?? '';
     } catch (e) { }
 }
 
@@ -152,8 +187,24 @@ async function saveSettings() {
         aws_access_key: document.getElementById('awsAccessKey').value,
         aws_secret_key: document.getElementById('awsSecretKey').value,
         aws_bucket_name: document.getElementById('awsBucketName').value,
-        aws_region: document.getElementById('awsRegion').value
+        aws_region: document.getElementById('awsRegion').value,
+        aws_endpoint_url: document.getElementById('awsEndpointUrl').value,
+        s3_stream_upload: document.getElementById('s3StreamUpload').checked,
+        keep_local_zip: document.getElementById('keepLocalZip').checked,
+        classifier_mode: document.getElementById('classifierMode').value,
+        local_model_path: document.getElementById('localModelPath').value
     };
+    const threshold = parseFloat(document.getElementById('cascadeThreshold').value);
+    if (!isNaN(threshold)) payload.cascade_threshold = threshold;
+    // Empty limit fields fall back to the server defaults
+    const limits = {
+        ai_rpm: 'aiRpm', ai_tpm: 'aiTpm', ai_max_in_flight: 'aiMaxInFlight',
+        s3_part_size_mb: 's3PartSizeMb', s3_max_concurrency: 's3MaxConcurrency'
+    };
+    for (const [key, id] of Object.entries(limits)) {
+        const value = parseInt(document.getElementById(id).value, 10);
+        if (value > 0) payload[key] = value;
+    }
     await fetch(`${API_URL}/settings`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
@@ -497,11 +548,16 @@ async function saveProject() {
         email_template: emailTpl
     };
 
-    await fetch(`${API_URL}/projects`, {
+    const res = await fetch(`${API_URL}/projects`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify(payload)
     });
+    if (!res.ok) {
+        const err = await res.json().catch(() => ({}));
+        alert("Błąd zapisu: " + (err.detail || res.status));
+        return;
+    }
 
     alert("Zapisano!");
     fetchProjects();
@@ -555,7 +611,8 @@ function renderBucket(type) {
     slice.forEach(item => {
         const img = document.createElement('img');
         img.className = 'img-thumb';
-        img.src = item.src;
+        img.src = item.thumb || item.src; // Full size only in the lightbox
+        img.loading = 'lazy';
         img.title = item.file;
         img.onclick = () => openLightbox(item.src);
         grid.appendChild(img);
@@ -692,278 +749,330 @@ async function runTask(id, dFrom, dTo) {
     renderBucket('keep');
     renderBucket('trash');
 
-    let currentTotal = 0;
-    let lastZipName = null;
+    const state = { currentTotal: 0, lastZipName: null, grandTotal: 0, grandProcessed: 0, keepOffset: 0, trashOffset: 0 };
 
     startDlTimer(); // START INPUT TIMER
 
     console.log("Starting Task...", { id, dFrom, dTo }); // DEBUG
 
     try {
+        // Job runs on the server independently of this page; we only follow its events
         const response = await fetch(`${API_URL}/execute`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ project_id: id, date_from: dFrom, date_to: dTo })
         });
+        const job = await response.json();
+        if (!job.job_id) throw new Error("Brak ID zadania");
+        currentJobId = job.job_id;
+        document.getElementById('btnCancel').disabled = false;
+
+        // EventSource reconnects by itself and sends Last-Event-ID, so nothing is lost or repeated
+        const source = new EventSource(`${API_URL}/jobs/${job.job_id}/events`);
+        source.onmessage = (ev) => {
+            try {
+                const msg = JSON.parse(ev.data);
+                console.log("MSG:", msg);
+                if (msg.type === 'job_end') {
+                    source.close();
+                    if (currentJobId === job.job_id) {
+                        currentJobId = null;
+                        document.getElementById('btnCancel').disabled = true;
+                    }
+                    return;
+                }
+                handleTaskMessage(msg, state);
+            } catch (e) {
+                console.error("JSON Loop Error:", e);
+            }
+        };
+        source.onerror = () => console.warn("SSE: połączenie przerwane, ponawianie...");
+    } catch (e) {
+        stopTimers();
+        console.error("Fetch Error:", e);
+    }
+}
+
+async function cancelCurrentTask() {
+    if (!currentJobId) return;
+    try {
+        await fetch(`${API_URL}/jobs/${currentJobId}/cancel`, { method: 'POST' });
+    } catch (e) {
+        console.error("Cancel Error:", e);
+    }
+}
+
+function handleTaskMessage(msg, state) {
+    // 0. ERRORS (incl. cancelled job)
+    if (msg.error) {
+        stopTimers();
+        document.getElementById('statusText').innerText = `BŁĄD: ${msg.error}`;
+        return;
+    }
+
+    // 1. LOGS
+    if (msg.log) {
+        if (msg.log.startsWith("Utworzono ZIP: ")) {
+            state.lastZipName = msg.log.replace("Utworzono ZIP: ", "").trim();
+            showZipPopup(state.lastZipName);
+        }
+    }
+
+    // 2. DONE STATE
+    if (msg.done) {
+        stopTimers(); // FIXED: Was stopAllTimers()
+        document.getElementById('statusText').innerText = "ZAKOŃCZONO";
+        if (document.getElementById('progressBar')) document.getElementById('progressBar').style.width = '100%';
+        if (document.getElementById('progressPercent')) document.getElementById('progressPercent').innerText = '100%';
+        document.getElementById('btnEmail').disabled = false;
+
+        const btnContainer = document.getElementById('runBtnContainer');
+        if (btnContainer) {
+            // ZIP Button
+            const zipName = `${currentProcessingProject.name} ${currentProcessingProject.dateRange || ''}.zip`;
+
+            const dlHtml = `
+                <button class="btn-primary hover-scale" onclick="downloadZip('${state.lastZipName || zipName}')" 
+                        style="height:44px; min-width:160px; flex-shrink:0; display:flex; gap:10px; align-items:center; padding: 0 24px;">
+                    <i data-lucide="download"></i> Pobierz ZIP
+                </button>
+            `;
+
+            // Power BI Link (New Style)
+            let pbiHtml = '';
+            if (currentProcessingProject && currentProcessingProject.power_bi_links) {
+                currentProcessingProject.power_bi_links.forEach((pbiLink, idx) => {
+                    if (!pbiLink) return;
+                    const inputId = `pbiLinkInput_${idx}`;
+                    // PBI usually doesn't have folder names, just generic or from project?
+                    // Use "Raport Power BI" as label
+                    const label = "Raport Power BI";
+
+                    pbiHtml += `
+                    <div class="link-bar" style="flex: 1; min-width: 300px; display:flex; align-items:center; background:#18181b; padding:4px 8px; border-radius:6px; border:1px solid #333; margin-right: 10px;">
+                        <div style="display:flex; align-items:center; gap:6px; margin-right:8px; color:#aaa; font-size:0.8rem; white-space:nowrap;">
+                            <i data-lucide="bar-chart-2" style="width:14px; color:#facc15;"></i>
+                            <span>${label}</span>
+                        </div>
+                        <input type="text" id="${inputId}" readonly value="${pbiLink}"
+                            style="flex:1; background:transparent; border:none; color:#facc15; font-family:monospace; font-size:0.85rem; text-overflow:ellipsis;">
+                        <button onclick="copyLinkPbi('${inputId}')" title="Kopiuj"
+                            style="background:transparent; border:none; color:#a855f7; cursor:pointer; padding:2px;">
+                            <i data-lucide="copy" style="width:16px;"></i>
+                        </button>
+                    </div>
+                    `;
+                });
+            }
+
+            // S3 Links (New Style)
+            let photosHtml = '';
+            const finalLinks = msg.s3_links || [];
+            // Fallback if only single link provided
+            if (finalLinks.length === 0 && msg.s3_link) finalLinks.push(msg.s3_link);
+
+            if (finalLinks.length > 0) {
+                finalLinks.forEach((link, idx) => {
+                    const inputId = `finalLinkInput_${idx}`;
+
+                    // Start with generic label
+                    let label = "Raport Zdjęciowy";
+                    // Try to resolve folder name if structure matches
+                    if (currentProcessingProject.structure_raw && currentProcessingProject.structure_raw[idx]) {
+                        const f = currentProcessingProject.structure_raw[idx];
+                        if (f.name) label = f.name;
+                        else label = `Folder ${idx + 1}`;
+                    } else if (idx === 0 && currentProcessingProject.name) {
+                        label = currentProcessingProject.name;
+                    }
 
-        const reader = response.body.getReader();
-        const decoder = new TextDecoder();
-        let buffer = '';
+                    photosHtml += `
+                    <div class="link-bar" style="flex: 1; min-width: 300px; display:flex; align-items:center; background:#18181b; padding:4px 8px; border-radius:6px; border:1px solid #333; margin-right: 10px;">
+                        <div style="display:flex; align-items:center; gap:6px; margin-right:8px; color:#aaa; font-size:0.8rem; white-space:nowrap;">
+                            <i data-lucide="image" style="width:14px; color:#3b82f6;"></i>
+                            <span>${label}</span>
+                        </div>
+                        <input type="text" id="${inputId}" readonly value="${link}"
+                            style="flex:1; background:transparent; border:none; color:#4ade80; font-family:monospace; font-size:0.85rem; text-overflow:ellipsis;">
+                        <button onclick="copyLinkCurrent('${inputId}')" title="Kopiuj"
+                            style="background:transparent; border:none; color:#a855f7; cursor:pointer; padding:2px;">
+                            <i data-lucide="copy" style="width:16px;"></i>
+                        </button>
+                    </div>
+                    `;
+                });
+            }
 
-        let grandTotal = 0;
-        let grandProcessed = 0;
+            // Wrap photos and pbi in a scrolling container if needed
+            btnContainer.innerHTML = `
+            <div style="display:flex; gap:12px; align-items:center; width:100%;">
+                ${dlHtml}
+                <div class="photos-container-dynamic" style="display:flex; gap:12px; flex:1; overflow-x:auto; padding-bottom:4px;">
+                    ${photosHtml}
+                    ${pbiHtml}
+                </div>
+            </div>
+        `;
+            lucide.createIcons();
+        }
+    }
 
-        while (true) {
-            const { value, done } = await reader.read();
-            if (done) break;
+    // 3. SET TOTAL -> AI Phase
+    if (msg.type === 'set_total') {
+        switchToAiTimer();
+        state.grandTotal += msg.count; // Accumulate
 
-            buffer += decoder.decode(value, { stream: true });
+        // Update Total Counter
+        animateValue(document.getElementById('statTot'), parseInt(document.getElementById('statTot').innerText || 0), state.grandTotal, 1000);
+        state.currentTotal = state.grandTotal;
 
-            const lines = buffer.split('\n');
-            buffer = lines.pop(); // Keep incomplete line
+        // Re-calc progress (don't reset to 0 unless really 0)
+        if (state.grandTotal > 0) {
+            const pct = Math.round((state.grandProcessed / state.grandTotal) * 100);
+            if (document.getElementById('progressBar')) document.getElementById('progressBar').style.width = `${pct}%`;
+            if (document.getElementById('progressPercent')) document.getElementById('progressPercent').innerText = `${pct}%`;
+        }
+    }
 
-            for (const line of lines) {
-                const trimmed = line.trim();
-                if (!trimmed.startsWith('data: ')) continue;
+    // 3a. SNAPSHOT: earlier events already left the server's buffer, their totals come in one message
+    if (msg.type === 'snapshot') {
+        if (msg.total > 0) switchToAiTimer();
+        state.grandTotal = msg.total;
+        state.currentTotal = msg.total;
+        state.grandProcessed = msg.processed;
+        // Those images are counted but not in the grid
+        state.keepOffset = Math.max(0, msg.kept - allKeep.length);
+        state.trashOffset = Math.max(0, msg.trashed - allTrash.length);
+        const counters = { statTot: state.grandTotal, statProc: state.grandProcessed,
+            statKeep: msg.kept, countKeep: msg.kept, statTrash: msg.trashed, countTrash: msg.trashed };
+        Object.entries(counters).forEach(([id, value]) => {
+            const el = document.getElementById(id);
+            if (el) el.innerText = value;
+        });
+        const pct = state.grandTotal > 0 ? Math.round((state.grandProcessed / state.grandTotal) * 100) : 0;
+        if (document.getElementById('progressBar')) document.getElementById('progressBar').style.width = `${pct}%`;
+        if (document.getElementById('progressPercent')) document.getElementById('progressPercent').innerText = `${pct}%`;
 
-                const jsonStr = trimmed.replace('data: ', '');
-                if (!jsonStr) continue;
+        const shown = new Set([...document.querySelectorAll('#runBtnContainer input[id^="finalLinkInput"]')].map(input => input.value));
+        msg.links.filter(l => !shown.has(l.link)).forEach(l => addLinkBar(l.folder, l.link));
+    }
 
-                try {
-                    const msg = JSON.parse(jsonStr);
-                    console.log("MSG:", msg);
+    // 3b. DOWNLOAD PROGRESS (Per-file, from FTP worker pool)
+    if (msg.type === 'download_progress') {
+        dlProgressText = `${msg.folder ? msg.folder + ': ' : ''}${msg.current}/${msg.total}`;
+    }
 
-                    // 1. LOGS
-                    if (msg.log) {
-                        if (msg.log.startsWith("Utworzono ZIP: ")) {
-                            lastZipName = msg.log.replace("Utworzono ZIP: ", "").trim();
-                            showZipPopup(lastZipName);
-                        }
-                    }
+    // 4. UPLOAD START (Explicit Event)
+    if (msg.type === 'upload_start') {
+        switchToUploadTimer();
+    }
 
-                    // 2. DONE STATE
-                    if (msg.done) {
-                        stopTimers(); // FIXED: Was stopAllTimers()
-                        document.getElementById('statusText').innerText = "ZAKOŃCZONO";
-                        if (document.getElementById('progressBar')) document.getElementById('progressBar').style.width = '100%';
-                        if (document.getElementById('progressPercent')) document.getElementById('progressPercent').innerText = '100%';
-                        document.getElementById('btnEmail').disabled = false;
-
-                        const btnContainer = document.getElementById('runBtnContainer');
-                        if (btnContainer) {
-                            // ZIP Button
-                            const zipName = `${currentProcessingProject.name} ${currentProcessingProject.dateRange || ''}.zip`;
-
-                            const dlHtml = `
-                                <button class="btn-primary hover-scale" onclick="downloadZip('${lastZipName || zipName}')" 
-                                        style="height:44px; min-width:160px; flex-shrink:0; display:flex; gap:10px; align-items:center; padding: 0 24px;">
-                                    <i data-lucide="download"></i> Pobierz ZIP
-                                </button>
-                            `;
-
-                            // Power BI Link (New Style)
-                            let pbiHtml = '';
-                            if (currentProcessingProject && currentProcessingProject.power_bi_links) {
-                                currentProcessingProject.power_bi_links.forEach((pbiLink, idx) => {
-                                    if (!pbiLink) return;
-                                    const inputId = `pbiLinkInput_${idx}`;
-                                    // PBI usually doesn't have folder names, just generic or from project?
-                                    // Use "Raport Power BI" as label
-                                    const label = "Raport Power BI";
-
-                                    pbiHtml += `
-                                    <div class="link-bar" style="flex: 1; min-width: 300px; display:flex; align-items:center; background:#18181b; padding:4px 8px; border-radius:6px; border:1px solid #333; margin-right: 10px;">
-                                        <div style="display:flex; align-items:center; gap:6px; margin-right:8px; color:#aaa; font-size:0.8rem; white-space:nowrap;">
-                                            <i data-lucide="bar-chart-2" style="width:14px; color:#facc15;"></i>
-                                            <span>${label}</span>
-                                        </div>
-                                        <input type="text" id="${inputId}" readonly value="${pbiLink}"
-                                            style="flex:1; background:transparent; border:none; color:#facc15; font-family:monospace; font-size:0.85rem; text-overflow:ellipsis;">
-                                        <button onclick="copyLinkPbi('${inputId}')" title="Kopiuj"
-                                            style="background:transparent; border:none; color:#a855f7; cursor:pointer; padding:2px;">
-                                            <i data-lucide="copy" style="width:16px;"></i>
-                                        </button>
-                                    </div>
-                                    `;
-                                });
-                            }
-
-                            // S3 Links (New Style)
-                            let photosHtml = '';
-                            const finalLinks = msg.s3_links || [];
-                            // Fallback if only single link provided
-                            if (finalLinks.length === 0 && msg.s3_link) finalLinks.push(msg.s3_link);
-
-                            if (finalLinks.length > 0) {
-                                finalLinks.forEach((link, idx) => {
-                                    const inputId = `finalLinkInput_${idx}`;
-
-                                    // Start with generic label
-                                    let label = "Raport Zdjęciowy";
-                                    // Try to resolve folder name if structure matches
-                                    if (currentProcessingProject.structure_raw && currentProcessingProject.structure_raw[idx]) {
-                                        const f = currentProcessingProject.structure_raw[idx];
-                                        if (f.name) label = f.name;
-                                        else label = `Folder ${idx + 1}`;
-                                    } else if (idx === 0 && currentProcessingProject.name) {
-                                        label = currentProcessingProject.name;
-                                    }
-
-                                    photosHtml += `
-                                    <div class="link-bar" style="flex: 1; min-width: 300px; display:flex; align-items:center; background:#18181b; padding:4px 8px; border-radius:6px; border:1px solid #333; margin-right: 10px;">
-                                        <div style="display:flex; align-items:center; gap:6px; margin-right:8px; color:#aaa; font-size:0.8rem; white-space:nowrap;">
-                                            <i data-lucide="image" style="width:14px; color:#3b82f6;"></i>
-                                            <span>${label}</span>
-                                        </div>
-                                        <input type="text" id="${inputId}" readonly value="${link}"
-                                            style="flex:1; background:transparent; border:none; color:#4ade80; font-family:monospace; font-size:0.85rem; text-overflow:ellipsis;">
-                                        <button onclick="copyLinkCurrent('${inputId}')" title="Kopiuj"
-                                            style="background:transparent; border:none; color:#a855f7; cursor:pointer; padding:2px;">
-                                            <i data-lucide="copy" style="width:16px;"></i>
-                                        </button>
-                                    </div>
-                                    `;
-                                });
-                            }
-
-                            // Wrap photos and pbi in a scrolling container if needed
-                            btnContainer.innerHTML = `
-                            <div style="display:flex; gap:12px; align-items:center; width:100%;">
-                                ${dlHtml}
-                                <div class="photos-container-dynamic" style="display:flex; gap:12px; flex:1; overflow-x:auto; padding-bottom:4px;">
-                                    ${photosHtml}
-                                    ${pbiHtml}
-                                </div>
-                            </div>
-                        `;
-                            lucide.createIcons();
-                        }
-                    }
+    // 4a. UPLOAD PROGRESS (Bytes sent to S3)
+    if (msg.type === 'upload_progress') {
+        // Streamed ZIP: size unknown until the analysis ends, show MB sent
+        const amount = msg.percent != null ? `${msg.percent}%` : `${(msg.sent / 1048576).toFixed(0)} MB`;
+        uploadProgressText = `${msg.folder ? msg.folder + ': ' : ''}${amount}`;
+        if (msg.percent != null) document.getElementById('statusText').innerText = `Wysyłanie na S3... ${uploadProgressText}`;
+    }
 
-                    // 3. SET TOTAL -> AI Phase
-                    if (msg.type === 'set_total') {
-                        switchToAiTimer();
-                        grandTotal += msg.count; // Accumulate
-
-                        // Update Total Counter
-                        animateValue(document.getElementById('statTot'), parseInt(document.getElementById('statTot').innerText || 0), grandTotal, 1000);
-                        currentTotal = grandTotal;
-
-                        // Re-calc progress (don't reset to 0 unless really 0)
-                        if (grandTotal > 0) {
-                            const pct = Math.round((grandProcessed / grandTotal) * 100);
-                            if (document.getElementById('progressBar')) document.getElementById('progressBar').style.width = `${pct}%`;
-                            if (document.getElementById('progressPercent')) document.getElementById('progressPercent').innerText = `${pct}%`;
-                        }
-                    }
+    // 4b. LINK RESULT (Incremental)
+    if (msg.type === 'link_result') {
+        addLinkBar(msg.folder, msg.link);
+    }
 
-                    // 4. UPLOAD START (Explicit Event)
-                    if (msg.type === 'upload_start') {
-                        switchToUploadTimer();
-                    }
+    // 5. IMAGE RESULT
+    // 5. IMAGE RESULT
+    if (msg.type === 'image_result') {
+        state.grandProcessed++;
+
+        // Update Stats
+        // Protect against division by zero
+        const totalForPct = state.grandTotal || 1;
+        const pct = Math.round((state.grandProcessed / totalForPct) * 100);
+        if (document.getElementById('progressBar')) document.getElementById('progressBar').style.width = `${pct}%`;
+        if (document.getElementById('progressPercent')) document.getElementById('progressPercent').innerText = `${pct}%`;
+
+        // We rely on set_total to update state.grandTotal/statTot. 
+        // But if msg.total > state.currentTotal (unexpected per-folder logic), ignore it or log it.
+        // We strictly use state.grandProcessed for the counter.
+        const sp = document.getElementById('statProc');
+        if (sp) sp.innerText = state.grandProcessed;
+
+        // Add to arrays
+        const isKeep = (msg.decision === 'keep');
+        const targetArr = isKeep ? allKeep : allTrash;
+        const item = {
+            file: msg.file,
+            src: `${API_URL}/image?path=${encodeURIComponent(msg.path)}`,
+            thumb: `${API_URL}/thumb?path=${encodeURIComponent(msg.path)}${msg.hash ? `&hash=${msg.hash}` : ''}`,
+            title: `${msg.file}${msg.reason ? ` [${msg.reason}]` : ''}`
+        };
+        targetArr.push(item);
 
-                    // 4b. LINK RESULT (Incremental)
-                    if (msg.type === 'link_result') {
-                        // Dynamically add this link to the UI immediately
-                        const btnContainer = document.getElementById('runBtnContainer');
-
-                        // Hide placeholder if exists
-                        const placeholder = btnContainer.querySelector('div[style*="visibility:hidden"]');
-                        if (placeholder) placeholder.style.display = 'none';
-
-                        // Generate ID
-                        const existingInputs = btnContainer.querySelectorAll('input[id^="finalLinkInput"]');
-                        const nextIdx = existingInputs.length;
-                        const linkId = `finalLinkInput-${nextIdx}`;
-
-                        // Create HTML for this link bar
-                        // Fixed width 380px per user request "standard width as when there are three".
-                        // Label width 130px.
-                        const linkHtml = `
-                            <div class="link-bar" style="flex: 0 0 auto; width: 380px; display:flex; align-items:center; background:#18181b; padding:4px 8px; border-radius:6px; border:1px solid #333;">
-                                <div style="width: 130px; flex-shrink:0; display:flex; align-items:center; gap:6px; margin-right:8px; color:#aaa; font-size:0.8rem; white-space:nowrap; overflow:hidden;">
-                                    <i data-lucide="image" style="width:14px; flex-shrink:0;"></i>
-                                    <span style="text-overflow:ellipsis; overflow:hidden;">${msg.folder || 'Zdjęcia'}</span>
-                                </div>
-                                <input type="text" readonly value="${msg.link}" id="${linkId}"
-                                    style="flex:1; background:transparent; border:none; color:#4ade80; font-family:monospace; font-size:0.85rem; text-overflow:ellipsis;">
-                                <button onclick="copyLinkCurrent('${linkId}')" title="Kopiuj"
-                                    style="background:transparent; border:none; color:#a855f7; cursor:pointer; padding:2px; margin-left:4px;">
-                                    <i data-lucide="copy" style="width:16px;"></i>
-                                </button>
-                            </div>
-                        `;
-
-                        // Check/Create Container
-                        let photosContainer = btnContainer.querySelector('.photos-container-dynamic');
-                        if (!photosContainer) {
-                            const d = document.createElement('div');
-                            d.className = 'photos-container-dynamic';
-                            d.style.display = 'flex';
-                            d.style.gap = '10px';
-                            d.style.flex = '1';
-                            d.style.overflowX = 'auto'; // Horizontal scroll
-                            d.style.paddingBottom = '4px'; // Scrollbar space
-                            d.style.marginRight = '20px'; // Spacing from right elements
-
-                            btnContainer.appendChild(d);
-                            photosContainer = d;
-                        }
-
-                        // Append
-                        const tempDiv = document.createElement('div');
-                        tempDiv.innerHTML = linkHtml;
-                        photosContainer.appendChild(tempDiv.firstElementChild);
-                        lucide.createIcons();
-                    }
+        // Update Counters
+        const targetCount = isKeep ? document.getElementById('statKeep') : document.getElementById('statTrash');
+        const targetHeaderCount = isKeep ? document.getElementById('countKeep') : document.getElementById('countTrash');
+        const shownCount = targetArr.length + (isKeep ? state.keepOffset : state.trashOffset);
+        if (targetCount) targetCount.innerText = shownCount;
+        if (targetHeaderCount) targetHeaderCount.innerText = shownCount;
 
-                    // 5. IMAGE RESULT
-                    // 5. IMAGE RESULT
-                    if (msg.type === 'image_result') {
-                        grandProcessed++;
-
-                        // Update Stats
-                        // Protect against division by zero
-                        const totalForPct = grandTotal || 1;
-                        const pct = Math.round((grandProcessed / totalForPct) * 100);
-                        if (document.getElementById('progressBar')) document.getElementById('progressBar').style.width = `${pct}%`;
-                        if (document.getElementById('progressPercent')) document.getElementById('progressPercent').innerText = `${pct}%`;
-
-                        // We rely on set_total to update grandTotal/statTot. 
-                        // But if msg.total > currentTotal (unexpected per-folder logic), ignore it or log it.
-                        // We strictly use grandProcessed for the counter.
-                        const sp = document.getElementById('statProc');
-                        if (sp) sp.innerText = grandProcessed;
-
-                        // Add to arrays
-                        const isKeep = (msg.decision === 'keep');
-                        const targetArr = isKeep ? allKeep : allTrash;
-                        const item = {
-                            file: msg.file,
-                            src: `${API_URL}/image?path=${encodeURIComponent(msg.path)}`,
-                            title: `${msg.file}${msg.reason ? ` [${msg.reason}]` : ''}`
-                        };
-                        targetArr.push(item);
-
-                        // Update Counters
-                        const targetCount = isKeep ? document.getElementById('statKeep') : document.getElementById('statTrash');
-                        const targetHeaderCount = isKeep ? document.getElementById('countKeep') : document.getElementById('countTrash');
-                        if (targetCount) targetCount.innerText = targetArr.length;
-                        if (targetHeaderCount) targetHeaderCount.innerText = targetArr.length;
-
-                        // Render
-                        prependImageToGrid(isKeep ? 'keep' : 'trash', item);
-                    }
+        // Render
+        prependImageToGrid(isKeep ? 'keep' : 'trash', item);
+    }
+}
 
-                } catch (e) {
-                    console.error("JSON Loop Error:", e);
-                }
-            }
-        }
-    } catch (e) {
-        stopTimers();
-        console.error("Fetch Error:", e);
+function addLinkBar(folder, link) {
+    // Dynamically add this link to the UI immediately
+    const btnContainer = document.getElementById('runBtnContainer');
+
+    // Hide placeholder if exists
+    const placeholder = btnContainer.querySelector('div[style*="visibility:hidden"]');
+    if (placeholder) placeholder.style.display = 'none';
+
+    // Generate ID
+    const existingInputs = btnContainer.querySelectorAll('input[id^="finalLinkInput"]');
+    const nextIdx = existingInputs.length;
+    const linkId = `finalLinkInput-${nextIdx}`;
+
+    // Create HTML for this link bar
+    // Fixed width 380px per user request "standard width as when there are three".
+    // Label width 130px.
+    const linkHtml = `
+        <div class="link-bar" style="flex: 0 0 auto; width: 380px; display:flex; align-items:center; background:#18181b; padding:4px 8px; border-radius:6px; border:1px solid #333;">
+            <div style="width: 130px; flex-shrink:0; display:flex; align-items:center; gap:6px; margin-right:8px; color:#aaa; font-size:0.8rem; white-space:nowrap; overflow:hidden;">
+                <i data-lucide="image" style="width:14px; flex-shrink:0;"></i>
+                <span style="text-overflow:ellipsis; overflow:hidden;">${folder || 'Zdjęcia'}</span>
+            </div>
+            <input type="text" readonly value="${link}" id="${linkId}"
+                style="flex:1; background:transparent; border:none; color:#4ade80; font-family:monospace; font-size:0.85rem; text-overflow:ellipsis;">
+            <button onclick="copyLinkCurrent('${linkId}')" title="Kopiuj"
+                style="background:transparent; border:none; color:#a855f7; cursor:pointer; padding:2px; margin-left:4px;">
+                <i data-lucide="copy" style="width:16px;"></i>
+            </button>
+        </div>
+    `;
+
+    // Check/Create Container
+    let photosContainer = btnContainer.querySelector('.photos-container-dynamic');
+    if (!photosContainer) {
+        const d = document.createElement('div');
+        d.className = 'photos-container-dynamic';
+        d.style.display = 'flex';
+        d.style.gap = '10px';
+        d.style.flex = '1';
+        d.style.overflowX = 'auto'; // Horizontal scroll
+        d.style.paddingBottom = '4px'; // Scrollbar space
+        d.style.marginRight = '20px'; // Spacing from right elements
+
+        btnContainer.appendChild(d);
+        photosContainer = d;
     }
+
+    // Append
+    const tempDiv = document.createElement('div');
+    tempDiv.innerHTML = linkHtml;
+    photosContainer.appendChild(tempDiv.firstElementChild);
+    lucide.createIcons();
 }
 
 function copyLinkCurrent(id) {
@@ -1071,9 +1180,14 @@ function formatElapsed(start, acc = 0) {
     return `${mins}:${secs}`;
 }
 
+let dlProgressText = '';
+let uploadProgressText = '';
+
 function startDlTimer() {
     stopTimers();
     dlStartTime = Date.now();
+    dlProgressText = '';
+    uploadProgressText = '';
     // Reset accumulators for new run
     aiTimeAcc = 0;
     uploadTimeAcc = 0;
@@ -1087,7 +1201,7 @@ function startDlTimer() {
     dlInterval = setInterval(() => {
         // DL doesn't accumulate because it runs once at start
         document.getElementById('timerDownload').innerText = `⬇️ DL: ${formatElapsed(dlStartTime)}`;
-        document.getElementById('statusText').innerText = "Pobieranie zdjęć...";
+        document.getElementById('statusText').innerText = `Pobieranie zdjęć... ${dlProgressText}`;
     }, 1000);
 }
 
@@ -1137,7 +1251,8 @@ function switchToUploadTimer() {
     document.getElementById('timerUpload').innerText = `☁️ UP: ${formatElapsed(uploadStartTime, uploadTimeAcc)}`;
 
     uploadInterval = setInterval(() => {
-        document.getElementById('timerUpload').innerText = `☁️ UP: ${formatElapsed(uploadStartTime, uploadTimeAcc)}`;
+        const pct = uploadProgressText ? ` · ${uploadProgressText}` : '';
+        document.getElementById('timerUpload').innerText = `☁️ UP: ${formatElapsed(uploadStartTime, uploadTimeAcc)}${pct}`;
     }, 1000);
 }
 
@@ -1240,7 +1355,8 @@ function prependImageToGrid(type, item) {
 
     const img = document.createElement('img');
     img.className = 'img-thumb';
-    img.src = item.src;
+    img.src = item.thumb || item.src; // Full size only in the lightbox
+    img.loading = 'lazy';
     img.title = item.title || item.file; // Use title if available
     img.onclick = () => openLightbox(item.src);
 
@@ -0,0 +1,85 @@
+"""
+Bytes written and time per file placement method (FilePlacer).
+
+    python bench/bench_file_placement.py [--files 200] [--size-kb 4096] [--dir /path]
+
+Each method is forced alone on the same set of files, as the pipeline moves
+downloads into the sorted folder. `written` is what FilePlacer copied,
+`disk` the drop of free space on the filesystem (a reflink shares the
+blocks, so both stay near zero). Use --dir to test another filesystem
+(Btrfs / XFS for reflinks).
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+from modules import file_placement  # noqa: E402
+from modules.file_placement import FilePlacer  # noqa: E402
+
+def make_files(folder, count, size):
+    os.makedirs(folder)
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"bench_{i:04d}.jpg")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+def free_bytes(folder):
+    os.sync()
+    st = os.statvfs(folder)
+    return st.f_bavail * st.f_frsize
+
+def run(method, sources, root):
+    dest = os.path.join(root, f"dest_{method}")
+    os.makedirs(dest)
+    if method == "rename":
+        # Rename consumes the source: move fresh copies (made outside the timing)
+        staging = os.path.join(root, "staging")
+        os.makedirs(staging)
+        sources = [shutil.copy2(path, staging) for path in sources]
+    file_placement.PLACEMENT_METHODS = (method,)  # Forced, no fallback
+    placer = FilePlacer(allow_move=(method == "rename"), link_dirs=[dest])
+
+    free_before = free_bytes(root)
+    start = time.perf_counter()
+    results = [placer.place(path, os.path.join(dest, os.path.basename(path))) for path in sources]
+    elapsed = time.perf_counter() - start
+    disk = max(0, free_before - free_bytes(root))
+
+    shutil.rmtree(dest)
+    if method == "rename":
+        shutil.rmtree(staging)
+    if None in results:
+        return None
+    return elapsed, placer.snapshot()["bytes_written"], disk
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size-kb", type=int, default=4096)
+    parser.add_argument("--dir", default=None, help="Folder on the filesystem to test (default: temp)")
+    args = parser.parse_args()
+
+    methods = file_placement.PLACEMENT_METHODS
+    with tempfile.TemporaryDirectory(dir=args.dir) as root:
+        sources = make_files(os.path.join(root, "src"), args.files, args.size_kb * 1024)
+        total_mb = args.files * args.size_kb / 1024
+        print(f"{args.files} files x {args.size_kb} KB ({total_mb:.0f} MB) in {root}")
+        for method in methods:
+            result = run(method, sources, root)
+            if result is None:
+                print(f"{method:9s}  not supported here")
+                continue
+            elapsed, written, disk = result
+            print(f"{method:9s}  {elapsed:7.3f}s  {total_mb / elapsed:8.1f} MB/s  "
+                  f"written={written / 1024 ** 2:7.1f} MB  disk={disk / 1024 ** 2:7.1f} MB")
+        file_placement.PLACEMENT_METHODS = methods
+
+if __name__ == "__main__":
+    main()
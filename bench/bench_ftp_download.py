@@ -0,0 +1,102 @@
+"""
+FTP download throughput per number of parallel connections (DOWNLOAD_WORKERS).
+
+    python bench/bench_ftp_download.py [--files 60] [--size-kb 400] [--latency-ms 80]
+
+Serves generated files from a local pyftpdlib server. Every RETR is held
+back by --latency-ms, the round trips (PASV, RETR, transfer start) a real
+server across the internet costs per file; that wait is what parallel
+connections overlap. 0 measures the local overhead only.
+"""
+import os
+import sys
+import time
+import ftplib
+import logging
+import argparse
+import tempfile
+import datetime
+import threading
+
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.ioloop import IOLoop
+from pyftpdlib.servers import ThreadedFTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+from modules.ftp_manager import FTPManager  # noqa: E402
+
+class LocalFTPManager(FTPManager):
+    """FTPManager connecting to the benchmark server's port instead of 21"""
+    port = None
+
+    def _open_connection(self):
+        ftp = ftplib.FTP()
+        ftp.connect(self.host, self.port)
+        ftp.login(self.user, self.password)
+        ftp.encoding = "utf-8"
+        return ftp
+
+class SlowHandler(FTPHandler):
+    latency = 0.0
+
+    def ftp_RETR(self, file):
+        # Threaded server: only this session waits
+        time.sleep(self.latency)
+        return super().ftp_RETR(file)
+
+def start_server(root, latency_ms):
+    authorizer = DummyAuthorizer()
+    authorizer.add_user("bench", "bench", root, perm="elr")
+    handler = type("Handler", (SlowHandler,), {"authorizer": authorizer, "latency": latency_ms / 1000})
+    server = ThreadedFTPServer(("127.0.0.1", 0), handler, ioloop=IOLoop())
+    threading.Thread(target=server.serve_forever, kwargs={"timeout": 0.1}, daemon=True).start()
+    return server, server.socket.getsockname()[1]
+
+def make_files(folder, count, size_kb):
+    os.makedirs(folder)
+    for i in range(count):
+        with open(os.path.join(folder, f"foto_2025-01-{i % 28 + 1:02d}_{i:04d}.jpg"), "wb") as f:
+            f.write(os.urandom(size_kb * 1024))
+
+def run(workers, port, local_root):
+    LocalFTPManager.port = port
+    ftp = LocalFTPManager("127.0.0.1", "bench", "bench", workers=workers)
+    if not ftp.connect():
+        raise SystemExit("Cannot connect to the benchmark server")
+    try:
+        job = {"Name": "Bench", "RemoteSpecs": ["/photos"]}
+        start = time.perf_counter()
+        plan = ftp.plan_job_files(job, datetime.datetime(2025, 1, 1), datetime.datetime(2025, 1, 31, 23, 59), local_root,
+                                  explicit_target_dir=os.path.join(local_root, f"w{workers}"))
+        paths = list(ftp.iter_job_files(*plan))
+        return time.perf_counter() - start, len(paths), sum(os.path.getsize(p) for p in paths)
+    finally:
+        ftp.disconnect()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", type=int, default=60)
+    parser.add_argument("--size-kb", type=int, default=400)
+    parser.add_argument("--latency-ms", type=int, default=80, help="added to every RETR")
+    parser.add_argument("--workers", default="1,2,4,8")
+    args = parser.parse_args()
+    logging.getLogger("pyftpdlib").addHandler(logging.NullHandler())  # Keeps serve_forever from logging every command
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "server")
+        make_files(os.path.join(root, "photos"), args.files, args.size_kb)
+        server, port = start_server(root, args.latency_ms)
+        try:
+            print(f"{args.files} files x {args.size_kb} KB, {args.latency_ms} ms per RETR")
+            base = None
+            for workers in (int(w) for w in args.workers.split(",")):
+                elapsed, count, size = run(workers, port, os.path.join(tmp, "local"))
+                base = base or elapsed
+                print(f"workers={workers:2d}  {elapsed:6.2f}s  {size / 1024 ** 2 / elapsed:7.1f} MB/s  "
+                      f"x{base / elapsed:4.2f}  files={count}")
+        finally:
+            server.close_all()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Quality gate throughput per number of worker processes, on synthetic photos.
+
+    python bench/bench_quality_gate.py [--images 120] [--size 2048x1536]
+
+Images are smoothed noise at several blur levels saved as JPEG, so both
+sure verdicts and full-size rechecks (borderline scores) are in the mix.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+from modules import quality_gate  # noqa: E402
+
+def make_images(folder, count, width, height):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        noise = rng.random((height // 8, width // 8, 3)).astype(np.float32) * 255
+        img = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+        sigma = (0, 0.8, 1.5, 3.0, 5.0)[i % 5]
+        if sigma:
+            img = cv2.GaussianBlur(img, (0, 0), sigma)
+        if sigma < 1.5:
+            img += rng.normal(0, 4, img.shape)  # Sensor noise on the sharp ones
+        path = os.path.join(folder, f"bench_{i:04d}.jpg")
+        cv2.imwrite(path, np.clip(img, 0, 255).astype(np.uint8), [cv2.IMWRITE_JPEG_QUALITY, 90])
+        paths.append(path)
+    return paths
+
+def run(paths, workers):
+    quality_gate.GATE_WORKERS = workers
+    quality_gate._reset_pool()
+    if workers > 1:
+        list(quality_gate.check_batch(paths[:workers * 2]))  # Start the pool outside the timing
+    start = time.perf_counter()
+    results = list(quality_gate.check_batch(paths))
+    elapsed = time.perf_counter() - start
+    quality_gate._reset_pool()
+    return elapsed, sum(1 for _, r in results if r[0])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=120)
+    parser.add_argument("--size", default="2048x1536")
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+
+    cores = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+    with tempfile.TemporaryDirectory() as folder:
+        paths = make_images(folder, args.images, width, height)
+        print(f"{len(paths)} images {width}x{height}, {cores} cores")
+        base = None
+        for workers in counts:
+            elapsed, rejected = run(paths, workers)
+            base = base or elapsed
+            print(f"workers={workers:2d}  {elapsed:6.2f}s  {len(paths) / elapsed:7.1f} img/s  "
+                  f"x{base / elapsed:4.2f}  rejected={rejected}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import os
+import sys
+import ftplib
+import logging
+import threading
+
+import pytest
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+def make_photo(path, seed, size=(320, 240)):
+    """Noisy JPEG: sharp and varied enough to pass the quality gate"""
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    Image.fromarray((rng.random((size[1], size[0], 3)) * 255).astype("uint8")).save(path, quality=85)
+    return path
+
+@pytest.fixture
+def ftp_server(tmp_path, monkeypatch):
+    """pyftpdlib server on a free port serving `root`, FTPManager connects to it"""
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler
+    from pyftpdlib.ioloop import IOLoop
+    from pyftpdlib.servers import ThreadedFTPServer
+    from modules import ftp_manager
+
+    logging.getLogger("pyftpdlib").setLevel(logging.WARNING)
+    root = tmp_path / "ftproot"
+    root.mkdir()
+    authorizer = DummyAuthorizer()
+    authorizer.add_user("u", "p", str(root), perm="elradfmw")
+    handler = type("Handler", (FTPHandler,), {"authorizer": authorizer})
+    # Own IOLoop: the shared default one is closed by the previous test's teardown
+    server = ThreadedFTPServer(("127.0.0.1", 0), handler, ioloop=IOLoop())
+    port = server.socket.getsockname()[1]
+    thread = threading.Thread(target=server.serve_forever, kwargs={"timeout": 0.1}, daemon=True)
+    thread.start()
+
+    def open_connection(self):
+        ftp = ftplib.FTP()
+        ftp.connect("127.0.0.1", port)
+        ftp.login("u", "p")
+        ftp.encoding = "utf-8"
+        return ftp
+
+    monkeypatch.setattr(ftp_manager.FTPManager, "_open_connection", open_connection)
+    yield root
+    server.close_all()
+    thread.join(5)
+
+@pytest.fixture
+def app_main(tmp_path, monkeypatch):
+    """
+    backend/main.py loaded from a copy in tmp_path: its data files (caches,
+    secrets.json, projects.json, ~/Documents) go there, not into the repo
+    """
+    import shutil
+    import importlib.util
+
+    backend = tmp_path / "app" / "backend"
+    backend.mkdir(parents=True)
+    shutil.copy(os.path.join(BACKEND_DIR, "main.py"), backend / "main.py")
+    os.symlink(os.path.join(BACKEND_DIR, "static"), backend / "static")
+    monkeypatch.chdir(backend)
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+
+    spec = importlib.util.spec_from_file_location("main_under_test", backend / "main.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,148 @@
+import re
+import json
+import shutil
+import time
+import threading
+
+from conftest import make_photo
+from modules import rate_limiter, image_analyzer
+from modules.batch_sizer import BatchSizer
+from modules.classifiers import GeminiBackend
+from modules.image_analyzer import ImageAnalyzer
+from modules.verdict_cache import VerdictCache
+
+class RateLimited(Exception):
+    code = 429
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel: trashes odd numbered images, 429 on the first call"""
+    def __init__(self, delay=0.15, rate_limit_first=True):
+        self.delay = delay
+        self.rate_limit_first = rate_limit_first
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.calls = []  # (start time, file names)
+
+    def generate_content(self, content, request_options=None):
+        names = re.findall(r"^\d+\. (\S+)$", content[0], re.MULTILINE)
+        with self.lock:
+            self.calls.append((time.monotonic(), names))
+            if self.rate_limit_first and len(self.calls) == 1:
+                raise RateLimited("429 Resource has been exhausted")
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+        finally:
+            with self.lock:
+                self.active -= 1
+        answer = [{"file": n, "decision": "trash" if int(n[4:7]) % 2 else "keep", "reason": "fake"} for n in names]
+        return type("Response", (), {"text": json.dumps(answer), "usage_metadata": None})()
+
+class RecordingLimiter(rate_limiter.RateLimiter):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.pauses = []
+
+    def on_rate_limited(self):
+        delay = super().on_rate_limited()
+        self.pauses.append((time.monotonic(), delay))
+        return delay
+
+class FakeRegistry:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def classifier(self, api_key, options, rate_limits):
+        return self.backend
+
+def test_batches_in_order_capped_and_backed_off(tmp_path, monkeypatch):
+    monkeypatch.setattr(rate_limiter, "BACKOFF_BASE_SECONDS", 0.4)
+    source = tmp_path / "src"
+    files = [f"img_{i:03d}.jpg" for i in range(30)]
+    for i, name in enumerate(files):
+        make_photo(str(source / name), seed=i, size=(64, 48))
+
+    model = FakeModel()
+    limiter = RecordingLimiter(6000, 10 ** 9)
+    analyzer = ImageAnalyzer("fake-key", rate_limits={"max_in_flight": 2},
+                             registry=FakeRegistry(GeminiBackend(model, "fake-model", limiter)))
+    rejected = analyzer.prepare_dirs(str(source), str(tmp_path / "sorted"), str(tmp_path / "trash"))
+    results = list(analyzer.ai_sort_generator(str(source), files, str(tmp_path / "sorted"), rejected))
+
+    # One result per image, in the order the images were sent
+    assert [r["file"] for r in results] == files
+    assert [r["decision"] for r in results] == ["trash" if i % 2 else "keep" for i in range(30)]
+    assert all(r["reason"] == "AI: fake" for r in results)
+
+    # Never more than max_in_flight requests at once, and the cap is used
+    assert model.max_active == 2
+
+    # The 429 paused every batch, the rejected one was sent again
+    (paused_at, delay), = limiter.pauses
+    assert all(start >= paused_at + delay - 0.01 for start, _ in model.calls[1:])
+    assert model.calls[0][1] in [names for _, names in model.calls[1:]]
+    assert limiter.backoff_level == 0
+    assert analyzer.last_stats["api_calls"] == len(model.calls) - 1
+
+def test_api_calls_saved_counts_real_batch_size(tmp_path):
+    source = tmp_path / "src"
+    files = [f"img_{i:03d}.jpg" for i in range(20)]
+    for i, name in enumerate(files):
+        make_photo(str(source / name), seed=i, size=(64, 48))
+    for i in range(10):
+        shutil.copy(source / files[i], source / f"dup_{i:03d}.jpg")
+        files.append(f"dup_{i:03d}.jpg")
+
+    model = FakeModel(delay=0, rate_limit_first=False)
+    analyzer = ImageAnalyzer("fake-key", registry=FakeRegistry(GeminiBackend(model, "fake-model", rate_limiter.RateLimiter(6000, 10 ** 9))))
+    analyzer.batch_sizer = BatchSizer(4, min_size=4, max_size=4)
+    rejected = analyzer.prepare_dirs(str(source), str(tmp_path / "sorted"), str(tmp_path / "trash"))
+    assert len(list(analyzer.ai_sort_generator(str(source), files, str(tmp_path / "sorted"), rejected))) == 30
+
+    stats = analyzer.last_stats
+    assert (stats["images"], stats["duplicates"], stats["api_calls"]) == (30, 10, 5)
+    assert stats["api_calls_saved"] == 3  # 30 images at 4 per call would have been 8 calls
+
+def _sort_with_cache(tmp_path, model, verdict_cache, files, run):
+    backend = GeminiBackend(model, "fake-model", rate_limiter.RateLimiter(6000, 10 ** 9))
+    analyzer = ImageAnalyzer("fake-key", verdict_cache=verdict_cache, registry=FakeRegistry(backend))
+    source = str(tmp_path / "src")
+    rejected = analyzer.prepare_dirs(source, str(tmp_path / run / "sorted"), str(tmp_path / run / "trash"))
+    results = list(analyzer.ai_sort_generator(source, files, str(tmp_path / run / "sorted"), rejected))
+    return {r["file"]: r["decision"] for r in results}, analyzer.last_stats
+
+def test_cached_verdicts_skip_the_api(tmp_path):
+    files = [f"img_{i:03d}.jpg" for i in range(8)]
+    for i, name in enumerate(files):
+        make_photo(str(tmp_path / "src" / name), seed=i, size=(64, 48))
+    model = FakeModel(delay=0, rate_limit_first=False)
+    cache = VerdictCache(str(tmp_path / "verdicts.db"))
+
+    first, stats = _sort_with_cache(tmp_path, model, cache, files, "run1")
+    calls = len(model.calls)
+    assert calls and stats["api_calls"] == calls
+
+    second, stats = _sort_with_cache(tmp_path, model, cache, files, "run2")
+    assert len(model.calls) == calls  # Not a single request
+    assert second == first and stats["cache_hits"] == len(files) and stats["api_calls"] == 0
+
+def test_purge_stale_drops_old_prompt_verdicts(tmp_path, monkeypatch):
+    files = [f"img_{i:03d}.jpg" for i in range(4)]
+    for i, name in enumerate(files):
+        make_photo(str(tmp_path / "src" / name), seed=i, size=(64, 48))
+    model = FakeModel(delay=0, rate_limit_first=False)
+    cache = VerdictCache(str(tmp_path / "verdicts.db"))
+    _sort_with_cache(tmp_path, model, cache, files, "run1")
+
+    # The prompt changed: verdicts of the old one are removed at startup
+    monkeypatch.setattr(image_analyzer, "PROMPT_VERSION", "new-prompt")
+    assert cache.purge_stale("new-prompt") == len(files)
+    assert cache.purge_stale("new-prompt") == 0
+    calls = len(model.calls)
+
+    _, stats = _sort_with_cache(tmp_path, model, cache, files, "run2")
+    assert stats.get("cache_hits", 0) == 0 and len(model.calls) > calls
+    assert len(cache.get_many([image_analyzer.file_digest(str(tmp_path / "src" / f)) for f in files],
+                              "fake-model", "new-prompt")) == len(files)
@@ -0,0 +1,75 @@
+import json
+import time
+import socket
+import threading
+
+import httpx
+import pytest
+import uvicorn
+
+from modules.job_manager import JobManager
+
+SUBSCRIBERS = 45  # More than the 40 threads of the default threadpool
+
+@pytest.fixture
+def server(app_main):
+    """The app served by uvicorn on a free port, so responses really stream"""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    srv = uvicorn.Server(uvicorn.Config(app_main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=srv.run, daemon=True)
+    thread.start()
+    while not srv.started:
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}"
+    srv.should_exit = True
+    thread.join(10)
+
+def _read_events(base_url, job_id, seen, started):
+    with httpx.stream("GET", f"{base_url}/jobs/{job_id}/events", timeout=30) as response:
+        for line in response.iter_lines():
+            if line.startswith("data: "):
+                data = json.loads(line[6:])
+                seen.append(data)
+                started.set()
+                if data.get("type") == "job_end":
+                    return
+
+def test_endpoints_respond_while_jobs_stream(app_main, server, monkeypatch):
+    release = threading.Event()
+
+    def slow_runner(project_id, date_from, date_to, cancel_event):
+        # A long download without events: every subscriber waits for the next one
+        yield {"type": "set_total", "count": 20}
+        release.wait(20)
+        for i in range(20):
+            time.sleep(0.01)
+            yield {"type": "image_result", "file": f"{i}.jpg", "decision": "keep", "current": i + 1, "total": 20}
+
+    monkeypatch.setattr(app_main, "job_manager", JobManager(slow_runner))
+    job_id = httpx.post(f"{server}/execute", json={"project_id": "p1", "date_from": "2025-01-01", "date_to": "2025-01-31"}).json()["job_id"]
+
+    streams = []
+    for _ in range(SUBSCRIBERS):
+        seen, started = [], threading.Event()
+        t = threading.Thread(target=_read_events, args=(server, job_id, seen, started), daemon=True)
+        t.start()
+        streams.append((t, seen, started))
+    try:
+        assert all(started.wait(10) for _, _, started in streams)
+        time.sleep(0.3)  # All subscribers parked
+
+        for path in ("/projects", "/jobs", f"/jobs/{job_id}", "/settings"):
+            start = time.monotonic()
+            assert httpx.get(f"{server}{path}", timeout=5).status_code == 200
+            assert time.monotonic() - start < 1.0, path
+    finally:
+        release.set()
+
+    for t, seen, _ in streams:
+        t.join(15)
+        assert not t.is_alive()
+        assert seen[0] == {"type": "set_total", "count": 20}
+        assert seen[-1] == {"type": "job_end", "status": "done"}
+        assert len(seen) == 22
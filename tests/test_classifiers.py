@@ -0,0 +1,94 @@
+import sys
+import json
+import types
+
+import numpy as np
+import pytest
+
+from conftest import make_photo
+from modules.classifiers import OnnxBackend, CascadeBackend
+
+class FakeSession:
+    """Stands in for onnxruntime.InferenceSession: returns `outputs` rows for the batch"""
+    outputs = []
+
+    def __init__(self, path, options, providers=None):
+        self.inputs = []
+
+    def get_inputs(self):
+        return [types.SimpleNamespace(name="input")]
+
+    def run(self, output_names, feed):
+        self.inputs.append(feed["input"])
+        return [np.array(FakeSession.outputs[:len(feed["input"])], dtype=np.float32)]
+
+@pytest.fixture
+def onnx_model(tmp_path, monkeypatch):
+    """Model file with the onnxruntime module stubbed, returns (model path, image folder, files)"""
+    fake = types.ModuleType("onnxruntime")
+    fake.SessionOptions = lambda: types.SimpleNamespace(intra_op_num_threads=0)
+    fake.InferenceSession = FakeSession
+    monkeypatch.setitem(sys.modules, "onnxruntime", fake)
+
+    model_path = tmp_path / "model.onnx"
+    model_path.write_bytes(b"not a real model")
+    files = [f"{i}.jpg" for i in range(3)]
+    for i, name in enumerate(files):
+        make_photo(str(tmp_path / "src" / name), seed=i, size=(64, 48))
+    return str(model_path), str(tmp_path / "src"), files
+
+def read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def test_logits_are_turned_into_probabilities(onnx_model):
+    model_path, source, files = onnx_model
+    FakeSession.outputs = [[2.0, 0.0], [0.0, 3.0], [-1.0, 1.0]]
+    predictions, errors = OnnxBackend(model_path).predict(files, source, read_file)
+
+    assert errors == {}
+    assert [predictions[f][0] for f in files] == ["keep", "trash", "trash"]
+    assert predictions["0.jpg"][1] == pytest.approx(1 / (1 + np.exp(-2)))
+    assert predictions["1.jpg"][1] == pytest.approx(1 / (1 + np.exp(-3)))
+
+def test_probabilities_are_used_as_they_are(onnx_model):
+    model_path, source, files = onnx_model
+    FakeSession.outputs = [[0.7, 0.3], [0.2, 0.8], [0.5, 0.5]]
+    predictions, _ = OnnxBackend(model_path).predict(files, source, read_file)
+    assert predictions["0.jpg"] == ("keep", pytest.approx(0.7))
+    assert predictions["1.jpg"] == ("trash", pytest.approx(0.8))
+
+def test_labels_and_input_size_from_meta(onnx_model):
+    model_path, source, files = onnx_model
+    with open(model_path.replace(".onnx", ".json"), "w", encoding="utf-8") as f:
+        json.dump({"labels": ["trash", "keep", "other"], "input_size": 32}, f)
+    FakeSession.outputs = [[0.9, 0.1, 0.0], [0.1, 0.8, 0.1], [0.0, 0.1, 0.9]]
+    backend = OnnxBackend(model_path)
+    results = backend.classify(files, source, read_file, {})
+
+    assert backend.session.inputs[0].shape == (3, 3, 32, 32)
+    assert [results[f][0] for f in files] == ["trash", "keep", "keep"]  # Unknown labels are kept
+    assert results["2.jpg"][1] == "Local: other (0.90)"
+
+class RecordingRemote:
+    name = "fake-gemini"
+
+    def __init__(self):
+        self.sent = []
+
+    def classify(self, batch_files, source_folder, load_proxy, metrics):
+        self.sent.extend(batch_files)
+        return {f: ("keep", "AI: fake") for f in batch_files}
+
+def test_cascade_sends_only_unsure_images_to_gemini(onnx_model):
+    model_path, source, files = onnx_model
+    FakeSession.outputs = [[0.95, 0.05], [0.4, 0.6], [0.1, 0.9]]
+    remote = RecordingRemote()
+    results = CascadeBackend(OnnxBackend(model_path), remote, threshold=0.85).classify(files, source, read_file, {})
+
+    assert remote.sent == ["1.jpg"]
+    assert results == {
+        "0.jpg": ("keep", "Local: keep (0.95)"),
+        "1.jpg": ("keep", "AI: fake"),
+        "2.jpg": ("trash", "Local: trash (0.90)"),
+    }
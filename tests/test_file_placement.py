@@ -0,0 +1,75 @@
+import os
+import errno
+
+import pytest
+
+from modules import file_placement
+from modules.file_placement import FilePlacer
+
+@pytest.fixture
+def no_reflink(monkeypatch):
+    def unsupported(src_path, dest_path):
+        raise OSError(errno.EOPNOTSUPP, "reflink not supported")
+    monkeypatch.setattr(file_placement, "_reflink", unsupported)
+
+@pytest.fixture
+def dirs(tmp_path):
+    for name in ("cache", "work", "preview"):
+        (tmp_path / name).mkdir()
+    src = tmp_path / "cache" / "blob.jpg"
+    src.write_bytes(b"cached photo")
+    return src, tmp_path / "work", tmp_path / "preview"
+
+def test_reflink_first(dirs, monkeypatch):
+    src, work, preview = dirs
+    cloned = []
+    monkeypatch.setattr(file_placement, "_reflink", lambda s, d: cloned.append(d) or open(d, "wb").write(open(s, "rb").read()))
+    placer = FilePlacer(link_dirs=[work])
+    assert placer.place(str(src), str(preview / "a.jpg")) == "reflink"
+    assert placer.place(str(src), str(work / "a.jpg")) == "reflink"
+    assert len(cloned) == 2 and placer.snapshot()["bytes_written"] == 0
+
+def test_hardlink_only_in_link_dirs(dirs, no_reflink):
+    src, work, preview = dirs
+    placer = FilePlacer(link_dirs=[work])
+    os.makedirs(work / "Folder A")
+    assert placer.place(str(src), str(work / "Folder A" / "a.jpg")) == "hardlink"
+    assert os.path.samefile(src, work / "Folder A" / "a.jpg")
+
+    # User-visible preview: a copy, editing it leaves the cache blob alone
+    assert placer.place(str(src), str(preview / "a.jpg")) == "copy"
+    (preview / "a.jpg").write_bytes(b"edited")
+    assert src.read_bytes() == b"cached photo"
+    stats = placer.snapshot()
+    assert (stats["hardlink"], stats["copy"], stats["bytes_written"]) == (1, 1, len(b"cached photo"))
+
+def test_rerun_replaces_old_hardlink_outside_link_dirs(dirs, no_reflink):
+    src, work, preview = dirs
+    os.link(src, preview / "a.jpg")  # Left by an older version
+    assert FilePlacer(link_dirs=[work]).place(str(src), str(preview / "a.jpg")) == "copy"
+    assert not os.path.samefile(src, preview / "a.jpg")
+
+def test_copy_fallback_is_remembered(dirs, no_reflink, monkeypatch):
+    src, work, _ = dirs
+    links = []
+    def cross_device(s, d):
+        links.append(d)
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+    monkeypatch.setattr(file_placement.os, "link", cross_device)
+    placer = FilePlacer(link_dirs=[work])
+    assert placer.place(str(src), str(work / "a.jpg")) == "copy"
+    assert placer.place(str(src), str(work / "b.jpg")) == "copy"
+    assert len(links) == 1  # Not tried again for the same devices
+    assert (work / "b.jpg").read_bytes() == b"cached photo"
+
+def test_linked_source_is_not_moved_out(dirs, no_reflink):
+    src, work, preview = dirs
+    download = work / "download.jpg"
+    os.link(src, download)  # Download hardlinked from the cache
+    placer = FilePlacer(allow_move=True, link_dirs=[work])
+    assert placer.place(str(download), str(preview / "a.jpg")) == "copy"
+
+    own = work / "own.jpg"
+    own.write_bytes(b"only copy")
+    assert placer.place(str(own), str(preview / "b.jpg")) == "rename"
+    assert not own.exists()
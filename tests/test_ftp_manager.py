@@ -0,0 +1,91 @@
+import os
+import datetime
+
+from modules.ftp_cache import FTPCache
+from modules.ftp_manager import FTPManager
+from modules.remote_index import RemoteIndex
+
+def _run(tmp_path, cache, index, target):
+    ftp = FTPManager("127.0.0.1", "u", "p", cache=cache, index=index)
+    assert ftp.connect()
+    try:
+        job = {"Name": "F", "RemoteSpecs": ["/F"]}
+        plan = ftp.plan_job_files(job, datetime.datetime(2025, 1, 1), datetime.datetime(2025, 1, 31, 23, 59), str(tmp_path), str(tmp_path / target))
+        return [open(p, "rb").read() for p in ftp.iter_job_files(*plan)], ftp.last_stats
+    finally:
+        ftp.disconnect()
+
+def _age_listings(index):
+    # As if the last listing was made before the trust window
+    with index.lock, index.conn:
+        index.conn.execute("UPDATE dirs SET listed = '2000-01-01T00:00:00'")
+
+def test_file_overwritten_in_place_is_downloaded_again(ftp_server, tmp_path):
+    folder = ftp_server / "F"
+    folder.mkdir()
+    photo = folder / "foto_2025-01-10.jpg"
+    photo.write_bytes(b"old photo")
+    cache = FTPCache(str(tmp_path / "ftp_cache"))
+    index = RemoteIndex(str(tmp_path / "remote_index.db"))
+
+    contents, stats = _run(tmp_path, cache, index, "run1")
+    assert contents == [b"old photo"] and stats["downloaded"] == 1
+
+    # Same name and size, newer file: the folder mtime does not change
+    dir_times = os.stat(folder)
+    photo.write_bytes(b"new photo")
+    os.utime(photo, (dir_times.st_mtime + 120, dir_times.st_mtime + 120))
+    os.utime(folder, (dir_times.st_atime, dir_times.st_mtime))
+
+    _age_listings(index)
+    contents, stats = _run(tmp_path, cache, index, "run2")
+    assert contents == [b"new photo"] and stats["downloaded"] == 1 and stats["cached"] == 0
+
+    # Unchanged since -> served from the cache
+    contents, stats = _run(tmp_path, cache, index, "run3")
+    assert contents == [b"new photo"] and stats["cached"] == 1
+
+def test_run_trusts_recent_listing_and_skips_mlst(ftp_server, tmp_path, monkeypatch):
+    (ftp_server / "F").mkdir()
+    (ftp_server / "F" / "foto_2025-01-10.jpg").write_bytes(b"photo")
+    cache = FTPCache(str(tmp_path / "ftp_cache"))
+    index = RemoteIndex(str(tmp_path / "remote_index.db"))
+    calls = []  # /F has no date tokens: always open
+    list_dir, dir_modify = FTPManager.list_dir, FTPManager.dir_modify
+    monkeypatch.setattr(FTPManager, "list_dir", lambda self, *a, **kw: calls.append("LIST") or list_dir(self, *a, **kw))
+    monkeypatch.setattr(FTPManager, "dir_modify", lambda self, *a: calls.append("MLST") or dir_modify(self, *a))
+
+    _run(tmp_path, cache, index, "run1")
+    assert calls == ["LIST"]
+
+    # Listed moments ago (by this run or the crawler): no round trip at all
+    calls.clear()
+    contents, stats = _run(tmp_path, cache, index, "run2")
+    assert calls == [] and contents == [b"photo"] and stats["cached"] == 1
+
+    # Older listing: relisted, the folder mtime is not asked for
+    _age_listings(index)
+    _run(tmp_path, cache, index, "run3")
+    assert calls == ["LIST"]
+
+def test_blob_evicted_after_plan_is_downloaded(ftp_server, tmp_path):
+    (ftp_server / "F").mkdir()
+    for day in (10, 11):
+        (ftp_server / "F" / f"foto_2025-01-{day}.jpg").write_bytes(f"photo {day}".encode())
+    cache = FTPCache(str(tmp_path / "ftp_cache"))
+    _run(tmp_path, cache, None, "run1")
+
+    ftp = FTPManager("127.0.0.1", "u", "p", cache=cache)
+    assert ftp.connect()
+    try:
+        job = {"Name": "F", "RemoteSpecs": ["/F"]}
+        plan = ftp.plan_job_files(job, datetime.datetime(2025, 1, 1), datetime.datetime(2025, 1, 31, 23, 59), str(tmp_path), str(tmp_path / "run2"))
+        assert len(plan[2]) == 2
+        # Another job's eviction removes a blob this plan relies on
+        os.remove(plan[2][str(tmp_path / "run2" / "foto_2025-01-10.jpg")][0])
+        paths = list(ftp.iter_job_files(*plan))
+    finally:
+        ftp.disconnect()
+
+    assert sorted(open(p, "rb").read() for p in paths) == [b"photo 10", b"photo 11"]
+    assert ftp.last_stats["cached"] == 1 and ftp.last_stats["downloaded"] == 1
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from conftest import make_photo
+from modules import quality_gate
+from modules.image_cache import ImageCache, prepare_image
+
+@pytest.mark.parametrize("name, value", [
+    ("GATE_VERSION", quality_gate.GATE_VERSION + 1),
+    ("GATE_SCALE", 4),
+    ("GATE_STD_MARGIN", 2.0),
+    ("GATE_BLUR_SURE_BLURRY", 40.0),
+    ("GATE_BLUR_SURE_SHARP", 200.0),
+])
+def test_gate_change_invalidates_cached_verdict(tmp_path, monkeypatch, name, value):
+    photo = make_photo(str(tmp_path / "a.jpg"), seed=1)
+    cache = ImageCache(str(tmp_path / "cache"))
+    digest = prepare_image(photo, cache.root)["digest"]
+    assert cache.get(digest) is not None
+
+    monkeypatch.setattr(quality_gate, name, value)
+    assert cache.get(digest) is None
+    prepare_image(photo, cache.root)  # Recomputed with the new settings
+    assert cache.get(digest) is not None
+
+def _cache_bytes(root):
+    return sum(f.stat().st_size for f in root.rglob("*") if f.is_file())
+
+def test_thumbnails_made_on_request_stay_under_the_limit(tmp_path):
+    photos = [make_photo(str(tmp_path / "src" / f"{i}.jpg"), seed=i) for i in range(12)]
+    root = tmp_path / "cache"
+    cache = ImageCache(str(root), evict_step=1)
+    cache.thumbnail(photos[0])
+    cache.max_bytes = _cache_bytes(root) * 3  # Room for about three thumbnails
+
+    for photo in photos[1:]:
+        digest, thumb_path = cache.thumbnail(photo)
+        assert _cache_bytes(root) <= cache.max_bytes
+    assert os.path.exists(thumb_path)  # The newest one is kept
+
+def test_eviction_waits_for_evict_step(tmp_path):
+    photos = [make_photo(str(tmp_path / "src" / f"{i}.jpg"), seed=i) for i in range(3)]
+    root = tmp_path / "cache"
+    cache = ImageCache(str(root), max_bytes=1, evict_step=10 ** 9)
+    for photo in photos:
+        cache.thumbnail(photo)
+    assert len(list(root.rglob("*.thumb.webp"))) == 3
@@ -0,0 +1,30 @@
+from modules import job_manager
+from modules.job_manager import Job
+
+
+def test_replay_after_dropped_events_starts_with_snapshot(monkeypatch):
+    monkeypatch.setattr(job_manager, "JOB_EVENTS_BUFFER", 5)
+    job = Job("p1", "2024-01-01", "2024-01-02")
+
+    job.publish({"type": "set_total", "count": 4})
+    job.publish({"type": "link_result", "folder": "A", "link": "https://s3/a.zip"})
+    for i, decision in enumerate(["keep", "trash", "keep", "keep"]):
+        job.publish({"type": "image_result", "file": f"{i}.jpg", "decision": decision})
+    job.publish({"log": "koniec"})
+    # 7 events, the first 2 are gone: set_total and the link
+
+    events = job.events_after(0)
+    snapshot_id, snapshot = events[0]
+    assert snapshot_id == 2
+    assert snapshot == {"type": "snapshot", "total": 4, "processed": 0, "kept": 0, "trashed": 0,
+                        "links": [{"folder": "A", "link": "https://s3/a.zip"}]}
+    assert [eid for eid, _ in events[1:]] == [3, 4, 5, 6, 7]
+
+    # Fold the rest too: snapshot + buffer always add up to the whole job
+    for i in range(5):
+        job.publish({"log": str(i)})
+    _, snapshot = job.events_after(0)[0]
+    assert (snapshot["total"], snapshot["processed"], snapshot["kept"], snapshot["trashed"]) == (4, 4, 3, 1)
+
+    # Clients inside the buffer get no snapshot
+    assert all(data.get("type") != "snapshot" for _, data in job.events_after(job.dropped["last_id"]))
@@ -0,0 +1,86 @@
+import datetime
+
+import pytest
+
+from modules.ftp_cache import FTPCache
+from modules.ftp_manager import FTPManager
+from modules.path_templates import compile_template, expand_paths
+
+D = datetime.date
+
+@pytest.mark.parametrize("template, day, path", [
+    ("/{yyyy}/{yy}/{MM}/{dd}", D(2025, 3, 7), "/2025/25/03/07"),
+    ("/{yyyy}/{quarter}/{yyyy-MM}", D(2025, 11, 30), "/2025/q4/2025-11"),
+    ("/{yyyy-MM}/{week}", D(2025, 2, 28), "/2025-02/w4"),
+    ("/{yyyy-MM}/{week}", D(2025, 1, 29), "/2025-01/w5"),
+    ("/{yyyy}/{ww}", D(2025, 6, 2), "/2025/23"),
+    ("/{iso-week}", D(2025, 12, 29), "/2026-W01"),  # ISO year differs from the calendar year
+    ("/{iso-week}", D(2024, 12, 30), "/2025-W01"),
+    ("/{iso-week}", D(2021, 1, 3), "/2020-W53"),
+    ("/{ww}", D(2025, 12, 29), "/01"),
+    ("/{yyyy-MM-dd}/foto", D(2025, 1, 5), "/2025-01-05/foto"),
+])
+def test_render(template, day, path):
+    assert compile_template(template).render(day) == path
+
+@pytest.mark.parametrize("template, day, first, last", [
+    ("/{yyyy}", D(2025, 5, 5), D(2025, 1, 1), D(2025, 12, 31)),
+    ("/{quarter}", D(2025, 5, 5), D(2025, 4, 1), D(2025, 6, 30)),
+    ("/{week}", D(2025, 2, 28), D(2025, 2, 22), D(2025, 2, 28)),
+    ("/{week}", D(2025, 1, 30), D(2025, 1, 29), D(2025, 1, 31)),
+    ("/{iso-week}", D(2025, 12, 31), D(2025, 12, 29), D(2026, 1, 4)),
+    # Tokens of different periods: the folder lasts as long as all of them
+    ("/{yyyy}/{ww}", D(2025, 12, 30), D(2025, 12, 29), D(2025, 12, 31)),
+    ("/{yyyy-MM}/{ww}", D(2025, 5, 1), D(2025, 5, 1), D(2025, 5, 4)),
+    ("/static/path", D(2025, 5, 1), None, None),
+])
+def test_period(template, day, first, last):
+    assert compile_template(template).period(day) == (first, last)
+
+@pytest.mark.parametrize("templates, date_from, date_to, expected", [
+    # One path per folder, not per day
+    (["/{yyyy}/A"], D(2025, 1, 1), D(2025, 12, 31), {"/2025/A": D(2025, 12, 31)}),
+    (["/{yyyy}/{quarter}/A/{yyyy-MM}"], D(2025, 3, 20), D(2025, 4, 3),
+     {"/2025/q1/A/2025-03": D(2025, 3, 31), "/2025/q2/A/2025-04": D(2025, 4, 30)}),
+    # Week folders across the new year: an ISO week folder spans it, {yyyy} splits the week in two
+    (["/{iso-week}"], D(2025, 12, 25), D(2026, 1, 6),
+     {"/2025-W52": D(2025, 12, 28), "/2026-W01": D(2026, 1, 4), "/2026-W02": D(2026, 1, 11)}),
+    (["/{yyyy}/{ww}"], D(2025, 12, 29), D(2026, 1, 2),
+     {"/2025/01": D(2025, 12, 31), "/2026/01": D(2026, 1, 4)}),
+    # Both variants of a project folder, plus one without tokens
+    (["/{yyyy}/A/{yyyy-MM}/f", "/{yyyy}/{quarter}/A/{yyyy-MM}/f", "/inbox"], D(2025, 6, 30), D(2025, 7, 1),
+     {"/2025/A/2025-06/f": D(2025, 6, 30), "/2025/A/2025-07/f": D(2025, 7, 31),
+      "/2025/q2/A/2025-06/f": D(2025, 6, 30), "/2025/q3/A/2025-07/f": D(2025, 7, 31), "/inbox": None}),
+])
+def test_expand_paths(templates, date_from, date_to, expected):
+    assert expand_paths(templates, date_from, date_to) == expected
+
+def test_unknown_token_is_rejected():
+    with pytest.raises(ValueError, match="Nieznany znacznik"):
+        compile_template("/{yyyy}/{month}")
+
+@pytest.mark.parametrize("day, cached", [
+    (D(2024, 3, 15), True),  # Closed period: the missing variant is remembered
+    (datetime.date.today(), False),  # Open period: it may still be created
+])
+def test_dead_variant_cached_only_when_closed(ftp_server, tmp_path, day, cached):
+    paths = expand_paths(["/{yyyy}/A/{yyyy-MM}/f", "/{yyyy}/{quarter}/A/{yyyy-MM}/f"], day, day)
+    live, dead = paths
+    (ftp_server / live.strip("/")).mkdir(parents=True)
+    cache = FTPCache(str(tmp_path / "ftp_cache"))
+
+    for run in range(2):
+        ftp = FTPManager("127.0.0.1", "u", "p", cache=cache)
+        assert ftp.connect()
+        cwds = []
+        cwd = ftp.ftp.cwd
+        ftp.ftp.cwd = lambda path: cwds.append(path) or cwd(path)
+        try:
+            results = {path: ftp.list_dir(path, closed=ftp._is_closed(end)) for path, end in paths.items()}
+        finally:
+            ftp.disconnect()
+        assert results[live] == {} and results[dead] is None
+
+    # Second run: a cached dead variant costs no cwd
+    assert (dead in cwds) is not cached
+    assert ftp.dead_paths == (1 if cached else 0)
@@ -0,0 +1,69 @@
+import zipfile
+
+from conftest import make_photo
+from modules.ftp_manager import FTPManager
+from modules.pipeline import FolderPipeline
+
+def _work_dirs(tmp_path):
+    dirs = {name: str(tmp_path / name) for name in ("temp_download", "temp_sorted", "trash_root", "zip_dest")}
+    for path in dirs.values():
+        (tmp_path / path).mkdir(parents=True, exist_ok=True)
+    return dirs
+
+def test_no_ai_job_archives_every_folder(ftp_server, tmp_path):
+    for folder, count in (("A", 12), ("B", 7)):
+        for i in range(count):
+            make_photo(str(ftp_server / folder / f"foto_2025-01-{i + 1:02d}.jpg"), seed=i)
+
+    ftp = FTPManager("127.0.0.1", "u", "p")
+    assert ftp.connect()
+    proj = {"name": "Raport"}
+    structure = [{"id": "a1b2c3", "name": "A", "paths": ["/A"]}, {"id": "d4e5f6", "name": "B", "paths": ["/B"]}]
+    dirs = _work_dirs(tmp_path)
+    pipeline = FolderPipeline(proj, ftp, "", {}, dirs, "2025-01-01", "2025-01-31")
+    try:
+        events = list(pipeline.run(structure))
+    finally:
+        ftp.disconnect()
+
+    assert pipeline.report_lines == ["Folder A: 12 pobranych (Bez AI).", "Folder B: 7 pobranych (Bez AI)."]
+    for folder, count in (("A", 12), ("B", 7)):
+        zip_path = tmp_path / "zip_dest" / f"Raport {folder} 2025-01-01_2025-01-31.zip"
+        with zipfile.ZipFile(zip_path) as zf:
+            assert len(zf.namelist()) == count
+    assert any("Zamykanie ZIP" in e.get("log", "") for e in events)
+
+class BrokenFTP:
+    last_stats = {}
+
+    def plan_job_files(self, *args, **kwargs):
+        raise ConnectionResetError("połączenie zerwane")
+
+def test_stage_error_names_the_stage(tmp_path):
+    pipeline = FolderPipeline({"name": "Raport"}, BrokenFTP(), "", {}, _work_dirs(tmp_path), "2025-01-01", "2025-01-31")
+    events = list(pipeline.run([{"id": "a1b2c3", "name": "A", "paths": ["/A"]}]))
+
+    assert "Błąd pobierania (A): połączenie zerwane" in [e.get("log") for e in events]
+    assert pipeline.report_lines == ["Folder A: Błąd pobierania (A): połączenie zerwane"]
+
+def test_local_mode_without_model_keeps_the_folder(ftp_server, tmp_path):
+    for i in range(5):
+        make_photo(str(ftp_server / "A" / f"foto_2025-01-{i + 1:02d}.jpg"), seed=i)
+
+    ftp = FTPManager("127.0.0.1", "u", "p")
+    assert ftp.connect()
+    missing = str(tmp_path / "missing.onnx")
+    options = {"classifier": {"mode": "local", "model_path": missing}}
+    pipeline = FolderPipeline({"name": "Raport"}, ftp, "", {}, _work_dirs(tmp_path), "2025-01-01", "2025-01-31",
+                              analyzer_options=options)
+    try:
+        events = list(pipeline.run([{"id": "a1b2c3", "name": "A", "paths": ["/A"]}]))
+    finally:
+        ftp.disconnect()
+
+    # No Gemini key and no model: reported once, every photo still archived
+    errors = [e["log"] for e in events if e.get("log", "").startswith("Błąd AI")]
+    assert errors == [f"Błąd AI (A): Local model not found: {missing}. Kopiowanie bez analizy..."]
+    assert pipeline.report_lines == [f"Folder A: Błąd AI (A): Local model not found: {missing}. Zachowano 5 zdjęć bez analizy."]
+    with zipfile.ZipFile(tmp_path / "zip_dest" / "Raport 2025-01-01_2025-01-31.zip") as zf:
+        assert len(zf.namelist()) == 5
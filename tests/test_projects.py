@@ -0,0 +1,45 @@
+import json
+import threading
+
+from modules.projects_manager import ProjectStore
+
+THREADS = 8
+SAVES = 25
+
+def _project(thread, i):
+    return {"id": f"p{thread}-{i}", "name": f"Projekt {thread}/{i}", "structure": [{"id": "a1", "paths": ["/A"]}]}
+
+def test_parallel_saves_lose_nothing(tmp_path):
+    path = tmp_path / "projects.json"
+    store = ProjectStore(str(path))
+    start = threading.Barrier(THREADS)
+
+    def worker(thread):
+        start.wait()
+        for i in range(SAVES):
+            store.save(_project(thread, i))
+            store.save({**_project(thread, 0), "name": f"Projekt {thread} v{i}"})  # Update in place
+            store.all()
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in range(THREADS)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    on_disk = json.loads(path.read_text(encoding="utf-8"))  # Valid JSON, not a half written file
+    expected = {f"p{t}-{i}" for t in range(THREADS) for i in range(SAVES)}
+    assert sorted(p["id"] for p in on_disk) == sorted(expected)
+    assert all(p["name"] == f"Projekt {t} v{SAVES - 1}" for t in range(THREADS) for p in on_disk if p["id"] == f"p{t}-0")
+    assert ProjectStore(str(path)).all() == on_disk == store.all()
+    assert list(tmp_path.iterdir()) == [path]  # No temp files left
+
+def test_returned_projects_are_copies(tmp_path):
+    store = ProjectStore(str(tmp_path / "projects.json"))
+    project = _project(0, 0)
+    store.save(project)
+    project["name"] = "changed after save"
+
+    got = store.get("p0-0")
+    got["structure"][0]["paths"].append("/B")
+    store.all()[0]["name"] = "changed"
+
+    assert store.get("p0-0") == _project(0, 0)
@@ -0,0 +1,44 @@
+import os
+import sys
+import types
+
+from PIL import Image
+
+from conftest import make_photo
+from modules import quality_gate
+
+def test_sure_blurry_band_rejects_above_full_size_threshold(monkeypatch):
+    # Reduced-scale score between BLUR_VAR_THRESHOLD (30) and GATE_BLUR_SURE_BLURRY (35)
+    monkeypatch.setattr(quality_gate, "_scores", lambda img_np: (40.0, 32.0))
+    img = Image.new("RGB", (8, 8))
+    assert quality_gate.gate_image("unused.jpg", img, reduced=True) == (True, "trash", "Blurry (32.0)")
+
+def test_check_batch_in_spawned_pool(tmp_path, monkeypatch):
+    monkeypatch.setattr(quality_gate, "GATE_WORKERS", 2)
+    paths = [make_photo(str(tmp_path / f"{i}.jpg"), seed=i) for i in range(6)]
+    paths.append(str(tmp_path / "solid.jpg"))
+    Image.new("RGB", (320, 240), (120, 120, 120)).save(paths[-1])
+    try:
+        results = list(quality_gate.check_batch(paths))
+    finally:
+        quality_gate._reset_pool()
+    assert [p for p, _ in results] == paths
+    assert [r[0] for _, r in results] == [False] * 6 + [True]
+
+def test_spawned_workers_leave_running_jobs_alone(app_main, tmp_path, monkeypatch):
+    # `python main.py`: the spawned workers re-import main.py as __mp_main__
+    main_module = types.ModuleType("__main__")
+    main_module.__file__ = app_main.__file__
+    main_module.__spec__ = None
+    monkeypatch.setitem(sys.modules, "__main__", main_module)
+    monkeypatch.setattr(quality_gate, "GATE_WORKERS", 2)
+
+    # Download of a job running while the pool starts
+    job_file = make_photo(str(tmp_path / "app" / "temp_raw_download" / "p1_2025-01-01_raw" / "0.jpg"), seed=0)
+    paths = [make_photo(str(tmp_path / f"{i}.jpg"), seed=i) for i in range(4)]
+    quality_gate._reset_pool()
+    try:
+        assert len(list(quality_gate.check_batch(paths))) == 4
+    finally:
+        quality_gate._reset_pool()
+    assert os.path.exists(job_file)
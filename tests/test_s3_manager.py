@@ -0,0 +1,103 @@
+import os
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from modules import s3_manager
+from modules.s3_manager import S3Manager
+from modules.pipeline import FolderPipeline
+
+REGION = "eu-north-1"
+BUCKET = "raporty-test"
+MB = 1024 * 1024
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setattr(s3_manager, "_clients", {})  # No client from another test's mock
+    with mock_aws():
+        client = boto3.client("s3", region_name=REGION)
+        client.create_bucket(Bucket=BUCKET, CreateBucketConfiguration={"LocationConstraint": REGION})
+        yield client
+
+def _manager():
+    return S3Manager("testing", "testing", REGION, BUCKET, part_size_mb=5, max_concurrency=4)
+
+def test_file_upload_is_multipart_with_digest(s3, tmp_path):
+    path = tmp_path / "Raport A.zip"
+    data = os.urandom(12 * MB)
+    path.write_bytes(data)
+    progress = []
+
+    link = _manager().upload_and_generate_link(str(path), progress_callback=lambda sent, total: progress.append((sent, total)),
+                                               content_digest="abc123")
+
+    head = s3.head_object(Bucket=BUCKET, Key="Raport_A.zip")
+    assert head["ETag"].strip('"').endswith("-3")  # 5 + 5 + 2 MB parts
+    assert head["Metadata"] == {"content-digest": "abc123"}
+    assert s3.get_object(Bucket=BUCKET, Key="Raport_A.zip")["Body"].read() == data
+    assert progress[-1] == (len(data), len(data))
+    assert "Raport_A.zip" in link
+
+def test_stream_writer_sends_parts_while_writing(s3):
+    writer = _manager().open_stream("Strumień B.zip")
+    data = os.urandom(11 * MB)
+    for pos in range(0, len(data), 256 * 1024):
+        writer.write(data[pos:pos + 256 * 1024])
+    assert writer.upload_id is not None and len(writer.parts) == 2  # Full parts already on their way
+    assert writer.close() == len(data)
+
+    head = s3.head_object(Bucket=BUCKET, Key="Strumień_B.zip")
+    assert head["ETag"].strip('"').endswith("-3")
+    assert s3.get_object(Bucket=BUCKET, Key="Strumień_B.zip")["Body"].read() == data
+
+def test_aborted_stream_leaves_nothing(s3):
+    writer = _manager().open_stream("C.zip")
+    writer.write(os.urandom(6 * MB))
+    writer.abort()
+    assert "Contents" not in s3.list_objects_v2(Bucket=BUCKET)
+    assert not s3.list_multipart_uploads(Bucket=BUCKET).get("Uploads")
+
+def test_has_identical(s3, tmp_path):
+    path = tmp_path / "D.zip"
+    path.write_bytes(b"zip")
+    manager = _manager()
+    assert not manager.has_identical("D.zip", "abc123")  # Not uploaded yet
+    manager.upload_and_generate_link(str(path), content_digest="abc123")
+    assert manager.has_identical("D.zip", "abc123")
+    assert not manager.has_identical("D.zip", "other")
+    assert not manager.has_identical("D.zip", None)
+
+def test_upload_stage_skips_identical_archive(s3, tmp_path, monkeypatch):
+    aws = {"access_key": "testing", "secret_key": "testing", "bucket_name": BUCKET, "region": REGION}
+    dirs = {name: str(tmp_path / name) for name in ("temp_download", "temp_sorted", "trash_root", "zip_dest")}
+    pipeline = FolderPipeline({"name": "Raport"}, None, "", aws, dirs, "2025-01-01", "2025-01-31")
+    zip_path = tmp_path / "Raport.zip"
+    zip_path.write_bytes(os.urandom(1024))
+
+    uploads = []
+    upload = S3Manager.upload_and_generate_link
+    monkeypatch.setattr(S3Manager, "upload_and_generate_link", lambda self, *a, **kw: uploads.append(a) or upload(self, *a, **kw))
+
+    for _ in range(2):
+        item = pipeline._make_item(0, {"id": "a1b2c3", "name": "A", "paths": []}, True)
+        item.update(zip_path=str(zip_path), content_digest="same-photos")
+        pipeline._upload_stage(item)
+
+    events = []
+    while not pipeline.events.empty():
+        events.append(pipeline.events.get())
+    assert len(uploads) == 1
+    assert any(e.get("log") == "S3: identyczny ZIP już wysłany, nowy link bez uploadu." for e in events)
+    assert len(pipeline.s3_links) == 2
+
+def test_connection_pool_follows_configured_concurrency(s3):
+    small = S3Manager("testing", "testing", REGION, BUCKET, max_concurrency=4)
+    large = S3Manager("testing", "testing", REGION, BUCKET, max_concurrency=32)
+
+    assert small.client.meta.config.max_pool_connections == 8
+    assert large.client.meta.config.max_pool_connections == 64
+    # Same settings share the client
+    assert S3Manager("testing", "testing", REGION, BUCKET, max_concurrency=32).client is large.client
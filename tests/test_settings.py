@@ -0,0 +1,25 @@
+import sys
+import subprocess
+
+from fastapi.testclient import TestClient
+
+from conftest import BACKEND_DIR
+
+def test_partial_post_keeps_stored_fields(app_main):
+    with TestClient(app_main.app) as client:
+        full = client.get("/settings").json()
+        full.update(ftp_pass="tajne", gemini_key="klucz", aws_bucket_name="raporty", ai_rpm=60)
+        assert client.post("/settings", json=full).status_code == 200
+
+        assert client.post("/settings", json={"ai_max_in_flight": 4}).status_code == 200
+        stored = client.get("/settings").json()
+        assert stored == {**full, "ai_max_in_flight": 4}
+
+        # Values are still validated and clamped
+        assert client.post("/settings", json={"ai_rpm": "dużo"}).status_code == 422
+        assert client.post("/settings", json={"ai_rpm": 0}).status_code == 200
+        assert client.get("/settings").json() == {**full, "ai_max_in_flight": 4, "ai_rpm": 1}
+
+def test_settings_store_does_not_load_ai_modules():
+    code = "import sys; import modules.settings_store; print(any(m in sys.modules for m in ('modules.image_analyzer', 'modules.classifiers', 'modules.s3_manager')))"
+    assert subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip() == "False"